@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Load the road graph before serving, so the first request that routes does not pay for it.
+# Management commands load it on first use instead.
+from trip_planner.routing import get_road_graph  # noqa: E402
+get_road_graph()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -134,5 +135,95 @@ CORS_ORIGIN_ALLOW_ALL = True  # Change for production
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
-}
\ No newline at end of file
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'trip_planner.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+# Geocoding cache settings (see trip_planner/geocoding.py)
+GEOCODE_CACHE = {
+    'MAX_ENTRIES': 4096,
+    'FORWARD_TTL': 60 * 60 * 24 * 30,  # 30 days
+    'REVERSE_TTL': 60 * 60 * 24 * 30,  # 30 days
+    'REVERSE_PRECISION': 2,            # round lat/lng to ~1 km cells
+}
+
+# Shared geocoding client (see trip_planner/geoclient.py). DOMAIN and SCHEME can point at a
+# self-hosted or local Nominatim-compatible server; raise RATE only for servers that allow it.
+GEOCODER = {
+    'PROVIDER': 'trip_planner.geoclient.NominatimProvider',
+    'DOMAIN': 'nominatim.openstreetmap.org',
+    'SCHEME': 'https',
+    'RATE': 1.0,     # requests per second, the public Nominatim usage policy limit
+    'BURST': 1,
+    'WORKERS': 4,
+}
+
+# Offline reverse geocoding for stop names (see trip_planner/gazetteer.py)
+GAZETTEER = {
+    'PATH': BASE_DIR / 'trip_planner' / 'data' / 'us_places.csv',
+    'MIN_POPULATION': 0,
+    'MAX_DISTANCE_MILES': 150,
+    'REMOTE_FALLBACK': False,  # only call Nominatim.reverse when nothing local is in range
+}
+
+# Background trip planning (see trip_planner/jobs.py)
+TRIP_PLANNING = {
+    'ASYNC': False,        # POST /trips/?async=true opts in per request
+    'EXECUTOR': 'thread',  # or 'process'
+    'WORKERS': 4,
+    'BULK_WORKERS': 1,     # processes for POST /trips/bulk/
+}
+
+# Local road routing (see trip_planner/routing.py); None uses straight-line legs
+ROUTING = {
+    'GRAPH_PATH': None,  # JSON or .npz extract, ideally contracted offline with manage.py prepare_road_graph
+}
+
+# Truck stops and rest areas that fuel and rest stops snap to (see trip_planner/facilities.py)
+FACILITIES = {
+    'PATH': None,              # name,kind,state,latitude,longitude CSV; None places stops where limits fall
+    'MAX_DETOUR_MILES': 3,
+    'SEARCH_MILES': 60,
+}
+
+# Memoized plans for repeated lanes (see trip_planner/plancache.py)
+PLAN_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 1024,
+}
+
+# Per-phase timings in Server-Timing headers and at /api/metrics/ (see trip_planner/metrics.py)
+METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+}
+
+# Caches; 'trip_responses' holds rendered trip, route and log responses (see trip_planner/caching.py).
+# Entries are keyed by Trip.revision, so a per-process cache never serves stale responses; set
+# TRIP_CACHE_REDIS_URL (or TRIP_CACHE_DIR for a file-based cache) to share hits across processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'trip_responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'trip-responses',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if os.environ.get('TRIP_CACHE_REDIS_URL'):
+    CACHES['trip_responses'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['TRIP_CACHE_REDIS_URL'],
+        'TIMEOUT': 60 * 60 * 24,
+    }
+elif os.environ.get('TRIP_CACHE_DIR'):
+    CACHES['trip_responses'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['TRIP_CACHE_DIR'],
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
@@ -1,12 +1,20 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from trip_planner.views import TripViewSet
+from trip_planner.views import TripViewSet, DriverViewSet
+from trip_planner.metrics import metrics_view
+from trip_planner import async_views
 
 router = DefaultRouter()
 router.register(r'trips', TripViewSet)
+router.register(r'drivers', DriverViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/metrics/', metrics_view, name='metrics'),
+    path('api/async/trips/', async_views.trip_list, name='async-trip-list'),
+    path('api/async/trips/<uuid:pk>/', async_views.trip_detail, name='async-trip-detail'),
+    path('api/async/trips/<uuid:pk>/route/', async_views.trip_route, name='async-trip-route'),
+    path('api/async/trips/<uuid:pk>/logs/', async_views.trip_logs, name='async-trip-logs'),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
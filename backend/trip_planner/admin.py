@@ -1,9 +1,20 @@
 from django.contrib import admin
-from .models import Trip, RoutePoint, ELDLog
+from .models import Driver, DriverDay, Trip, RoutePoint, ELDLog, GeocodeCacheEntry
+
+@admin.register(Driver)
+class DriverAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'created_at')
+    search_fields = ('name',)
+
+@admin.register(DriverDay)
+class DriverDayAdmin(admin.ModelAdmin):
+    list_display = ('driver', 'log_date', 'on_duty_minutes', 'driving_minutes')
+    list_filter = ('log_date',)
 
 @admin.register(Trip)
 class TripAdmin(admin.ModelAdmin):
-    list_display = ('id', 'current_location', 'pickup_location', 'dropoff_location', 'created_at')
+    list_display = ('id', 'current_location', 'pickup_location', 'dropoff_location', 'status', 'created_at')
+    list_filter = ('status',)
     search_fields = ('current_location', 'pickup_location', 'dropoff_location')
 
 @admin.register(RoutePoint)
@@ -16,4 +27,10 @@ class RoutePointAdmin(admin.ModelAdmin):
 class ELDLogAdmin(admin.ModelAdmin):
     list_display = ('id', 'trip', 'log_date', 'starting_location', 'ending_location')
     list_filter = ('log_date',)
-    search_fields = ('starting_location', 'ending_location')
\ No newline at end of file
+    search_fields = ('starting_location', 'ending_location')
+
+@admin.register(GeocodeCacheEntry)
+class GeocodeCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'latitude', 'longitude', 'label', 'expires_at')
+    list_filter = ('kind',)
+    search_fields = ('key', 'label')
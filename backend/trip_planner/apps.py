@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class TripPlannerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trip_planner'
+
+    def ready(self):
+        from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+        from .ledger import remember_trip_days, update_after_delete, remember_driver_change, update_after_driver_change
+        from .models import Trip
+        pre_delete.connect(remember_trip_days, sender=Trip, dispatch_uid='trip_ledger_remember')
+        post_delete.connect(update_after_delete, sender=Trip, dispatch_uid='trip_ledger_delete')
+        pre_save.connect(remember_driver_change, sender=Trip, dispatch_uid='trip_ledger_remember_driver')
+        post_save.connect(update_after_driver_change, sender=Trip, dispatch_uid='trip_ledger_driver')
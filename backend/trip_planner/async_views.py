@@ -0,0 +1,139 @@
+"""Async versions of the trip create, retrieve, route and logs endpoints.
+
+Served under /api/async/trips/ for ASGI deployments (core.asgi). Planning
+awaits geocoding on the event loop, so one worker can keep many plans in
+flight while they wait on the geocoder, and reads use the async ORM.
+Responses match TripViewSet's, including ?format=columnar, and share its
+response cache and ETags. Writes go through save_plan in a thread, as
+Django has no async transactions.
+"""
+import functools
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from . import metrics
+from .caching import atrip_revision, response_key, aget_cached_response, astore_response
+from .models import Trip, RoutePoint, ELDLog, PlanStatus
+from .renderers import ORJSONRenderer, ColumnarRenderer
+from .serializers import TripSerializer, RoutePointSerializer, ELDLogSerializer, route_columns, log_columns
+from .services import acreate_trip
+from .views import with_details
+
+
+def render(data, status=200):
+    return HttpResponse(ORJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def timed(action):
+    """Record the request in the phase histograms and add a Server-Timing header, like TripViewSet"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            started = time.perf_counter()
+            token = metrics.start_request()
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                timings = metrics.finish_request(token)
+            if timings is not None:
+                total = time.perf_counter() - started
+                metrics.registry.observe(f'request.async_{action}', total)
+                if metrics.get_options()['SERVER_TIMING']:
+                    response['Server-Timing'] = ', '.join(filter(None, [
+                        timings.server_timing(), f'total;dur={total * 1000:.1f}'
+                    ]))
+            return response
+        return wrapper
+    return decorator
+
+
+@csrf_exempt
+@require_POST
+@timed('create')
+async def trip_list(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as e:
+        return render({'detail': f"JSON parse error - {e}"}, status=400)
+    serializer = TripSerializer(data=data)
+    # Validation can look up the driver and their ledger
+    if not await sync_to_async(serializer.is_valid)():
+        return render(serializer.errors, status=400)
+
+    trip = await acreate_trip(serializer.validated_data)
+    trip = await with_details(Trip.objects.filter(pk=trip.pk)).aget()
+    with metrics.phase('serialize'):
+        data = TripSerializer(trip).data
+    return render(data, status=201)
+
+
+def columnar(request):
+    return request.GET.get('format') == ColumnarRenderer.format
+
+
+async def cached_view(request, pk, view_name, load):
+    """Serve from the response cache, or load (status, data) for the trip and cache it once planned"""
+    revision = await atrip_revision(pk)
+    if revision is None:
+        return render({'detail': "No Trip matches the given query."}, status=404)
+    key = response_key(pk, revision, view_name, request, format=ColumnarRenderer.format if columnar(request) else 'json')
+    cached = await aget_cached_response(request, key)
+    if cached:
+        return cached
+    loaded = await load(pk)
+    if loaded is None:
+        return render({'detail': "No Trip matches the given query."}, status=404)
+    trip_status, data = loaded
+    response = render(data)
+    if trip_status == PlanStatus.DONE:
+        response = await astore_response(request, key, response)
+    return response
+
+
+@require_GET
+@timed('retrieve')
+async def trip_detail(request, pk):
+    async def load(pk):
+        trip = await with_details(Trip.objects.filter(pk=pk)).afirst()
+        if trip is None:
+            return None
+        with metrics.phase('serialize'):
+            return trip.status, TripSerializer(trip).data
+    return await cached_view(request, pk, 'retrieve', load)
+
+
+@require_GET
+@timed('route')
+async def trip_route(request, pk):
+    async def load(pk):
+        trip = await Trip.objects.only('id', 'status').filter(pk=pk).afirst()
+        if trip is None:
+            return None
+        points = RoutePoint.objects.filter(trip_id=pk).order_by('arrival_time')
+        if columnar(request):
+            with metrics.phase('serialize'):
+                return trip.status, await sync_to_async(route_columns)(points)
+        points = [point async for point in points]
+        with metrics.phase('serialize'):
+            return trip.status, RoutePointSerializer(points, many=True).data
+    return await cached_view(request, pk, 'route', load)
+
+
+@require_GET
+@timed('logs')
+async def trip_logs(request, pk):
+    async def load(pk):
+        trip = await Trip.objects.only('id', 'status').filter(pk=pk).afirst()
+        if trip is None:
+            return None
+        logs = ELDLog.objects.filter(trip_id=pk).defer('duty_timeline').order_by('log_date')
+        if columnar(request):
+            with metrics.phase('serialize'):
+                return trip.status, await sync_to_async(log_columns)(logs)
+        logs = [log async for log in logs]
+        with metrics.phase('serialize'):
+            return trip.status, ELDLogSerializer(logs, many=True).data
+    return await cached_view(request, pk, 'logs', load)
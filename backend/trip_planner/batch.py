@@ -0,0 +1,152 @@
+"""Vectorized batch version of planner.plan_trip for lane matrices.
+
+Every lane is simulated in lockstep with NumPy: each iteration advances
+all unfinished lanes to their next HOS, fuel or waypoint event, so the
+Python-level loop runs once per event rather than once per event per
+lane. Distances are haversine, and the results match plan_trip() called
+with the default distance function on the same inputs.
+"""
+from dataclasses import dataclass
+import numpy as np
+from .planner import DEFAULT_RULES, EARTH_RADIUS_MILES, EPSILON
+
+
+@dataclass(slots=True)
+class BatchResult:
+    total_miles: np.ndarray
+    driving_hours: np.ndarray
+    on_duty_hours: np.ndarray
+    transit_hours: np.ndarray          # start to dropoff departure
+    breaks: np.ndarray                 # 30 minute breaks
+    rests: np.ndarray                  # 10 hour rests
+    restarts: np.ndarray               # 34 hour restarts
+    fuel_stops: np.ndarray
+    eta: np.ndarray = None             # datetime64, when start times are given
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+
+def haversine_miles(a, b):
+    """Great-circle distance in miles between (n, 2) arrays of lat/lng"""
+    a = np.radians(np.asarray(a, dtype=float))
+    b = np.radians(np.asarray(b, dtype=float))
+    h = (np.sin((b[:, 0] - a[:, 0]) / 2) ** 2
+         + np.cos(a[:, 0]) * np.cos(b[:, 0]) * np.sin((b[:, 1] - a[:, 1]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(h))
+
+
+def plan_lanes(origins, pickups, dropoffs, cycle_hours=0.0, rules=DEFAULT_RULES, start_times=None):
+    """Plan many origin -> pickup -> dropoff lanes at once.
+
+    origins, pickups and dropoffs are (n, 2) lat/lng arrays; cycle_hours is
+    a scalar or an (n,) array; start_times, if given, is an (n,) datetime64
+    array used to fill in eta.
+    """
+    leg_miles = np.stack([haversine_miles(origins, pickups), haversine_miles(pickups, dropoffs)], axis=1)
+    return plan_legs(leg_miles, cycle_hours, rules, start_times)
+
+
+def plan_legs(leg_miles, cycle_hours=0.0, rules=DEFAULT_RULES, start_times=None):
+    """Plan lanes given an (n, legs) array of leg distances in miles"""
+    leg_miles = np.asarray(leg_miles, dtype=float)
+    n, leg_count = leg_miles.shape
+    rows = np.arange(n)
+    leg_hours = leg_miles / rules.average_speed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        leg_speed = np.where(leg_hours > 0, leg_miles / leg_hours, rules.average_speed)
+
+    t = np.zeros(n)
+    since_break = np.zeros(n)
+    shift_drive = np.zeros(n)
+    shift_start = np.zeros(n)
+    cycle = np.broadcast_to(np.asarray(cycle_hours, dtype=float), (n,)).copy()
+    since_fuel = np.zeros(n)
+    driving = np.zeros(n)
+    on_duty = np.zeros(n)
+    odometer = np.zeros(n)
+    covered = np.zeros(n)
+    leg = np.zeros(n, dtype=int)
+    active = np.ones(n, dtype=bool)
+    counts = {name: np.zeros(n, dtype=int) for name in ('breaks', 'rests', 'restarts', 'fuel_stops')}
+
+    service_hours = rules.pickup_dropoff_time / 60
+    fuel_hours = rules.fuel_duration / 60
+
+    while active.any():
+        current = np.minimum(leg, leg_count - 1)
+        miles = leg_miles[rows, current]
+        speed = leg_speed[rows, current]
+        remaining = miles - covered
+
+        # Drive to the next limit or the end of the leg
+        moving = active & (remaining > EPSILON)
+        hours_left = np.maximum(0.0, np.minimum.reduce([
+            rules.break_after - since_break,
+            rules.driving_limit - shift_drive,
+            rules.duty_limit - (t - shift_start),
+            rules.cycle_limit - cycle,
+        ]))
+        step = np.minimum(remaining, hours_left * speed)
+        to_fuel = np.maximum(0.0, rules.fuel_distance - since_fuel)
+        step = np.where(to_fuel < remaining - rules.fuel_tolerance, np.minimum(step, to_fuel), step)
+        step = np.where(moving, step, 0.0)
+        hours = step / speed
+        t += hours
+        since_break += hours
+        shift_drive += hours
+        cycle += hours
+        driving += hours
+        since_fuel += step
+        covered += step
+        odometer += step
+
+        # Pickup or dropoff at the end of the leg
+        arrived = active & (miles - covered <= EPSILON)
+        t[arrived] += service_hours
+        cycle[arrived] += service_hours
+        on_duty[arrived] += service_hours
+        covered[arrived] = 0.0
+        leg[arrived] += 1
+        active &= leg < leg_count
+
+        # Stops on the way
+        stopped = moving & ~arrived
+        fuel = stopped & (since_fuel >= rules.fuel_distance - EPSILON)
+        t[fuel] += fuel_hours
+        cycle[fuel] += fuel_hours
+        on_duty[fuel] += fuel_hours
+        since_fuel[fuel] = 0.0
+        if rules.fuel_duration >= rules.break_duration:
+            since_break[fuel] = 0.0
+        counts['fuel_stops'] += fuel
+
+        restart = stopped & (cycle >= rules.cycle_limit - EPSILON)
+        rest = stopped & ~restart & (
+            (shift_drive >= rules.driving_limit - EPSILON)
+            | (t - shift_start >= rules.duty_limit - EPSILON)
+        )
+        brk = stopped & ~restart & ~rest & (since_break >= rules.break_after - EPSILON)
+        t[restart] += int(rules.restart_period * 60) / 60
+        t[rest] += int(rules.rest_period * 60) / 60
+        t[brk] += rules.break_duration / 60
+        new_shift = restart | rest
+        shift_start[new_shift] = t[new_shift]
+        shift_drive[new_shift] = 0.0
+        since_break[new_shift | brk] = 0.0
+        cycle[restart] = 0.0
+        counts['restarts'] += restart
+        counts['rests'] += rest
+        counts['breaks'] += brk
+
+    result = BatchResult(
+        total_miles=odometer,
+        driving_hours=driving,
+        on_duty_hours=driving + on_duty,
+        transit_hours=t,
+        **counts,
+    )
+    if start_times is not None:
+        seconds = np.rint(t * 3600).astype('timedelta64[s]')
+        result.eta = np.asarray(start_times, dtype='datetime64[s]') + seconds
+    return result
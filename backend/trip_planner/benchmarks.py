@@ -0,0 +1,281 @@
+"""Benchmarks for the trip planning and ELD logging hot paths.
+
+Trips come from seeded synthetic corpora of gazetteer places, geocoded by
+a local stand-in so runs are repeatable and never touch the network.
+Each benchmark times one operation per trip, reports trips per second and
+the peak memory allocated per operation, and can be compared against a
+stored baseline. Run them with ``manage.py benchmark``.
+
+measure_concurrency() compares planning throughput on one process between
+a pool of request threads, as under WSGI, and async tasks on one event
+loop, as under ASGI. It gives the stand-in geocoder a fixed latency.
+measure_sequencing() times ordering and planning trips with many stops.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from .gazetteer import get_gazetteer
+from .models import Trip
+from .plancache import get_plan_cache
+from .planner import haversine_miles, plan_trip
+from .sequencing import sequence_stops
+from .services import RouteCalculator, ELDGenerator, save_plan
+
+START_TIME = datetime.datetime(2026, 1, 5, 6, 0, tzinfo=datetime.timezone.utc)
+SEED = 14
+
+# Corpus name -> (miles per leg, total miles) bounds for sampled trips
+CORPORA = {
+    'local': ((5, 60), (10, 120)),
+    'regional': ((40, 400), (150, 500)),
+    'cross-country': ((200, 2500), (1500, 3000)),
+}
+BENCHMARKS = ['plan', 'plan-hit', 'eld', 'persist', 'api']
+TOLERANCE = 0.25
+LATENCY = 0.05           # seconds per geocoding call in measure_concurrency
+THREADS = 4              # request threads per process for the WSGI side
+STOPS = 40               # intermediate stops per trip in measure_sequencing
+
+
+class LocalGeocoder:
+    """Resolves "City, ST" from the gazetteer and anything else to a fixed point derived from its hash"""
+
+    def __init__(self, places=None, latency=0.0):
+        places = places if places is not None else get_gazetteer().places
+        self.coords = {address(place): (place.latitude, place.longitude) for place in places}
+        self.latency = latency
+
+    def __call__(self, location):
+        if location in self.coords:
+            return self.coords[location]
+        digest = hashlib.sha256(location.encode()).digest()
+        # A point inside the contiguous United States
+        return (25 + digest[0] / 255 * 24, -124 + digest[1] / 255 * 57)
+
+    def many(self, locations):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self(location) for location in locations]
+
+    async def amany(self, locations):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self(location) for location in locations]
+
+
+def address(place):
+    return f"{place.name}, {place.state}"
+
+
+@contextmanager
+def local_geocoding(geocoder=None):
+    geocoder = geocoder or LocalGeocoder()
+    with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=geocoder.many), \
+            mock.patch.object(RouteCalculator, 'ageocode_many', side_effect=geocoder.amany):
+        yield
+
+
+def make_corpus(name, size, places=None, seed=SEED):
+    """Sample size (current, pickup, dropoff) address triples matching a corpus' distance bounds"""
+    places = places if places is not None else get_gazetteer().places
+    (leg_min, leg_max), (total_min, total_max) = CORPORA[name]
+    rng = random.Random(f"{seed}:{name}")
+
+    def neighbors(place):
+        return [
+            other for other in places
+            if other is not place
+            and leg_min <= haversine_miles((place.latitude, place.longitude), (other.latitude, other.longitude)) <= leg_max
+        ]
+
+    trips = []
+    for _ in range(size * 1000):
+        if len(trips) == size:
+            break
+        current = rng.choice(places)
+        pickups = neighbors(current)
+        if not pickups:
+            continue
+        pickup = rng.choice(pickups)
+        dropoffs = [place for place in neighbors(pickup) if place is not current]
+        if not dropoffs:
+            continue
+        dropoff = rng.choice(dropoffs)
+        total = sum(haversine_miles((a.latitude, a.longitude), (b.latitude, b.longitude))
+                    for a, b in [(current, pickup), (pickup, dropoff)])
+        if total_min <= total <= total_max:
+            trips.append({
+                'current_location': address(current),
+                'pickup_location': address(pickup),
+                'dropoff_location': address(dropoff),
+                'current_cycle_hours': round(rng.uniform(0, 60), 1),
+            })
+    if len(trips) < size:
+        raise ValueError(f"Could not sample {size} trips for the {name} corpus")
+    return trips
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def _plan(data):
+    trip = Trip(**data)
+    return trip, RouteCalculator(trip).plan_route(START_TIME)
+
+
+def _post(client, url, data):
+    response = client.post(url, data, content_type='application/json')
+    if response.status_code != 201:
+        raise RuntimeError(f"POST {url} returned {response.status_code}")
+
+
+def operations(name):
+    """Return (setup, operation) for a benchmark; setup(data) runs untimed and feeds operation"""
+    if name == 'plan':
+        return (lambda data: data), _plan
+    if name == 'plan-hit':
+        def warm(data):
+            _plan(data)
+            return data
+        return warm, _plan
+    if name == 'eld':
+        def setup(data):
+            trip, points = _plan(data)
+            return ELDGenerator(trip), points
+        return setup, lambda args: args[0].build_logs(args[1])
+    if name == 'persist':
+        def persist(args):
+            with rolled_back():
+                save_plan(*args)
+        return _plan, persist
+    if name == 'api':
+        client = Client()
+        url = reverse('trip-list')
+        def post(data):
+            with rolled_back():
+                _post(client, url, json.dumps(data))
+        return (lambda data: data), post
+    raise ValueError(f"Unknown benchmark {name}")
+
+
+def measure(setup, operation, trips, rounds=5):
+    """Time operation over every trip for several rounds and trace allocations over one more"""
+    inputs = [setup(data) for data in trips]
+    for value in inputs[:3]:
+        operation(value)                                    # warm caches and lazy imports
+
+    round_times = []
+    for _ in range(rounds):
+        elapsed = 0.0
+        for value in inputs:
+            started = time.perf_counter()
+            operation(value)
+            elapsed += time.perf_counter() - started
+        round_times.append(elapsed)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for value in inputs:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            operation(value)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    seconds = statistics.median(round_times)
+    return {
+        'ops_per_sec': round(len(inputs) / seconds, 2),
+        'ms_per_op': round(seconds / len(inputs) * 1000, 3),
+        'peak_kib': round(statistics.mean(peaks) / 1024, 1),
+    }
+
+
+def run_benchmarks(names=BENCHMARKS, corpora=CORPORA, size=20, rounds=5, report=None):
+    """Run each benchmark on each corpus; returns {"benchmark/corpus": result}"""
+    results = {}
+    with local_geocoding():
+        corpus_trips = {corpus: make_corpus(corpus, size) for corpus in corpora}
+        for name in names:
+            # Only plan-hit measures memoized plans; everything else plans from scratch
+            with override_settings(PLAN_CACHE={'ENABLED': name == 'plan-hit'}):
+                setup, operation = operations(name)
+                for corpus, trips in corpus_trips.items():
+                    get_plan_cache().clear()
+                    key = f"{name}/{corpus}"
+                    results[key] = measure(setup, operation, trips, rounds)
+                    if report:
+                        report(key, results[key])
+    return results
+
+
+def measure_concurrency(trips, latency=LATENCY, threads=THREADS):
+    """Plans per second with geocoding latency, through request threads and through async tasks"""
+    calculators = lambda: [RouteCalculator(Trip(**data)) for data in trips]
+
+    async def plan_all(batch):
+        await asyncio.gather(*(calculator.aplan_stops(START_TIME) for calculator in batch))
+
+    results = {}
+    with local_geocoding(LocalGeocoder(latency=latency)), override_settings(PLAN_CACHE={'ENABLED': False}):
+        batch = calculators()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda calculator: calculator.plan_stops(START_TIME), batch))
+        results['threads'] = round(len(trips) / (time.perf_counter() - started), 2)
+
+        batch = calculators()
+        started = time.perf_counter()
+        asyncio.run(plan_all(batch))
+        results['async'] = round(len(trips) / (time.perf_counter() - started), 2)
+    return results
+
+
+def measure_sequencing(stops=STOPS, trips=5, seed=SEED):
+    """Milliseconds to order and plan a trip with this many intermediate stops, one with a time window"""
+    rng = random.Random(seed)
+    elapsed = []
+    for _ in range(trips):
+        waypoints = [(rng.uniform(30, 36), rng.uniform(-103, -95)) for _ in range(stops + 3)]
+        windows = [None] * len(waypoints)
+        windows[len(waypoints) // 2] = (None, START_TIME + datetime.timedelta(hours=8))
+        started = time.perf_counter()
+        order = sequence_stops(waypoints, windows, START_TIME)
+        plan_trip([waypoints[i] for i in order], START_TIME)
+        elapsed.append(time.perf_counter() - started)
+    return {
+        'ms_per_plan': round(statistics.median(elapsed) * 1000, 3),
+        'max_ms': round(max(elapsed) * 1000, 3),
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return {key: message} for results that are slower or allocate more than baseline allows"""
+    regressions = {}
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        if result['ops_per_sec'] < reference['ops_per_sec'] * (1 - tolerance):
+            change = result['ops_per_sec'] / reference['ops_per_sec'] - 1
+            regressions[key] = f"{result['ops_per_sec']} ops/s vs {reference['ops_per_sec']} ({change:+.0%})"
+        elif result['peak_kib'] > reference['peak_kib'] * (1 + tolerance):
+            change = result['peak_kib'] / reference['peak_kib'] - 1
+            regressions[key] = f"{result['peak_kib']} KiB peak vs {reference['peak_kib']} ({change:+.0%})"
+    return regressions
@@ -0,0 +1,206 @@
+import csv
+import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import django
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+from .models import Trip, TripStop, RoutePoint, ELDLog
+from .serializers import TripSerializer
+from .services import RouteCalculator, ELDGenerator, new_trip
+from .planner import plan_trip, geodesic_miles
+from .facilities import get_facility_index
+from .ledger import update_days
+
+CHUNK_SIZE = 500
+
+
+def read_rows(lines, format='jsonl'):
+    """Yield one dict per input row from an iterable of text lines"""
+    if format == 'csv':
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield line
+
+
+def detect_format(name_or_content_type):
+    return 'csv' if 'csv' in (name_or_content_type or '') else 'jsonl'
+
+
+def plan_rows(rows, chunk_size=CHUNK_SIZE, workers=1):
+    """Validate, plan and save trips from an iterable of row dicts.
+
+    Rows are read and written one chunk at a time, so memory stays bounded
+    by the chunk size. Yields one result dict per row, in input order:
+    {'row': n, 'id': ..., 'status': 'DONE'} or {'row': n, 'errors': {...}}.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        numbered = enumerate(rows, start=1)
+        while True:
+            chunk = list(itertools.islice(numbered, chunk_size))
+            if not chunk:
+                break
+            yield from _plan_chunk(chunk, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+@dataclass
+class _Row:
+    """A valid input row on its way through a chunk"""
+    number: int
+    trip: object
+    calculator: object
+    locations: list
+    key: str = None
+    stops: list = None                 # planned stops
+    route_points: list = None
+    eld_logs: list = None
+
+
+def _failed(row_number, error):
+    return {'row': row_number, 'errors': {'non_field_errors': [str(error) or type(error).__name__]}}
+
+
+def _init_worker():
+    """Load the facility index once per worker process, rather than pickling it with every row"""
+    if not apps.ready:
+        django.setup()
+    get_facility_index()
+
+
+def _plan_lane(waypoints, start_time, cycle_hours, rules, legs):
+    """plan_trip for one row; returns (plan, None) or (None, error) so one bad row cannot stop the chunk"""
+    try:
+        facilities = get_facility_index()
+        return plan_trip(waypoints, start_time, cycle_hours, rules, geodesic_miles, legs, facilities=facilities), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def _plan_chunk(chunk, executor):
+    results = {}
+    rows = []
+    for row_number, data in chunk:
+        if not isinstance(data, dict):
+            results[row_number] = {'row': row_number, 'errors': {'non_field_errors': ['Expected a JSON object.']}}
+            continue
+        serializer = TripSerializer(data=data)
+        if serializer.is_valid():
+            trip, stops = new_trip(serializer.validated_data)
+            locations = [trip.current_location, trip.pickup_location, trip.dropoff_location]
+            rows.append(_Row(row_number, trip, RouteCalculator(trip, stops=stops), locations))
+        else:
+            results[row_number] = {'row': row_number, 'errors': serializer.errors}
+
+    # Trips with stops or a driver are planned on their own; the rest reuse
+    # memoized plans where the same lane was planned before
+    start_time = timezone.now()
+    for row in rows:
+        if row.calculator.trip_stops() or row.trip.driver_id:
+            try:
+                row.stops = row.calculator.plan_stops(start_time)
+            except Exception as e:
+                results[row.number] = _failed(row.number, e)
+                continue
+            if row.trip.driver_id:
+                # Saved in input order, so the driver's later rows plan from a ledger that includes this trip
+                _finish([row], results)
+            continue
+        row.key = row.calculator.plan_key(row.locations)
+        row.stops = row.calculator.plan_cache.get(row.key, start_time) if row.key else None
+        if row.stops is not None:
+            row.calculator.name_waypoints(row.stops)
+    misses = [row for row in rows if row.stops is None and row.number not in results]
+
+    # Geocode each distinct address once per chunk
+    geocoder = RouteCalculator(None)
+    addresses = list({address for row in misses for address in row.locations})
+    coords = dict(zip(addresses, geocoder.geocode_many(addresses))) if addresses else {}
+
+    lanes = []
+    for row in misses:
+        waypoints = [coords[address] for address in row.locations]
+        try:
+            lanes.append((row, waypoints, geocoder.build_legs(waypoints)))
+        except Exception as e:
+            results[row.number] = _failed(row.number, e)
+    mapper = executor.map if executor is not None else map
+    plans = mapper(
+        _plan_lane, [waypoints for _, waypoints, _ in lanes], itertools.repeat(start_time, len(lanes)),
+        [row.trip.current_cycle_hours for row, _, _ in lanes], itertools.repeat(geocoder.rules, len(lanes)),
+        [legs for _, _, legs in lanes],
+    )
+    for (row, waypoints, _), (plan, error) in zip(lanes, plans):
+        if error is not None:
+            results[row.number] = {'row': row.number, 'errors': {'non_field_errors': [error]}}
+            continue
+        try:
+            row.calculator.label_stops(plan.stops)
+        except Exception as e:
+            results[row.number] = _failed(row.number, e)
+            continue
+        row.stops = plan.stops
+        if row.key and (0, 0) not in waypoints:
+            row.calculator.plan_cache.set(row.key, plan.stops, start_time)
+
+    _finish([row for row in rows if row.number not in results], results)
+
+    for row_number, _ in chunk:
+        yield results[row_number]
+
+
+def _finish(rows, results):
+    """Build route points and ELD logs for planned rows and save them, recording each row's result"""
+    planned = []
+    for row in rows:
+        try:
+            row.route_points = [row.calculator.to_route_point(stop) for stop in row.stops]
+            row.eld_logs = ELDGenerator(row.trip).build_logs(row.route_points)
+        except Exception as e:
+            results[row.number] = _failed(row.number, e)
+            continue
+        planned.append(row)
+    _save(planned, results)
+
+
+def _save(rows, results):
+    """Write rows in one transaction, or one at a time if that fails so only the bad rows are reported"""
+    try:
+        _write(rows)
+    except Exception:
+        for row in rows:
+            try:
+                _write([row])
+            except Exception as e:
+                results[row.number] = _failed(row.number, e)
+            else:
+                results[row.number] = {'row': row.number, 'id': str(row.trip.id), 'status': 'DONE'}
+    else:
+        for row in rows:
+            results[row.number] = {'row': row.number, 'id': str(row.trip.id), 'status': 'DONE'}
+
+
+def _write(rows):
+    with transaction.atomic():
+        Trip.objects.bulk_create([row.trip for row in rows])
+        TripStop.objects.bulk_create([stop for row in rows for stop in row.calculator.trip_stops()])
+        RoutePoint.objects.bulk_create([point for row in rows for point in row.route_points])
+        ELDLog.objects.bulk_create([log for row in rows for log in row.eld_logs])
+        driver_dates = {}
+        for row in rows:
+            if row.trip.driver_id:
+                driver_dates.setdefault(row.trip.driver_id, set()).update(log.log_date for log in row.eld_logs)
+        for driver_id, dates in driver_dates.items():
+            update_days(driver_id, dates)
@@ -0,0 +1,100 @@
+"""Cached trip, route and log responses with strong ETags.
+
+Cache keys include the trip's revision, a counter on the Trip row that
+Trip.save and invalidate_trip bump in the same transaction as any change
+to the trip or its plan.
+Every worker reads it from the database, so an invalidation in one process
+is seen by all of them whether or not the cache itself is shared, and
+stale entries are simply never looked up again.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from .models import Trip
+
+CACHE_ALIAS = 'trip_responses'
+
+
+def get_response_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def make_etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def trip_revision(trip_id):
+    """The trip's current revision, or None if there is no such trip"""
+    return Trip.objects.filter(pk=trip_id).values_list('revision', flat=True).first()
+
+
+async def atrip_revision(trip_id):
+    return await Trip.objects.filter(pk=trip_id).values_list('revision', flat=True).afirst()
+
+
+def response_key(trip_id, revision, view_name, request, format=None):
+    """Cache key for one rendering of one trip view at one revision of the trip"""
+    format = format or request.accepted_renderer.format
+    variant = hashlib.sha256(
+        f"{format}?{request.META.get('QUERY_STRING', '')}".encode()
+    ).hexdigest()[:16]
+    return f"trip:{trip_id}:{revision}:{view_name}:{variant}"
+
+
+def if_none_match(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+def get_cached_response(request, key):
+    """Return a cached response (or a 304) for key, or None on a miss"""
+    return cached_response(request, get_response_cache().get(key))
+
+
+async def aget_cached_response(request, key):
+    """get_cached_response for async views, off the event loop for network cache backends"""
+    return cached_response(request, await get_response_cache().aget(key))
+
+
+def cached_response(request, entry):
+    if entry is None:
+        return None
+    etag, body, content_type = entry
+    if if_none_match(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=content_type)
+    response['ETag'] = etag
+    return response
+
+
+def store_response(request, key, response):
+    """Render a 200 response, cache it under key and tag it; may return a 304 instead"""
+    entry, response = tag_response(request, response)
+    get_response_cache().set(key, entry)
+    return response
+
+
+async def astore_response(request, key, response):
+    entry, response = tag_response(request, response)
+    await get_response_cache().aset(key, entry)
+    return response
+
+
+def tag_response(request, response):
+    """Render a 200 response and return its cache entry and the response to send, tagged with its ETag"""
+    if hasattr(response, 'render'):
+        response.render()
+    etag = make_etag(response.content)
+    entry = (etag, response.content, response['Content-Type'])
+    if if_none_match(request, etag):
+        response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return entry, response
+
+
+def invalidate_trip(trip_id):
+    """Make every cached response for a trip stale by bumping its revision in the current transaction"""
+    Trip.objects.filter(pk=trip_id).update(revision=F('revision') + 1)
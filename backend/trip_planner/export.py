@@ -0,0 +1,117 @@
+"""Fleet-wide streaming export of ELD logs and route points.
+
+Rows are read with a server-side iterator in (trip, date, id) order and
+written out one at a time, so memory use does not grow with the size of
+the export. Every row carries an opaque cursor; passing the cursor of the
+last row received resumes the export just after it.
+"""
+import base64
+import csv
+import datetime
+import json
+import uuid
+from django.db.models import Q
+from django.utils import timezone
+from .models import ELDLog, RoutePoint
+
+CHUNK_SIZE = 2000
+
+EXPORTS = {
+    'logs': {
+        'model': ELDLog,
+        'order': 'log_date',
+        'columns': ['trip_id', 'log_date', 'starting_location', 'ending_location', 'off_duty_periods',
+                    'sleeper_berth_periods', 'driving_periods', 'on_duty_periods'],
+    },
+    'points': {
+        'model': RoutePoint,
+        'order': 'arrival_time',
+        'columns': ['trip_id', 'point_type', 'location', 'latitude', 'longitude', 'arrival_time',
+                    'departure_time', 'duration'],
+    },
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row, order):
+    position = [str(row['trip_id']), _to_text(row[order]), row['id']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, kind):
+    """Return (trip id, order key, row id) from a cursor of the given export kind, or raise InvalidCursor"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        trip_id, key, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if kind == 'logs':
+            key = datetime.date.fromisoformat(key)
+        else:
+            key = datetime.datetime.fromisoformat(key)
+            if timezone.is_naive(key):
+                key = timezone.make_aware(key)
+        return uuid.UUID(trip_id), key, int(row_id)
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor("Invalid cursor.")
+
+
+def _to_text(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(kind, start_date, end_date, cursor=None, chunk_size=CHUNK_SIZE):
+    """Yield one dict per log or route point dated start_date to end_date inclusive, with a 'cursor' key"""
+    export = EXPORTS[kind]
+    order = export['order']
+    queryset = export['model'].objects.all()
+    if kind == 'logs':
+        queryset = queryset.filter(log_date__gte=start_date, log_date__lte=end_date)
+    else:
+        start = timezone.make_aware(datetime.datetime.combine(start_date, datetime.time.min))
+        end = timezone.make_aware(datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+        queryset = queryset.filter(arrival_time__gte=start, arrival_time__lt=end)
+
+    if cursor:
+        trip_id, key, row_id = decode_cursor(cursor, kind)
+        queryset = queryset.filter(
+            Q(trip_id__gt=trip_id)
+            | Q(trip_id=trip_id, **{f'{order}__gt': key})
+            | Q(trip_id=trip_id, **{order: key}, id__gt=row_id)
+        )
+
+    rows = queryset.order_by('trip_id', order, 'id').values('id', *export['columns'])
+    for row in rows.iterator(chunk_size=chunk_size):
+        row['cursor'] = encode_cursor(row, order)
+        del row['id']
+        row['trip_id'] = str(row['trip_id'])
+        yield row
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def to_ndjson(rows):
+    for row in rows:
+        yield json.dumps({key: _to_text(value) for key, value in row.items()}) + '\n'
+
+
+def to_csv(rows, kind):
+    """CSV lines with a header; period lists are written as JSON"""
+    writer = csv.writer(_Echo())
+    columns = EXPORTS[kind]['columns'] + ['cursor']
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(row[column]) if isinstance(row[column], list) else _to_text(row[column])
+            for column in columns
+        ])
+
+
+def render_export(rows, kind, format):
+    return to_csv(rows, kind) if format == 'csv' else to_ndjson(rows)
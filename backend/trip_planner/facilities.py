@@ -0,0 +1,167 @@
+"""Local index of truck stops and rest areas for placing en-route stops.
+
+Facilities are loaded once from a CSV file with name, kind, state,
+latitude and longitude columns, where kind is truck_stop (has diesel) or
+rest_area. Such a file can be extracted offline from OpenStreetMap, e.g.
+amenity=fuel with hgv=yes and highway=rest_area. No file is bundled; with
+FACILITIES['PATH'] unset stops are placed exactly where limits fall due.
+
+Facilities are bucketed into a uniform latitude/longitude grid. A query
+walks a stretch of route backwards in short steps and checks only the
+cells each step's bounding box touches. Typically that is a few dict
+lookups per step, so snapping every fuel and rest stop costs little next
+to the rest of planning and never needs the network.
+"""
+import csv
+import math
+import threading
+from collections import namedtuple
+from django.conf import settings
+from .planner import EARTH_RADIUS_MILES
+
+DEFAULTS = {
+    'PATH': None,               # facilities CSV; None places stops where limits fall due
+    'CELL_DEGREES': 0.25,       # grid cell size
+    'MAX_DETOUR_MILES': 3,      # farthest a facility may lie from the route
+    'SEARCH_MILES': 60,         # how far back from where a stop falls due to look for one
+}
+
+TRUCK_STOP = 'truck_stop'
+REST_AREA = 'rest_area'
+KINDS = {TRUCK_STOP, REST_AREA}
+
+MILES_PER_DEGREE = EARTH_RADIUS_MILES * math.pi / 180
+STEP_MILES = 5                  # route stretch checked per step of a query
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'FACILITIES', {})}
+
+
+class Facility(namedtuple('Facility', ['name', 'kind', 'state', 'latitude', 'longitude'])):
+    __slots__ = ()
+
+    @property
+    def fuel(self):
+        return self.kind == TRUCK_STOP
+
+    @property
+    def label(self):
+        return f"{self.name}, {self.state}" if self.state else self.name
+
+
+def load_facilities(path):
+    """Read a name,kind,state,latitude,longitude CSV file, skipping unknown kinds"""
+    facilities = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            kind = (row.get('kind') or '').strip().lower()
+            if kind not in KINDS:
+                continue
+            facilities.append(Facility(
+                name=row['name'],
+                kind=kind,
+                state=row.get('state') or '',
+                latitude=float(row['latitude']),
+                longitude=float(row['longitude']),
+            ))
+    return facilities
+
+
+class FacilityIndex:
+    """Grid of facilities answering "the last suitable facility before this point on the route" """
+
+    def __init__(self, facilities, cell_degrees=DEFAULTS['CELL_DEGREES'],
+                 max_detour_miles=DEFAULTS['MAX_DETOUR_MILES'], search_miles=DEFAULTS['SEARCH_MILES']):
+        self.cell_degrees = cell_degrees
+        self.max_detour_miles = max_detour_miles
+        self.search_miles = search_miles
+        self.cells = {}
+        for facility in facilities:
+            self.cells.setdefault(self._cell(facility.latitude, facility.longitude), []).append(facility)
+        self.size = len(facilities)
+
+    @classmethod
+    def from_settings(cls):
+        options = get_options()
+        if not options['PATH']:
+            return None
+        return cls(
+            load_facilities(options['PATH']),
+            cell_degrees=options['CELL_DEGREES'],
+            max_detour_miles=options['MAX_DETOUR_MILES'],
+            search_miles=options['SEARCH_MILES'],
+        )
+
+    def __len__(self):
+        return self.size
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def best_before(self, leg, due_miles, earliest_miles=0.0, fuel=False):
+        """Return (facility, miles along leg) for the facility furthest along leg before due_miles.
+
+        Only facilities within max_detour_miles of the route and at most
+        search_miles before due_miles (and not before earliest_miles) count;
+        with fuel set, only truck stops do. Returns (None, None) if none do.
+        leg is anything with position_at(miles), a straight or routed leg.
+        """
+        earliest = max(earliest_miles, due_miles - self.search_miles)
+        end = due_miles
+        end_point = leg.position_at(end)
+        while end > earliest:
+            start = max(earliest, end - STEP_MILES)
+            start_point = leg.position_at(start)
+            best = None
+            for facility in self._near(start_point, end_point):
+                if fuel and not facility.fuel:
+                    continue
+                fraction, detour = _project(start_point, end_point, (facility.latitude, facility.longitude))
+                # Facilities abreast of a neighbouring stretch are found when that stretch is checked
+                if not 0.0 <= fraction <= 1.0 or detour > self.max_detour_miles:
+                    continue
+                if best is None or fraction > best[0]:
+                    best = (fraction, facility)
+            if best is not None:
+                return best[1], start + (end - start) * best[0]
+            end, end_point = start, start_point
+        return None, None
+
+    def _near(self, a, b):
+        """Facilities in the cells covering the a-b segment's bounding box, widened by the detour"""
+        pad_lat = self.max_detour_miles / MILES_PER_DEGREE
+        pad_lng = pad_lat / max(0.01, math.cos(math.radians((a[0] + b[0]) / 2)))
+        low = self._cell(min(a[0], b[0]) - pad_lat, min(a[1], b[1]) - pad_lng)
+        high = self._cell(max(a[0], b[0]) + pad_lat, max(a[1], b[1]) + pad_lng)
+        for i in range(low[0], high[0] + 1):
+            for j in range(low[1], high[1] + 1):
+                yield from self.cells.get((i, j), ())
+
+
+def _project(a, b, point):
+    """(fraction along line a-b of point's closest approach, its distance in miles) on a local flat projection"""
+    scale_lng = math.cos(math.radians((a[0] + b[0]) / 2)) * MILES_PER_DEGREE
+    bx = (b[1] - a[1]) * scale_lng
+    by = (b[0] - a[0]) * MILES_PER_DEGREE
+    px = (point[1] - a[1]) * scale_lng
+    py = (point[0] - a[0]) * MILES_PER_DEGREE
+    length = bx * bx + by * by
+    fraction = (px * bx + py * by) / length if length else 0.0
+    return fraction, math.hypot(px - fraction * bx, py - fraction * by)
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_facility_index():
+    """Return the process-wide facility index, or None if FACILITIES['PATH'] is not set"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                _index = FacilityIndex.from_settings()
+                _index_loaded = True
+    return _index
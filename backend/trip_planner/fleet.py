@@ -0,0 +1,52 @@
+"""Fleet-wide duty hour rollups over the ELD logs.
+
+Each ELDLog stores its minutes per duty status, so totals for any date
+range are summed in the database with one grouped query over the
+log_date index instead of reading and parsing every log's periods.
+"""
+from django.db.models import Count, Sum
+from .models import ELDLog
+
+# group_by name -> (queryset field, result key)
+GROUPS = {
+    'date': ('log_date', 'date'),
+    'driver': ('trip__driver', 'driver'),
+    'trip': ('trip', 'trip'),
+}
+TOTALS = {
+    'driving_hours': 'driving_minutes',
+    'on_duty_hours': 'on_duty_minutes',
+    'off_duty_hours': 'off_duty_minutes',
+    'sleeper_berth_hours': 'sleeper_berth_minutes',
+}
+
+
+def fleet_hours(start, end, group_by=(), driver_id=None):
+    """Duty hours logged from start to end inclusive, one row per group_by combination.
+
+    Rows carry the group_by keys, the number of logs and trips, and hours
+    in each duty status. With no group_by there is one row for the fleet.
+    """
+    queryset = ELDLog.objects.filter(log_date__gte=start, log_date__lte=end)
+    if driver_id:
+        queryset = queryset.filter(trip__driver_id=driver_id)
+    fields = [GROUPS[name][0] for name in group_by]
+    annotations = {
+        'logs': Count('id'),
+        'trips': Count('trip', distinct=True),
+        **{key: Sum(field) for key, field in TOTALS.items()},
+    }
+    if fields:
+        rows = list(queryset.values(*fields).annotate(**annotations).order_by(*fields))
+    else:
+        rows = [queryset.aggregate(**annotations)]
+
+    results = []
+    for row in rows:
+        result = {GROUPS[name][1]: row[GROUPS[name][0]] for name in group_by}
+        result['logs'] = row['logs']
+        result['trips'] = row['trips']
+        for key in TOTALS:
+            result[key] = round((row[key] or 0) / 60, 2)
+        results.append(result)
+    return results
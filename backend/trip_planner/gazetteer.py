@@ -0,0 +1,159 @@
+import csv
+import math
+import threading
+from collections import namedtuple
+from django.conf import settings
+
+EARTH_RADIUS_MILES = 3958.8
+
+DEFAULTS = {
+    'PATH': None,                 # defaults to the bundled data/us_places.csv
+    'MIN_POPULATION': 0,          # skip smaller places when loading
+    'MAX_DISTANCE_MILES': 150,    # beyond this a stop is not "near" anything we know
+    'REMOTE_FALLBACK': False,     # use the remote reverse geocoder when nothing is near
+}
+
+Place = namedtuple('Place', ['name', 'state', 'latitude', 'longitude', 'population'])
+
+
+def to_unit_vector(latitude, longitude):
+    """Project lat/lng onto the unit sphere; chord length is monotonic in great-circle distance"""
+    lat = math.radians(latitude)
+    lng = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+
+def chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, chord / 2))
+
+
+def load_places(path, min_population=0):
+    """Read a name,state,latitude,longitude,population CSV file"""
+    places = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            population = int(row.get('population') or 0)
+            if population < min_population:
+                continue
+            places.append(Place(
+                name=row['name'],
+                state=row.get('state') or '',
+                latitude=float(row['latitude']),
+                longitude=float(row['longitude']),
+                population=population,
+            ))
+    return places
+
+
+class KDTree:
+    """Static 3-d tree over unit vectors, stored in flat lists.
+
+    Node i covers points[i] and splits on axes[i]; left/right hold child
+    node indices or -1.
+    """
+
+    def __init__(self, points):
+        self.points = []
+        self.indices = []
+        self.axes = []
+        self.left = []
+        self.right = []
+        self.root = self._build(list(enumerate(points)), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return -1
+        axis = depth % 3
+        items.sort(key=lambda item: item[1][axis])
+        median = len(items) // 2
+        node = len(self.points)
+        index, point = items[median]
+        self.points.append(point)
+        self.indices.append(index)
+        self.axes.append(axis)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.left[node] = self._build(items[:median], depth + 1)
+        self.right[node] = self._build(items[median + 1:], depth + 1)
+        return node
+
+    def nearest(self, target):
+        """Return (index, squared chord distance) of the closest point, or (None, inf)"""
+        best_index = None
+        best_dist = math.inf
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            # Skip subtrees whose splitting plane is farther than the best match
+            if node < 0 or bound >= best_dist:
+                continue
+            point = self.points[node]
+            dx = point[0] - target[0]
+            dy = point[1] - target[1]
+            dz = point[2] - target[2]
+            dist = dx * dx + dy * dy + dz * dz
+            if dist < best_dist:
+                best_dist = dist
+                best_index = self.indices[node]
+
+            axis = self.axes[node]
+            delta = target[axis] - point[axis]
+            if delta < 0:
+                stack.append((self.right[node], delta * delta))
+                stack.append((self.left[node], 0.0))
+            else:
+                stack.append((self.left[node], delta * delta))
+                stack.append((self.right[node], 0.0))
+        return best_index, best_dist
+
+
+class Gazetteer:
+    """In-process nearest-place lookup over a local places file"""
+
+    def __init__(self, places, max_distance_miles=DEFAULTS['MAX_DISTANCE_MILES']):
+        self.places = places
+        self.max_distance_miles = max_distance_miles
+        self.tree = KDTree([to_unit_vector(p.latitude, p.longitude) for p in places])
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULTS, **getattr(settings, 'GAZETTEER', {})}
+        path = options['PATH'] or settings.BASE_DIR / 'trip_planner' / 'data' / 'us_places.csv'
+        places = load_places(path, options['MIN_POPULATION'])
+        return cls(places, max_distance_miles=options['MAX_DISTANCE_MILES'])
+
+    def nearest(self, coords):
+        """Return (place, distance in miles) for the closest place, or (None, None) if none is in range"""
+        index, dist = self.tree.nearest(to_unit_vector(coords[0], coords[1]))
+        if index is None:
+            return None, None
+        miles = chord_to_miles(math.sqrt(dist))
+        if miles > self.max_distance_miles:
+            return None, None
+        return self.places[index], miles
+
+    def nearest_city(self, coords):
+        """Return a "City, ST" label for the closest place, or None"""
+        place, _ = self.nearest(coords)
+        if place is None:
+            return None
+        return f"{place.name}, {place.state}" if place.state else place.name
+
+
+def remote_fallback_enabled():
+    return {**DEFAULTS, **getattr(settings, 'GAZETTEER', {})}['REMOTE_FALLBACK']
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Return the process-wide gazetteer, loaded from settings on first use"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.from_settings()
+    return _gazetteer
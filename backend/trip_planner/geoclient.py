@@ -0,0 +1,249 @@
+"""Process-wide geocoding client.
+
+One provider instance, and so one pool of keep-alive HTTP connections,
+is shared by every RouteCalculator in the process. Requests from all
+threads draw from a single token bucket so the provider's rate limit is
+respected, and the independent lookups of a trip are dispatched together
+on a small thread pool so they wait on the slowest lookup, not the sum.
+
+The provider is chosen with GEOCODER['PROVIDER']. The default talks to
+Nominatim at GEOCODER['DOMAIN'], which can point at a self-hosted or
+local stand-in server.
+
+The async methods serve the ASGI views: lookups wait on the event loop
+instead of a thread. Providers with an aopen() context manager are
+awaited directly on a session opened for each batch of lookups, since an
+aiohttp session belongs to one event loop; others run on the client's
+thread pool. NominatimProvider uses geopy's aiohttp adapter.
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .metrics import count
+
+DEFAULTS = {
+    'PROVIDER': 'trip_planner.geoclient.NominatimProvider',
+    'DOMAIN': 'nominatim.openstreetmap.org',
+    'SCHEME': 'https',
+    'USER_AGENT': 'eld_trip_planner',
+    'TIMEOUT': 5,            # seconds per request
+    'RATE': 1.0,             # requests per second across the process; None for no limit
+    'BURST': 1,              # requests allowed back to back before the rate applies
+    'WORKERS': 4,            # concurrent requests, also the connection pool size
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'GEOCODER', {})}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _take(self):
+        """Take a token and return 0, or return the seconds until one is available"""
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class NominatimProvider:
+    name = 'nominatim'
+
+    def __init__(self, options):
+        from geopy.geocoders import Nominatim
+        self.options = options
+        try:
+            from geopy.adapters import RequestsAdapter
+        except ImportError:
+            adapter_factory = None
+        else:
+            # A requests session keeps connections to the server alive between lookups
+            def adapter_factory(proxies, ssl_context):
+                return RequestsAdapter(proxies=proxies, ssl_context=ssl_context,
+                                       pool_connections=1, pool_maxsize=options['WORKERS'])
+        self.geolocator = Nominatim(
+            user_agent=options['USER_AGENT'],
+            domain=options['DOMAIN'],
+            scheme=options['SCHEME'],
+            timeout=options['TIMEOUT'],
+            **({'adapter_factory': adapter_factory} if adapter_factory else {}),
+        )
+        # Async lookups need geopy's aiohttp adapter, and so aiohttp
+        if _aiohttp_available():
+            self.aopen = self._aopen
+
+    def forward(self, address):
+        location = self.geolocator.geocode(address)
+        return (location.latitude, location.longitude) if location else None
+
+    def reverse(self, coords):
+        return self.format_reverse(self.geolocator.reverse(f"{coords[0]}, {coords[1]}"))
+
+    @staticmethod
+    def format_reverse(location):
+        if location is None:
+            return None
+        address = location.raw.get('address', {})
+        city = address.get('city') or address.get('town') or address.get('village') or "Unknown location"
+        state = address.get('state') or ""
+        return f"{city}, {state}" if state else city
+
+    @contextlib.asynccontextmanager
+    async def _aopen(self):
+        """Async forward and reverse lookups sharing one aiohttp session, closed on exit"""
+        from geopy.adapters import AioHTTPAdapter
+        from geopy.geocoders import Nominatim
+        async with Nominatim(
+            user_agent=self.options['USER_AGENT'],
+            domain=self.options['DOMAIN'],
+            scheme=self.options['SCHEME'],
+            timeout=self.options['TIMEOUT'],
+            adapter_factory=AioHTTPAdapter,
+        ) as geolocator:
+            yield _AsyncNominatim(geolocator)
+
+
+class _AsyncNominatim:
+    def __init__(self, geolocator):
+        self.geolocator = geolocator
+
+    async def forward(self, address):
+        location = await self.geolocator.geocode(address)
+        return (location.latitude, location.longitude) if location else None
+
+    async def reverse(self, coords):
+        location = await self.geolocator.reverse(f"{coords[0]}, {coords[1]}")
+        return NominatimProvider.format_reverse(location)
+
+
+def _aiohttp_available():
+    try:
+        from geopy.adapters import AioHTTPAdapter
+    except ImportError:
+        return False
+    return AioHTTPAdapter.is_available
+
+
+class GeocodingClient:
+    def __init__(self, provider, rate=DEFAULTS['RATE'], burst=DEFAULTS['BURST'], workers=DEFAULTS['WORKERS']):
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        options = get_options()
+        provider = import_string(options['PROVIDER'])(options)
+        return cls(provider, rate=options['RATE'], burst=options['BURST'], workers=options['WORKERS'])
+
+    def forward_many(self, addresses):
+        """[(lat, lng) or None, ...] for addresses; None where the provider found nothing or failed"""
+        count(f'{self.provider.name}_forward', len(addresses))
+        return self._dispatch(self.provider.forward, addresses)
+
+    def reverse_many(self, coords_list):
+        """["City, State" or None, ...] for coordinates; None where nothing was found or the lookup failed"""
+        count(f'{self.provider.name}_reverse', len(coords_list))
+        return self._dispatch(self.provider.reverse, coords_list)
+
+    def _dispatch(self, lookup, items):
+        """Run lookup over items, concurrently when there is more than one"""
+        def limited(item):
+            self.bucket.acquire()
+            try:
+                return lookup(item)
+            except Exception as e:
+                print(f"Geocoding error for {item}: {e}")
+                return None
+
+        if len(items) <= 1 or self.workers <= 1:
+            return [limited(item) for item in items]
+        return list(self._get_executor().map(limited, items))
+
+    async def aforward_many(self, addresses):
+        count(f'{self.provider.name}_forward', len(addresses))
+        return await self._adispatch('forward', addresses)
+
+    async def areverse_many(self, coords_list):
+        count(f'{self.provider.name}_reverse', len(coords_list))
+        return await self._adispatch('reverse', coords_list)
+
+    async def _adispatch(self, name, items):
+        """Run the provider's lookup over items as concurrent tasks on the running event loop"""
+        aopen = getattr(self.provider, 'aopen', None)
+        if aopen is not None:
+            async with aopen() as lookups:
+                return await self._agather(getattr(lookups, name), items)
+        # Blocking providers run on the client's own pool, so WORKERS still bounds them
+        sync_lookup = getattr(self.provider, name)
+        loop = asyncio.get_running_loop()
+        return await self._agather(
+            lambda item: loop.run_in_executor(self._get_executor(), sync_lookup, item), items,
+        )
+
+    async def _agather(self, lookup, items):
+        async def limited(item):
+            await self.bucket.aacquire()
+            try:
+                return await lookup(item)
+            except Exception as e:
+                print(f"Geocoding error for {item}: {e}")
+                return None
+
+        return await asyncio.gather(*(limited(item) for item in items))
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='geocoder')
+        return self._executor
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_geocoding_client():
+    """Return the process-wide geocoding client, built from settings on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeocodingClient.from_settings()
+    return _client
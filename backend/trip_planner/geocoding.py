@@ -0,0 +1,220 @@
+import threading
+import time
+import datetime
+from collections import OrderedDict
+from django.conf import settings
+from django.utils import timezone
+from .models import GeocodeCacheEntry, GeocodeKind
+from .steps import run, arun
+
+DEFAULTS = {
+    'MAX_ENTRIES': 4096,                 # in-process LRU size
+    'FORWARD_TTL': 60 * 60 * 24 * 30,    # seconds, address -> coordinates
+    'REVERSE_TTL': 60 * 60 * 24 * 30,    # seconds, coordinates -> "City, ST"
+    'REVERSE_PRECISION': 2,              # decimal places, ~1 km at 2
+}
+
+
+def normalize_address(address):
+    """Lowercase and collapse whitespace so equivalent addresses share a key"""
+    return ' '.join(address.lower().replace(',', ', ').split())[:255]
+
+
+def reverse_key(coords, precision):
+    """Round coordinates to a grid cell key"""
+    return f"{coords[0]:.{precision}f},{coords[1]:.{precision}f}"
+
+
+class GeocodeCache:
+    """Two-tier geocode cache: in-process LRU in front of the GeocodeCacheEntry table.
+
+    Lookups go memory -> database -> fetch callable, with one database
+    query and one fetch call for each batch. Results from the database or
+    the fetch callable are promoted into memory. A fetch that returns None
+    (nothing found) is not cached. Lookups take persist=False to keep
+    fetched results out of the database.
+    """
+
+    def __init__(self, max_entries, forward_ttl, reverse_ttl, reverse_precision):
+        self.max_entries = max_entries
+        self.ttl = {GeocodeKind.FORWARD: forward_ttl, GeocodeKind.REVERSE: reverse_ttl}
+        self.reverse_precision = reverse_precision
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULTS, **getattr(settings, 'GEOCODE_CACHE', {})}
+        return cls(
+            max_entries=options['MAX_ENTRIES'],
+            forward_ttl=options['FORWARD_TTL'],
+            reverse_ttl=options['REVERSE_TTL'],
+            reverse_precision=options['REVERSE_PRECISION'],
+        )
+
+    def forward_many(self, addresses, fetch_many, persist=True):
+        """Return [(lat, lng) or None, ...] for addresses, calling fetch_many(misses) once for all misses"""
+        keys = [normalize_address(address) for address in addresses]
+        return self._get_many(GeocodeKind.FORWARD, keys, addresses, fetch_many, persist)
+
+    def reverse_many(self, coords_list, fetch_many, persist=True):
+        """Return [label or None, ...] for coordinates, calling fetch_many(misses) once for all misses"""
+        keys = [reverse_key(coords, self.reverse_precision) for coords in coords_list]
+        return self._get_many(GeocodeKind.REVERSE, keys, coords_list, fetch_many, persist)
+
+    async def aforward_many(self, addresses, afetch_many, persist=True):
+        """forward_many for async callers, awaiting the database and afetch_many(misses)"""
+        keys = [normalize_address(address) for address in addresses]
+        return await self._aget_many(GeocodeKind.FORWARD, keys, addresses, afetch_many, persist)
+
+    async def areverse_many(self, coords_list, afetch_many, persist=True):
+        keys = [reverse_key(coords, self.reverse_precision) for coords in coords_list]
+        return await self._aget_many(GeocodeKind.REVERSE, keys, coords_list, afetch_many, persist)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def clear(self, persistent=False):
+        """Drop the in-process tier, and the database tier too if persistent"""
+        with self._lock:
+            self._memory.clear()
+        if persistent:
+            GeocodeCacheEntry.objects.all().delete()
+
+    def purge_expired(self):
+        return GeocodeCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+    def _get_many(self, kind, keys, items, fetch_many, persist=True):
+        return run(self._lookup(kind, keys, items, persist), {
+            'db_get': self._db_get_many, 'fetch': fetch_many, 'db_set': self._db_set_many,
+        })
+
+    async def _aget_many(self, kind, keys, items, afetch_many, persist=True):
+        return await arun(self._lookup(kind, keys, items, persist), {
+            'db_get': self._adb_get_many, 'fetch': afetch_many, 'db_set': self._adb_set_many,
+        })
+
+    def _lookup(self, kind, keys, items, persist):
+        """Steps of _get_many and _aget_many: memory, then one database query and one fetch for the misses"""
+        values = self._memory_get_many(kind, keys)
+        missing = [key for key, value in values.items() if value is None]
+        if missing:
+            for key, (value, expires_at) in (yield 'db_get', kind, missing).items():
+                values[key] = value
+                self._memory_set(kind, key, value, expires_at)
+            self._count('db_hits', sum(values[key] is not None for key in missing))
+
+        missing = [key for key, value in values.items() if value is None]
+        if missing:
+            self._count('misses', len(missing))
+            # Fetch the first item given for each missing key
+            originals = {}
+            for key, item in zip(keys, items):
+                originals.setdefault(key, item)
+            fetched = yield 'fetch', [originals[key] for key in missing]
+
+            expires_at = timezone.now() + datetime.timedelta(seconds=self.ttl[kind])
+            found = {key: value for key, value in zip(missing, fetched) if value is not None}
+            for key, value in found.items():
+                values[key] = value
+                self._memory_set(kind, key, value, expires_at)
+            if found and persist:
+                yield 'db_set', kind, found, expires_at
+        return [values[key] for key in keys]
+
+    def _memory_get_many(self, kind, keys):
+        values = {}
+        for key in keys:
+            if key not in values:
+                values[key] = self._memory_get(kind, key)
+        self._count('memory_hits', sum(value is not None for value in values.values()))
+        return values
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _memory_get(self, kind, key):
+        with self._lock:
+            entry = self._memory.get((kind, key))
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._memory[(kind, key)]
+                return None
+            self._memory.move_to_end((kind, key))
+            return value
+
+    def _memory_set(self, kind, key, value, expires_at):
+        # Convert the wall-clock expiry to the monotonic clock used in memory
+        expires = time.monotonic() + (expires_at - timezone.now()).total_seconds()
+        with self._lock:
+            self._memory[(kind, key)] = (value, expires)
+            self._memory.move_to_end((kind, key))
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _db_get_many(self, kind, keys):
+        return self._db_values(kind, self._db_entries(kind, keys))
+
+    async def _adb_get_many(self, kind, keys):
+        return self._db_values(kind, [entry async for entry in self._db_entries(kind, keys)])
+
+    @staticmethod
+    def _db_entries(kind, keys):
+        return GeocodeCacheEntry.objects.filter(kind=kind, key__in=keys, expires_at__gt=timezone.now())
+
+    @staticmethod
+    def _db_values(kind, entries):
+        if kind == GeocodeKind.FORWARD:
+            return {entry.key: ((entry.latitude, entry.longitude), entry.expires_at) for entry in entries}
+        return {entry.key: (entry.label, entry.expires_at) for entry in entries}
+
+    def _db_set_many(self, kind, values, expires_at):
+        """Upsert several entries in one query"""
+        GeocodeCacheEntry.objects.bulk_create(**self._upsert(kind, values, expires_at))
+
+    async def _adb_set_many(self, kind, values, expires_at):
+        await GeocodeCacheEntry.objects.abulk_create(**self._upsert(kind, values, expires_at))
+
+    def _upsert(self, kind, values, expires_at):
+        """bulk_create arguments upserting values"""
+        return {
+            'objs': [
+                GeocodeCacheEntry(kind=kind, key=key, **self._db_fields(kind, value, expires_at))
+                for key, value in values.items()
+            ],
+            'update_conflicts': True,
+            'unique_fields': ['kind', 'key'],
+            'update_fields': ['latitude', 'longitude', 'label', 'expires_at'],
+        }
+
+    @staticmethod
+    def _db_fields(kind, value, expires_at):
+        if kind == GeocodeKind.FORWARD:
+            return {'latitude': value[0], 'longitude': value[1], 'expires_at': expires_at}
+        return {'label': value[:255], 'expires_at': expires_at}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    """Return the process-wide geocode cache, built from settings on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GeocodeCache.from_settings()
+    return _cache
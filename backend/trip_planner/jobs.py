@@ -0,0 +1,84 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from django.conf import settings
+from django.db import connections
+
+DEFAULTS = {
+    'ASYNC': False,          # plan in the background unless ?async=false is passed
+    'EXECUTOR': 'thread',    # 'thread' or 'process'
+    'WORKERS': 4,
+    'BULK_WORKERS': 1,       # processes used by the bulk endpoint; 1 plans in-process
+    'STALE_AFTER': 600,      # seconds a trip may wait or run before its job is presumed lost with its worker
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'TRIP_PLANNING', {})}
+
+
+def _init_process():
+    # Forked workers must not share the parent's database connections
+    import django
+    django.setup()
+    connections.close_all()
+    from .routing import get_road_graph
+    get_road_graph()
+
+
+def run_planning_job(trip_id):
+    """Worker entry point: claim and plan one PENDING trip, then release this worker's DB connections"""
+    from .services import plan_pending_trip
+    try:
+        plan_pending_trip(trip_id)
+    except Exception as e:
+        print(f"Trip planning error for {trip_id}: {e}")
+    finally:
+        connections.close_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide planning worker pool, created on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                options = get_options()
+                if options['EXECUTOR'] == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=options['WORKERS'], initializer=_init_process)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=options['WORKERS'], thread_name_prefix='trip-planner')
+    return _executor
+
+
+def submit_trip(trip_id):
+    """Queue planning for a saved PENDING trip and return the Future"""
+    return get_executor().submit(run_planning_job, trip_id)
+
+
+def stale_cutoff(older_than=None):
+    """The time before which a waiting or running trip counts as lost; older_than defaults to STALE_AFTER"""
+    from django.utils import timezone
+    if older_than is None:
+        older_than = datetime.timedelta(seconds=get_options()['STALE_AFTER'])
+    return timezone.now() - older_than
+
+
+def stale_trip_ids(stale_before):
+    """Ids of trips still PENDING or RUNNING from before stale_before, whose jobs died with their worker"""
+    from .services import stale_trips
+    return list(stale_trips(stale_before).order_by('created_at').values_list('id', flat=True))
+
+
+def fail_trips(trip_ids, stale_before, error="Planning was interrupted; submit the trip again."):
+    """Mark the trips that are still stale as FAILED and return how many were"""
+    from django.db.models import F
+    from .models import PlanStatus
+    from .services import stale_trips
+    return stale_trips(stale_before).filter(pk__in=trip_ids).update(
+        status=PlanStatus.FAILED, error=error, revision=F('revision') + 1,
+    )
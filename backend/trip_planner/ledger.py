@@ -0,0 +1,114 @@
+"""Per-driver daily duty ledger for the rolling 70 hour / 8 day cycle.
+
+Each DriverDay row holds a driver's on-duty and driving minutes for one
+date, merged over the ELD logs of all their trips, plus where the day's
+duty starts and ends so 34 hour restarts spanning midnights can be found
+without the logs. Rows are recomputed for just the dates a write touched,
+so reading a driver's cycle is one indexed range query over a few rows.
+"""
+import datetime
+import numpy as np
+from .models import DriverDay, ELDLog, Trip
+from .planner import DEFAULT_RULES
+from .timeline import DRIVING, ON_DUTY, MINUTES_PER_DAY
+
+
+def update_days(driver_id, dates):
+    """Recompute a driver's ledger rows for dates from their trips' ELD logs"""
+    dates = set(dates)
+    if not driver_id or not dates:
+        return
+    logs = ELDLog.objects.filter(trip__driver_id=driver_id, log_date__in=dates).only(
+        'log_date', 'duty_timeline', 'off_duty_periods', 'sleeper_berth_periods', 'driving_periods', 'on_duty_periods',
+    )
+    duty = {}
+    driving = {}
+    for log in logs:
+        minutes = np.frombuffer(log.timeline.to_bytes(), dtype=np.uint8)
+        day_duty = (minutes == DRIVING) | (minutes == ON_DUTY)
+        day_driving = minutes == DRIVING
+        # Trips on the same day can overlap, so minutes are merged rather than added
+        if log.log_date in duty:
+            day_duty |= duty[log.log_date]
+            day_driving |= driving[log.log_date]
+        duty[log.log_date] = day_duty
+        driving[log.log_date] = day_driving
+
+    rows = []
+    for log_date, day_duty in duty.items():
+        on_duty = np.flatnonzero(day_duty)
+        rows.append(DriverDay(
+            driver_id=driver_id,
+            log_date=log_date,
+            on_duty_minutes=len(on_duty),
+            driving_minutes=int(driving[log_date].sum()),
+            first_duty_minute=int(on_duty[0]) if len(on_duty) else None,
+            last_duty_minute=int(on_duty[-1]) + 1 if len(on_duty) else None,
+        ))
+    DriverDay.objects.filter(driver_id=driver_id, log_date__in=dates - set(duty)).delete()
+    DriverDay.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['driver', 'log_date'],
+        update_fields=['on_duty_minutes', 'driving_minutes', 'first_duty_minute', 'last_duty_minute'],
+    )
+
+
+def duty_history(driver_id, day, rules=DEFAULT_RULES):
+    """On-duty hours per day for the cycle window ending on day, oldest first.
+
+    Days before the driver's latest 34 hour restart count as zero. day
+    itself is counted in full, so the result never overstates the hours
+    left.
+    """
+    # Read two extra days so a restart that began before the window is seen whole
+    lookback = rules.cycle_days - 1 + int(rules.restart_period // 24) + 1
+    first = day - datetime.timedelta(days=lookback)
+    rows = {
+        row.log_date: row
+        for row in DriverDay.objects.filter(driver_id=driver_id, log_date__range=(first, day))
+    }
+
+    hours = []
+    off_run = 0
+    restart = 0
+    for offset in range(lookback + 1):
+        row = rows.get(first + datetime.timedelta(days=offset))
+        if row is None or not row.on_duty_minutes:
+            hours.append(0.0)
+            off_run += MINUTES_PER_DAY
+            continue
+        if off_run + row.first_duty_minute >= rules.restart_period * 60:
+            restart = offset
+        hours.append(row.on_duty_minutes / 60)
+        off_run = MINUTES_PER_DAY - row.last_duty_minute
+    hours = [0.0] * restart + hours[restart:]
+    return hours[-rules.cycle_days:]
+
+
+def cycle_hours_used(driver_id, day, rules=DEFAULT_RULES):
+    return sum(duty_history(driver_id, day, rules))
+
+
+def remember_trip_days(sender, instance, **kwargs):
+    """Before a trip is deleted, note the days its logs cover so the ledger can be updated after"""
+    if instance.driver_id:
+        instance._ledger_dates = set(ELDLog.objects.filter(trip=instance).values_list('log_date', flat=True))
+
+
+def update_after_delete(sender, instance, **kwargs):
+    update_days(instance.driver_id, getattr(instance, '_ledger_dates', ()))
+
+
+def remember_driver_change(sender, instance, update_fields=None, **kwargs):
+    """Before a saved trip's driver changes, note the old driver and the days its logs cover"""
+    if instance._state.adding or (update_fields is not None and 'driver' not in update_fields):
+        return
+    previous = Trip.objects.filter(pk=instance.pk).values_list('driver_id', flat=True).first()
+    if previous != instance.driver_id:
+        instance._ledger_move = (previous, set(ELDLog.objects.filter(trip=instance).values_list('log_date', flat=True)))
+
+
+def update_after_driver_change(sender, instance, **kwargs):
+    """Move a trip's duty from its old driver's ledger to the new driver's"""
+    previous, dates = instance.__dict__.pop('_ledger_move', (None, ()))
+    update_days(previous, dates)
+    update_days(instance.driver_id, dates)
@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from trip_planner.benchmarks import (
+    BENCHMARKS, CORPORA, TOLERANCE, LATENCY, THREADS, STOPS, run_benchmarks, compare, make_corpus,
+    measure_concurrency, measure_sequencing,
+)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = "Benchmark trip planning, ELD generation, persistence and POST /trips/ against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', action='append', choices=BENCHMARKS, help="Run only these benchmarks")
+        parser.add_argument('--corpus', action='append', choices=list(CORPORA), help="Use only these corpora")
+        parser.add_argument('--size', type=int, default=20, help="Trips per corpus")
+        parser.add_argument('--rounds', type=int, default=5, help="Timed passes over each corpus")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline results file")
+        parser.add_argument('--save-baseline', action='store_true', help="Write these results as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                            help="Allowed fractional slowdown or allocation growth before failing")
+        parser.add_argument('--concurrency', type=int, metavar='TRIPS',
+                            help="Instead, compare threaded and async planning of this many trips")
+        parser.add_argument('--latency', type=float, default=LATENCY, help="Seconds per geocoding call for --concurrency")
+        parser.add_argument('--threads', type=int, default=THREADS, help="Request threads for --concurrency")
+        parser.add_argument('--sequencing', type=int, nargs='?', const=STOPS, metavar='STOPS',
+                            help=f"Instead, time ordering and planning trips with this many stops (default {STOPS})")
+
+    def handle(self, *args, **options):
+        if options['sequencing']:
+            results = measure_sequencing(options['sequencing'])
+            self.stdout.write(f"{options['sequencing']} stops: {results['ms_per_plan']:>9.3f} ms/plan "
+                              f"{results['max_ms']:>9.3f} ms max")
+            return
+        if options['concurrency']:
+            trips = make_corpus('regional', options['concurrency'])
+            results = measure_concurrency(trips, options['latency'], options['threads'])
+            self.stdout.write(f"{options['threads']} threads: {results['threads']:>10.1f} plans/s")
+            self.stdout.write(f"async tasks: {results['async']:>10.1f} plans/s")
+            return
+
+        def report(key, result):
+            self.stdout.write(
+                f"{key:<26} {result['ops_per_sec']:>10.1f} ops/s {result['ms_per_op']:>9.3f} ms/op "
+                f"{result['peak_kib']:>9.1f} KiB peak"
+            )
+
+        # Persistence and API benchmarks write to a throwaway test database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmarks(
+                options['benchmark'] or BENCHMARKS, options['corpus'] or CORPORA,
+                options['size'], options['rounds'], report,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stderr.write(f"Saved baseline to {baseline_path}")
+            return
+        if not baseline_path.exists():
+            self.stderr.write(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+            return
+
+        regressions = compare(results, json.loads(baseline_path.read_text()), options['tolerance'])
+        for key, message in regressions.items():
+            self.stderr.write(f"REGRESSION {key}: {message}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmarks regressed beyond {options['tolerance']:.0%}")
+        self.stderr.write("No regressions against the baseline")
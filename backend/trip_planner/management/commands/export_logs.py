@@ -0,0 +1,45 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from trip_planner.export import CHUNK_SIZE, InvalidCursor, decode_cursor, export_rows, render_export
+
+
+class Command(BaseCommand):
+    help = "Stream ELD logs or route points for every trip in a date range as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', type=datetime.date.fromisoformat, help="First day, YYYY-MM-DD")
+        parser.add_argument('end', type=datetime.date.fromisoformat, help="Last day, YYYY-MM-DD")
+        parser.add_argument('--kind', choices=['logs', 'points'], default='logs')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--cursor', help="Resume after the row with this cursor")
+        parser.add_argument('--output', help="Output file, defaults to stdout")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        if options['cursor']:
+            try:
+                decode_cursor(options['cursor'], options['kind'])
+            except InvalidCursor as e:
+                raise CommandError(str(e))
+
+        count = 0
+        last_cursor = options['cursor']
+
+        def counted(rows):
+            nonlocal count, last_cursor
+            for row in rows:
+                count += 1
+                last_cursor = row['cursor']
+                yield row
+
+        rows = counted(export_rows(options['kind'], options['start'], options['end'],
+                                   options['cursor'], options['chunk_size']))
+        lines = render_export(rows, options['kind'], options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+        self.stderr.write(f"Exported {count} rows, last cursor {last_cursor or '-'}")
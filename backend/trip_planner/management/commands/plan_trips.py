@@ -0,0 +1,33 @@
+import sys
+import json
+from django.core.management.base import BaseCommand
+from trip_planner.bulk import CHUNK_SIZE, read_rows, detect_format, plan_rows
+
+
+class Command(BaseCommand):
+    help = "Plan trips from a CSV or JSON-lines file, writing one JSON result per row"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows per transaction")
+        parser.add_argument('--workers', type=int, default=1, help="Planner processes")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or detect_format(path)
+        planned = failed = 0
+
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            for result in plan_rows(read_rows(source, format), options['chunk_size'], options['workers']):
+                self.stdout.write(json.dumps(result))
+                if 'errors' in result:
+                    failed += 1
+                else:
+                    planned += 1
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        self.stderr.write(f"Planned {planned} trips, {failed} rows failed")
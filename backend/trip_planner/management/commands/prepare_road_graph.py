@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from trip_planner.routing import RoadGraph
+
+
+class Command(BaseCommand):
+    help = "Contract a JSON or .npz road graph extract and save it as an .npz that loads without contracting"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Road graph extract, JSON or .npz")
+        parser.add_argument('output', help="Contracted .npz file to write")
+
+    def handle(self, *args, **options):
+        if not options['output'].endswith('.npz'):
+            raise CommandError("The output file must end in .npz")
+        started = time.perf_counter()
+        try:
+            graph = RoadGraph.load(options['source'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Could not read {options['source']}: {e}")
+        graph.save(options['output'])
+        shortcuts = len(graph.sources) - graph.road_edges
+        self.stderr.write(
+            f"Contracted {len(graph)} nodes and {graph.road_edges} edges with {shortcuts} shortcuts "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
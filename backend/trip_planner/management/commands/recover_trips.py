@@ -0,0 +1,32 @@
+import datetime
+from django.core.management.base import BaseCommand
+from trip_planner.jobs import fail_trips, get_options, stale_cutoff, stale_trip_ids
+from trip_planner.services import plan_pending_trip
+
+
+class Command(BaseCommand):
+    help = "Plan again, or mark FAILED, trips whose background job was lost with its worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=get_options()['STALE_AFTER'],
+                            help="Seconds a trip must have waited PENDING or run RUNNING to count as lost")
+        parser.add_argument('--fail', action='store_true', help="Mark the trips FAILED instead of planning them")
+
+    def handle(self, *args, **options):
+        stale_before = stale_cutoff(datetime.timedelta(seconds=options['older_than']))
+        trip_ids = stale_trip_ids(stale_before)
+        if options['fail']:
+            self.stderr.write(f"Marked {fail_trips(trip_ids, stale_before)} of {len(trip_ids)} stale trips FAILED")
+            return
+
+        planned = skipped = failed = 0
+        for trip_id in trip_ids:
+            try:
+                if plan_pending_trip(trip_id, stale_before=stale_before) is None:
+                    skipped += 1        # another run claimed the trip first
+                else:
+                    planned += 1
+            except Exception as e:
+                self.stderr.write(f"Trip {trip_id}: {e}")
+                failed += 1
+        self.stderr.write(f"Planned {planned} of {len(trip_ids)} stale trips, {failed} failed, {skipped} taken by other runs")
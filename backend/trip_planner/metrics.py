@@ -0,0 +1,194 @@
+"""Lightweight per-phase timing and external call counting.
+
+Code under measurement wraps each phase in ``with phase('geocode'):`` and
+calls ``count('nominatim_forward')`` for each external request. Every
+observation is added to a process-wide histogram, served in Prometheus
+text format by metrics_view, and to the current request's timings, which
+TripViewSet returns in a Server-Timing header. When METRICS['ENABLED'] is
+off, phase() returns a shared no-op context manager and count() returns
+at once.
+
+Histograms are per process; with several worker processes each one
+reports its own.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import nullcontext
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,     # add a Server-Timing header to TripViewSet responses
+    'BUCKETS': [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],  # seconds
+}
+
+_options = None
+_current = contextvars.ContextVar('trip_planner_timings', default=None)
+_NOOP = nullcontext()
+
+
+def get_options():
+    global _options
+    if _options is None:
+        _options = {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+    return _options
+
+
+@receiver(setting_changed)
+def _reset_options(setting, **kwargs):
+    global _options
+    if setting == 'METRICS':
+        _options = None
+        registry.buckets = None
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)    # the last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+
+class Registry:
+    """Process-wide phase duration histograms and external call counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = None
+        self.phases = {}
+        self.calls = {}
+        self.collectors = []
+
+    def register(self, collector):
+        """Add a callable returning extra exposition lines, e.g. cache statistics"""
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if self.buckets is None:
+                self.buckets = sorted(get_options()['BUCKETS'])
+            histogram = self.phases.get(name)
+            if histogram is None:
+                histogram = self.phases[name] = Histogram(self.buckets)
+            histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram.total += seconds
+            histogram.count += 1
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.buckets = None
+            self.phases = {}
+            self.calls = {}
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                '# HELP trip_planner_phase_seconds Time spent in each trip planning phase.',
+                '# TYPE trip_planner_phase_seconds histogram',
+            ]
+            for name, histogram in sorted(self.phases.items()):
+                cumulative = 0
+                for bound, count in zip([*self.buckets, '+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'trip_planner_phase_seconds_bucket{{phase="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'trip_planner_phase_seconds_sum{{phase="{name}"}} {histogram.total}')
+                lines.append(f'trip_planner_phase_seconds_count{{phase="{name}"}} {histogram.count}')
+            lines += [
+                '# HELP trip_planner_external_calls_total Requests made to external services.',
+                '# TYPE trip_planner_external_calls_total counter',
+            ]
+            for name, count in sorted(self.calls.items()):
+                lines.append(f'trip_planner_external_calls_total{{call="{name}"}} {count}')
+            collectors = list(self.collectors)
+        for collector in collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestTimings:
+    """Phase durations and call counts for one request, in observation order"""
+    __slots__ = ('phases', 'calls')
+
+    def __init__(self):
+        self.phases = {}      # name -> seconds
+        self.calls = {}       # name -> count
+
+    def server_timing(self):
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items()]
+        entries += [f'{name};desc="{count} calls"' for name, count in self.calls.items()]
+        return ', '.join(entries)
+
+
+class _Phase:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def phase(name):
+    """Context manager timing a phase of work"""
+    if not get_options()['ENABLED']:
+        return _NOOP
+    return _Phase(name)
+
+
+def record(name, seconds):
+    registry.observe(name, seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.phases[name] = timings.phases.get(name, 0.0) + seconds
+
+
+def count(name, amount=1):
+    """Count a call to an external service"""
+    if not get_options()['ENABLED']:
+        return
+    registry.increment(name, amount)
+    timings = _current.get()
+    if timings is not None:
+        timings.calls[name] = timings.calls.get(name, 0) + amount
+
+
+def start_request():
+    """Collect timings for the current request; returns a token for finish_request"""
+    if not get_options()['ENABLED']:
+        return None
+    return _current.set(RequestTimings())
+
+
+def finish_request(token):
+    """Stop collecting and return the request's RequestTimings, or None"""
+    if token is None:
+        return None
+    timings = _current.get()
+    _current.reset(token)
+    return timings
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('FORWARD', 'Forward'), ('REVERSE', 'Reverse')], max_length=10)),
+                ('key', models.CharField(max_length=255)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('label', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='eldlog',
+            index=models.Index(fields=['trip'], name='trip_planne_trip_id_0d4924_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routepoint',
+            index=models.Index(fields=['trip'], name='trip_planne_trip_id_81722d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='geocodecacheentry',
+            index=models.Index(fields=['expires_at'], name='trip_planne_expires_0e80e2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='geocodecacheentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'key'), name='unique_geocode_cache_key'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:29
+
+from django.db import migrations, models
+from trip_planner.timeline import DutyTimeline
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_timelines(apps, schema_editor):
+    ELDLog = apps.get_model('trip_planner', 'ELDLog')
+    # Walk the table by primary key and write each batch before reading the next, so memory stays flat
+    last_pk = 0
+    while logs := list(ELDLog.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE]):
+        for log in logs:
+            log.duty_timeline = DutyTimeline.from_periods(
+                log.off_duty_periods, log.sleeper_berth_periods, log.driving_periods, log.on_duty_periods
+            ).to_bytes()
+        ELDLog.objects.bulk_update(logs, ['duty_timeline'])
+        last_pk = logs[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0003_trip_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eldlog',
+            name='duty_timeline',
+            field=models.BinaryField(default=bytes, max_length=1440),
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0005_trip_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='optimize_stops',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='routepoint',
+            name='point_type',
+            field=models.CharField(choices=[('START', 'Start'), ('PICKUP', 'Pickup'), ('STOP', 'Stop'), ('REST', 'Rest'), ('FUEL', 'Fuel'), ('DROPOFF', 'Dropoff')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='TripStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('location', models.CharField(max_length=255)),
+                ('window_start', models.DateTimeField(blank=True, null=True)),
+                ('window_end', models.DateTimeField(blank=True, null=True)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='trip_planner.trip')),
+            ],
+            options={
+                'ordering': ['sequence'],
+                'indexes': [models.Index(fields=['trip', 'sequence'], name='trip_planne_trip_id_80b01f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:50
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0006_trip_stops'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Driver',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='driver',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trips', to='trip_planner.driver'),
+        ),
+        migrations.CreateModel(
+            name='DriverDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('log_date', models.DateField()),
+                ('on_duty_minutes', models.PositiveIntegerField(default=0)),
+                ('driving_minutes', models.PositiveIntegerField(default=0)),
+                ('first_duty_minute', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_duty_minute', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='days', to='trip_planner.driver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('driver', 'log_date'), name='unique_driver_day')],
+            },
+        ),
+    ]
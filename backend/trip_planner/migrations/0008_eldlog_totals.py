@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:05
+
+from django.db import migrations, models
+from trip_planner.timeline import DutyTimeline, OFF_DUTY, SLEEPER_BERTH, DRIVING, ON_DUTY
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_totals(apps, schema_editor):
+    ELDLog = apps.get_model('trip_planner', 'ELDLog')
+    # Walk the table by primary key and write each batch before reading the next, as 0004 does
+    last_pk = 0
+    while logs := list(ELDLog.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE]):
+        for log in logs:
+            if log.duty_timeline:
+                timeline = DutyTimeline(log.duty_timeline)
+            else:
+                timeline = DutyTimeline.from_periods(
+                    log.off_duty_periods, log.sleeper_berth_periods, log.driving_periods, log.on_duty_periods
+                )
+            totals = timeline.totals()
+            log.off_duty_minutes = totals[OFF_DUTY]
+            log.sleeper_berth_minutes = totals[SLEEPER_BERTH]
+            log.driving_minutes = totals[DRIVING]
+            log.on_duty_minutes = totals[ON_DUTY]
+        ELDLog.objects.bulk_update(
+            logs, ['off_duty_minutes', 'sleeper_berth_minutes', 'driving_minutes', 'on_duty_minutes'],
+        )
+        last_pk = logs[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0007_drivers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eldlog',
+            name='driving_minutes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eldlog',
+            name='off_duty_minutes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eldlog',
+            name='on_duty_minutes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eldlog',
+            name='sleeper_berth_minutes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='eldlog',
+            index=models.Index(fields=['log_date'], name='trip_planne_log_dat_eaa706_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
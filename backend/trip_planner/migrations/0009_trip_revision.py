@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0008_eldlog_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
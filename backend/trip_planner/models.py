@@ -2,21 +2,77 @@ from django.db import models
 import uuid
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from .timeline import DutyTimeline, MINUTES_PER_DAY, OFF_DUTY, SLEEPER_BERTH, DRIVING, ON_DUTY
+
+class PlanStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Pending'
+    RUNNING = 'RUNNING', 'Running'
+    DONE = 'DONE', 'Done'
+    FAILED = 'FAILED', 'Failed'
+
+class Driver(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
 
 class Trip(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    driver = models.ForeignKey(Driver, related_name='trips', null=True, blank=True, on_delete=models.SET_NULL)
     current_location = models.CharField(max_length=255)
     pickup_location = models.CharField(max_length=255)
     dropoff_location = models.CharField(max_length=255)
     current_cycle_hours = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=PlanStatus.choices, default=PlanStatus.DONE)
+    error = models.TextField(blank=True, default='')
+    started_at = models.DateTimeField(null=True, blank=True)  # when the current planning run claimed the trip
+    optimize_stops = models.BooleanField(default=False)  # reorder stops for the shortest route
+    revision = models.PositiveIntegerField(default=0)  # bumped whenever cached responses for the trip go stale
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Bump the revision in the same UPDATE, so a stale instance can never write an older one back
+        if not self._state.adding and not kwargs.get('force_insert'):
+            self.revision = models.F('revision') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'revision'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Trip from {self.current_location} to {self.dropoff_location}"
 
+class TripStop(models.Model):
+    """An intermediate stop between a trip's pickup and dropoff"""
+    trip = models.ForeignKey(Trip, related_name='stops', on_delete=models.CASCADE)
+    sequence = models.PositiveIntegerField()
+    location = models.CharField(max_length=255)
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['sequence']
+        indexes = [
+            models.Index(fields=['trip', 'sequence']),
+        ]
+
+    def clean(self):
+        if self.window_start and self.window_end and self.window_end < self.window_start:
+            raise ValidationError("Window end cannot be earlier than window start.")
+
+    def __str__(self):
+        return f"Stop {self.sequence} at {self.location}"
+
 class PointType(models.TextChoices):
     START = 'START', 'Start'
     PICKUP = 'PICKUP', 'Pickup'
+    STOP = 'STOP', 'Stop'
     REST = 'REST', 'Rest'
     FUEL = 'FUEL', 'Fuel'
     DROPOFF = 'DROPOFF', 'Dropoff'
@@ -50,13 +106,78 @@ class ELDLog(models.Model):
     sleeper_berth_periods = models.JSONField(default=list)
     driving_periods = models.JSONField(default=list)
     on_duty_periods = models.JSONField(default=list)
+    duty_timeline = models.BinaryField(max_length=MINUTES_PER_DAY, default=bytes)  # one status byte per minute
+    # Minutes in each status, from duty_timeline, so fleet totals can be summed in the database
+    off_duty_minutes = models.PositiveSmallIntegerField(default=0)
+    sleeper_berth_minutes = models.PositiveSmallIntegerField(default=0)
+    driving_minutes = models.PositiveSmallIntegerField(default=0)
+    on_duty_minutes = models.PositiveSmallIntegerField(default=0)  # on duty, not driving
     starting_location = models.CharField(max_length=255)
     ending_location = models.CharField(max_length=255)
 
     class Meta:
         indexes = [
             models.Index(fields=['trip']),
+            models.Index(fields=['log_date']),
         ]
 
+    @property
+    def timeline(self):
+        if self.duty_timeline:
+            return DutyTimeline(self.duty_timeline)
+        return DutyTimeline.from_periods(
+            self.off_duty_periods, self.sleeper_berth_periods, self.driving_periods, self.on_duty_periods
+        )
+
+    def fill_totals(self):
+        """Set the per-status minute totals from the timeline"""
+        totals = self.timeline.totals()
+        self.off_duty_minutes = totals[OFF_DUTY]
+        self.sleeper_berth_minutes = totals[SLEEPER_BERTH]
+        self.driving_minutes = totals[DRIVING]
+        self.on_duty_minutes = totals[ON_DUTY]
+        return self
+
     def __str__(self):
         return f"ELD Log for {self.trip.id} on {self.log_date}"
+
+class DriverDay(models.Model):
+    """A driver's duty totals for one day, maintained from the ELD logs of their trips"""
+    driver = models.ForeignKey(Driver, related_name='days', on_delete=models.CASCADE)
+    log_date = models.DateField()
+    on_duty_minutes = models.PositiveIntegerField(default=0)  # driving included
+    driving_minutes = models.PositiveIntegerField(default=0)
+    first_duty_minute = models.PositiveSmallIntegerField(null=True, blank=True)  # minute of day duty starts
+    last_duty_minute = models.PositiveSmallIntegerField(null=True, blank=True)   # minute of day duty ends
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'log_date'], name='unique_driver_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.driver_id} on {self.log_date}"
+
+class GeocodeKind(models.TextChoices):
+    FORWARD = 'FORWARD', 'Forward'
+    REVERSE = 'REVERSE', 'Reverse'
+
+class GeocodeCacheEntry(models.Model):
+    kind = models.CharField(max_length=10, choices=GeocodeKind.choices)
+    key = models.CharField(max_length=255)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    label = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='unique_geocode_cache_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.key}"
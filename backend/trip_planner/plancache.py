@@ -0,0 +1,147 @@
+"""Memoized trip plans for repeated lanes.
+
+A plan is keyed by a hash of the normalized locations, the starting cycle
+hours, every rule parameter, the planning engine version, the routing
+source and the facilities file. Plans do not depend on the time of day
+they start, so the cached value is the labelled stop timeline relative to
+the start; a hit rebases it onto the new start time and skips geocoding,
+routing and the HOS simulation. ELD logs are always rebuilt, since day
+boundaries move with the start time.
+"""
+import dataclasses
+import datetime
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from .geocoding import normalize_address
+from .planner import ENGINE_VERSION, PlannedStop
+from .metrics import registry
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 1024,      # plans kept in memory, least recently used evicted first
+}
+
+
+def plan_key(locations, cycle_hours, rules, routing=None, facilities=None):
+    """Content hash identifying every input that affects a plan"""
+    payload = [
+        ENGINE_VERSION,
+        [normalize_address(location) for location in locations],
+        float(cycle_hours),
+        dataclasses.asdict(rules),
+        routing,
+    ]
+    if facilities:
+        payload.append(facilities)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def to_relative(stops, start_time):
+    """Stops as plain tuples with arrival times in seconds from start_time"""
+    return tuple(
+        (stop.point_type, stop.latitude, stop.longitude,
+         (stop.arrival_time - start_time).total_seconds(), stop.duration, stop.miles, stop.leg, stop.location)
+        for stop in stops
+    )
+
+
+def rebase(relative, start_time):
+    stops = []
+    for point_type, latitude, longitude, offset, duration, miles, leg, location in relative:
+        arrival = start_time + datetime.timedelta(seconds=offset)
+        stops.append(PlannedStop(
+            point_type, latitude, longitude, arrival, arrival + datetime.timedelta(minutes=duration),
+            duration, miles, leg, location,
+        ))
+    return stops
+
+
+class PlanCache:
+    """In-process LRU of relative stop timelines with hit/miss counts"""
+
+    def __init__(self, max_entries=DEFAULTS['MAX_ENTRIES']):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULTS, **getattr(settings, 'PLAN_CACHE', {})}
+        return cls(max_entries=options['MAX_ENTRIES'])
+
+    def get(self, key, start_time):
+        """Return the cached stops rebased onto start_time, or None"""
+        with self._lock:
+            relative = self._plans.get(key)
+            if relative is None:
+                self._stats['misses'] += 1
+                return None
+            self._plans.move_to_end(key)
+            self._stats['hits'] += 1
+        return rebase(relative, start_time)
+
+    def set(self, key, stops, start_time):
+        relative = to_relative(stops, start_time)
+        with self._lock:
+            self._plans[key] = relative
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._plans)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+
+def render_stats():
+    """Prometheus lines for the plan cache, once it is in use"""
+    if _cache is None:
+        return []
+    stats = _cache.stats()
+    return [
+        '# HELP trip_planner_plan_cache_lookups_total Plan cache lookups by result.',
+        '# TYPE trip_planner_plan_cache_lookups_total counter',
+        f'trip_planner_plan_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+        f'trip_planner_plan_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+        '# TYPE trip_planner_plan_cache_evictions_total counter',
+        f'trip_planner_plan_cache_evictions_total {stats["evictions"]}',
+        '# TYPE trip_planner_plan_cache_entries gauge',
+        f'trip_planner_plan_cache_entries {stats["entries"]}',
+    ]
+
+
+registry.register(render_stats)
+
+
+def plan_cache_enabled():
+    return {**DEFAULTS, **getattr(settings, 'PLAN_CACHE', {})}['ENABLED']
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_plan_cache():
+    """Return the process-wide plan cache, built from settings on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PlanCache.from_settings()
+    return _cache
@@ -0,0 +1,487 @@
+"""Hours-of-service trip planning engine.
+
+Pure Python with no Django, database, network or clock access: callers
+pass coordinates, a start time, the cycle hours already used and a rule
+set, and get back plain records. RouteCalculator and ELDGenerator in
+services.py adapt these records to and from the ORM.
+"""
+import math
+import datetime
+from dataclasses import dataclass, field
+from . import timeline
+
+ENGINE_VERSION = 1
+EARTH_RADIUS_MILES = 3958.8
+EPSILON = 1e-9
+MIN_RECOVERY = 1.0       # hours, least cycle time worth resting for instead of a 34 hour restart
+MIN_SNAP_MILES = 1.0     # miles, least driving to a facility before stopping at it
+
+# Values match models.PointType
+START = 'START'
+PICKUP = 'PICKUP'
+STOP = 'STOP'
+REST = 'REST'
+FUEL = 'FUEL'
+DROPOFF = 'DROPOFF'
+
+
+@dataclass(frozen=True, slots=True)
+class RuleSet:
+    average_speed: float = 55          # mph, average truck speed
+    driving_limit: float = 11          # hours of driving per shift
+    duty_limit: float = 14             # hours, on-duty window per shift
+    break_after: float = 8             # hours of driving before a 30 min break
+    break_duration: int = 30           # minutes
+    rest_period: float = 10            # hours, minimum off-duty time between shifts
+    cycle_limit: float = 70            # hours on duty per 8 days
+    cycle_days: int = 8                # days in the rolling cycle window
+    restart_period: float = 34         # hours off duty that resets the cycle
+    fuel_distance: float = 800         # miles, refuel every this many miles
+    fuel_duration: int = 45            # minutes
+    pickup_dropoff_time: int = 60      # minutes, for pickup and dropoff
+    fuel_tolerance: float = 50         # miles, skip fueling this close to the end of a leg
+
+
+DEFAULT_RULES = RuleSet()
+
+
+@dataclass(slots=True)
+class Leg:
+    """A straight-line leg between two waypoints"""
+    start: tuple
+    end: tuple
+    miles: float
+    hours: float
+
+    def position_at(self, miles):
+        fraction = miles / self.miles if self.miles else 1.0
+        return interpolate_position(self.start, self.end, fraction)
+
+
+@dataclass(slots=True)
+class PlannedStop:
+    point_type: str
+    latitude: float
+    longitude: float
+    arrival_time: datetime.datetime
+    departure_time: datetime.datetime
+    duration: int                      # minutes
+    miles: float = 0.0                 # odometer, miles from the start of the trip
+    leg: int = 0                       # index of the leg the stop is on or ends
+    location: str = ''                 # filled in by the caller
+
+
+@dataclass(slots=True)
+class Plan:
+    stops: list
+    start_time: datetime.datetime
+    total_miles: float = 0.0
+    driving_hours: float = 0.0
+    on_duty_hours: float = 0.0
+
+    @property
+    def end_time(self):
+        return self.stops[-1].departure_time
+
+    @property
+    def total_hours(self):
+        return (self.end_time - self.start_time).total_seconds() / 3600
+
+
+@dataclass(slots=True)
+class DailyLog:
+    log_date: datetime.date
+    starting_location: str
+    ending_location: str
+    off_duty_periods: list = field(default_factory=list)
+    sleeper_berth_periods: list = field(default_factory=list)
+    driving_periods: list = field(default_factory=list)
+    on_duty_periods: list = field(default_factory=list)
+    timeline: bytes = b''                # timeline.DutyTimeline bytes
+
+
+@dataclass(slots=True)
+class DriverState:
+    """HOS counters carried into a plan that starts mid-shift, all in hours except since_fuel"""
+    since_break: float = 0.0
+    shift_drive: float = 0.0
+    shift_elapsed: float = 0.0
+    since_fuel: float = 0.0            # miles
+
+
+def haversine_miles(a, b):
+    """Great-circle distance in miles between two (lat, lng) pairs"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+
+def geodesic_miles(a, b):
+    """WGS-84 geodesic distance in miles (slower, more accurate than haversine)"""
+    from geopy.distance import geodesic
+    return geodesic(a, b).miles
+
+
+def interpolate_position(start, end, fraction):
+    """Calculate a position along a straight line between start and end"""
+    return (
+        start[0] + (end[0] - start[0]) * fraction,
+        start[1] + (end[1] - start[1]) * fraction
+    )
+
+
+def build_legs(waypoints, rules=DEFAULT_RULES, distance=haversine_miles):
+    """Straight-line legs between consecutive waypoints"""
+    legs = []
+    for start, end in zip(waypoints, waypoints[1:]):
+        miles = distance(start, end)
+        legs.append(Leg(start, end, miles, miles / rules.average_speed))
+    return legs
+
+
+class _Clock:
+    """Mutable HOS counters for one simulated driver, all in hours"""
+    __slots__ = ('t', 'since_break', 'shift_drive', 'shift_start', 'cycle', 'since_fuel',
+                 'driving', 'on_duty')
+
+    def __init__(self, cycle_hours, state=None):
+        state = state or DriverState()
+        self.t = 0.0
+        self.since_break = state.since_break
+        self.shift_drive = state.shift_drive
+        self.shift_start = -state.shift_elapsed
+        self.cycle = cycle_hours
+        self.since_fuel = state.since_fuel
+        self.driving = 0.0
+        self.on_duty = 0.0
+
+
+class _Cycle:
+    """On-duty hours per calendar day, for a cycle limit that rolls over a window of days"""
+    __slots__ = ('hours', 'today', 'midnight', 'days')
+
+    def __init__(self, history, start_time, rules):
+        self.days = rules.cycle_days
+        self.hours = [float(hours) for hours in history[-self.days:]] or [0.0]
+        self.today = len(self.hours) - 1
+        # Hours from the start day's midnight to start_time
+        self.midnight = (start_time - start_time.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds() / 3600
+
+    def day(self, t):
+        return self.today + int((self.midnight + t) // 24)
+
+    def add(self, t, hours):
+        """Count on-duty time from t, split at midnights"""
+        while hours > EPSILON:
+            day = self.day(t)
+            to_midnight = (day - self.today + 1) * 24 - self.midnight - t
+            part = min(hours, max(to_midnight, EPSILON))
+            self.hours.extend([0.0] * (day + 1 - len(self.hours)))
+            self.hours[day] += part
+            t += part
+            hours -= part
+
+    def used(self, t):
+        return self.used_on(self.day(t))
+
+    def used_on(self, day):
+        return sum(self.hours[max(0, day - self.days + 1):day + 1])
+
+    def restart(self):
+        self.hours = [0.0] * len(self.hours)
+
+    def recovery_wait(self, t, rules):
+        """Hours from t until old duty rolls out of the window, or None if a restart would be sooner"""
+        day = self.day(t)
+        for ahead in range(1, self.days + 1):
+            wait = (day - self.today + ahead) * 24 - self.midnight - t
+            if wait > rules.restart_period:
+                return None
+            if self.used_on(day + ahead) <= rules.cycle_limit - MIN_RECOVERY:
+                return wait
+        return None
+
+
+def plan_trip(waypoints, start_time, cycle_hours=0.0, rules=DEFAULT_RULES, distance=haversine_miles,
+              legs=None, state=None, stop_types=None, windows=None, history=None, facilities=None):
+    """Plan a trip through waypoints (start, pickup(s)..., dropoff).
+
+    Drives each leg until the next HOS or fuel limit, inserting 30 minute
+    breaks, 10 hour rests, 34 hour restarts and fuel stops as they come
+    due. A DriverState continues a shift already in progress. stop_types
+    names the stop at the end of each leg (PICKUP, then DROPOFF for the
+    last, by default). windows holds an (opens, closes) pair of datetimes
+    or None per leg end; arriving before a window opens adds an off-duty
+    wait.
+
+    history, if given, replaces cycle_hours with on-duty hours per day for
+    the days up to and including the start day, oldest first. Duty then
+    rolls out of the cycle window at midnight, and hitting the cycle limit
+    means resting until enough has rolled out when that comes before a
+    34 hour restart would end.
+
+    facilities, a facilities.FacilityIndex, moves each fuel or rest stop
+    back to the last suitable facility before it falls due, and names the
+    stop after it. Returns a Plan whose stops carry absolute times and
+    odometer miles.
+    """
+    if legs is None:
+        legs = build_legs(waypoints, rules, distance)
+    cycle = _Cycle(history, start_time, rules) if history is not None else None
+    clock = _Clock(cycle.used(0.0) if cycle else cycle_hours, state)
+    stops = []
+    odometer = 0.0
+
+    def work(start, hours):
+        """Count on-duty hours toward the cycle"""
+        if cycle is None:
+            clock.cycle += hours
+        else:
+            cycle.add(start, hours)
+            clock.cycle = cycle.used(start + hours)
+
+    def add_stop(point_type, position, minutes, leg, location=''):
+        arrival = start_time + datetime.timedelta(hours=clock.t)
+        stops.append(PlannedStop(
+            point_type, position[0], position[1], arrival,
+            arrival + datetime.timedelta(minutes=minutes), minutes, odometer, leg, location,
+        ))
+        clock.t += minutes / 60
+
+    add_stop(START, waypoints[0], 0, 0)
+
+    for index, leg in enumerate(legs):
+        speed = leg.miles / leg.hours if leg.hours else rules.average_speed
+        covered = 0.0
+        while leg.miles - covered > EPSILON:
+            remaining = leg.miles - covered
+            hours_left = max(0.0, min(
+                rules.break_after - clock.since_break,
+                rules.driving_limit - clock.shift_drive,
+                rules.duty_limit - (clock.t - clock.shift_start),
+                rules.cycle_limit - clock.cycle,
+            ))
+            step = min(remaining, hours_left * speed)
+            to_fuel = max(0.0, rules.fuel_distance - clock.since_fuel)
+            if to_fuel < remaining - rules.fuel_tolerance:
+                step = min(step, to_fuel)
+
+            # Stopping early at a facility brings every limit due within lead miles forward
+            facility = None
+            lead = 0.0
+            if facilities is not None and step < remaining - EPSILON:
+                fuel = clock.since_fuel + step >= rules.fuel_distance - EPSILON
+                facility, along = facilities.best_before(leg, covered + step, covered + MIN_SNAP_MILES, fuel)
+                if facility is not None:
+                    lead = covered + step - along
+                    step = along - covered
+            lead_hours = lead / speed
+
+            # Drive to the next limit or the end of the leg
+            hours = step / speed
+            work(clock.t, hours)
+            clock.t += hours
+            clock.since_break += hours
+            clock.shift_drive += hours
+            clock.driving += hours
+            clock.since_fuel += step
+            covered += step
+            odometer += step
+            if leg.miles - covered <= EPSILON:
+                break
+
+            position = leg.position_at(covered)
+            location = ''
+            fuel_lead = 0.0
+            if facility is not None:
+                position = (facility.latitude, facility.longitude)
+                location = facility.label
+                fuel_lead = lead if facility.fuel else 0.0
+            if clock.since_fuel >= rules.fuel_distance - fuel_lead - EPSILON:
+                work(clock.t, rules.fuel_duration / 60)
+                add_stop(FUEL, position, rules.fuel_duration, index, location)
+                clock.on_duty += rules.fuel_duration / 60
+                clock.since_fuel = 0.0
+                # A non-driving period of break length satisfies the 30 minute break
+                if rules.fuel_duration >= rules.break_duration:
+                    clock.since_break = 0.0
+
+            wait = None
+            if cycle is not None and clock.cycle >= rules.cycle_limit - lead_hours - EPSILON:
+                wait = cycle.recovery_wait(clock.t, rules)
+            if wait is not None:
+                # Rest until enough old duty leaves the cycle window
+                add_stop(REST, position, math.ceil(max(wait, rules.rest_period) * 60), index, location)
+                _start_shift(clock)
+                clock.cycle = cycle.used(clock.t)
+            elif clock.cycle >= rules.cycle_limit - lead_hours - EPSILON:
+                add_stop(REST, position, int(rules.restart_period * 60), index, location)
+                _start_shift(clock)
+                clock.cycle = 0.0
+                if cycle is not None:
+                    cycle.restart()
+            elif (clock.shift_drive >= rules.driving_limit - lead_hours - EPSILON
+                    or clock.t - clock.shift_start >= rules.duty_limit - lead_hours - EPSILON):
+                add_stop(REST, position, int(rules.rest_period * 60), index, location)
+                _start_shift(clock)
+            elif clock.since_break >= rules.break_after - lead_hours - EPSILON:
+                add_stop(REST, position, rules.break_duration, index, location)
+                clock.since_break = 0.0
+
+        opens = windows[index][0] if windows and windows[index] else None
+        if opens is not None:
+            wait = (opens - start_time).total_seconds() / 3600 - clock.t
+            if wait * 60 >= 1:
+                restarted = _wait(clock, rules, add_stop, leg.end, math.ceil(wait * 60), index)
+                if cycle is not None:
+                    if restarted:
+                        cycle.restart()
+                    clock.cycle = cycle.used(clock.t)
+
+        if stop_types:
+            point_type = stop_types[index]
+        else:
+            point_type = DROPOFF if index == len(legs) - 1 else PICKUP
+        work(clock.t, rules.pickup_dropoff_time / 60)
+        add_stop(point_type, leg.end, rules.pickup_dropoff_time, index)
+        clock.on_duty += rules.pickup_dropoff_time / 60
+
+    return Plan(
+        stops=stops,
+        start_time=start_time,
+        total_miles=odometer,
+        driving_hours=clock.driving,
+        on_duty_hours=clock.driving + clock.on_duty,
+    )
+
+
+def _wait(clock, rules, add_stop, position, minutes, index):
+    """Wait off duty for a time window; long enough waits count as a break, rest or restart.
+
+    Returns True if the wait restarted the cycle.
+    """
+    add_stop(REST, position, minutes, index)
+    hours = minutes / 60
+    if hours >= rules.restart_period - EPSILON:
+        _start_shift(clock)
+        clock.cycle = 0.0
+        return True
+    if hours >= rules.rest_period - EPSILON:
+        _start_shift(clock)
+    elif minutes >= rules.break_duration - EPSILON:
+        clock.since_break = 0.0
+    return False
+
+
+def _start_shift(clock):
+    clock.shift_start = clock.t
+    clock.shift_drive = 0.0
+    clock.since_break = 0.0
+
+
+STATUS_AT_STOP = {
+    PICKUP: timeline.ON_DUTY,
+    STOP: timeline.ON_DUTY,
+    DROPOFF: timeline.ON_DUTY,
+    FUEL: timeline.ON_DUTY,
+    REST: timeline.OFF_DUTY,
+    START: timeline.ON_DUTY,
+}
+
+
+def driver_state_at(points, moment, rules=DEFAULT_RULES):
+    """Replay completed stops up to moment and return the DriverState there.
+
+    points are objects with point_type, arrival_time and departure_time
+    (PlannedStop or RoutePoint), sorted by arrival. Time between stops and
+    from the last departure to moment is driving at rules.average_speed.
+    """
+    state = DriverState()
+
+    def drive(hours):
+        state.since_break += hours
+        state.shift_drive += hours
+        state.shift_elapsed += hours
+        state.since_fuel += hours * rules.average_speed
+
+    previous = None
+    for point in points:
+        if point.arrival_time > moment:
+            break
+        if previous is not None:
+            drive(max(0.0, (point.arrival_time - previous).total_seconds() / 3600))
+        departure = min(point.departure_time or point.arrival_time, moment)
+        hours = (departure - point.arrival_time).total_seconds() / 3600
+        state.shift_elapsed += hours
+        if hours * 60 >= rules.break_duration - EPSILON:
+            state.since_break = 0.0
+        if point.point_type == FUEL:
+            state.since_fuel = 0.0
+        if point.point_type == REST and hours >= rules.rest_period - EPSILON:
+            state.shift_drive = state.shift_elapsed = 0.0
+        previous = departure
+    if previous is not None:
+        drive(max(0.0, (moment - previous).total_seconds() / 3600))
+    return state
+
+
+def build_daily_logs(points):
+    """Split a trip's stops into per-day duty-status logs in one sweep.
+
+    points are objects with point_type, location, arrival_time and
+    departure_time attributes (PlannedStop or RoutePoint) with aware or
+    consistently naive datetimes. Driving between stops and the activity
+    at each stop are cut at midnight as they are visited, and every
+    calendar day from the first arrival to the last departure gets a log.
+    Minutes outside the trip are off duty.
+    """
+    points = sorted(points, key=lambda point: point.arrival_time)
+    if not points:
+        return []
+
+    first_day = points[0].arrival_time.date()
+    origin = datetime.datetime.combine(first_day, datetime.time.min, tzinfo=points[0].arrival_time.tzinfo)
+
+    def minute(moment):
+        return round((moment - origin).total_seconds() / 60)
+
+    logs = []
+    day_timeline = timeline.DutyTimeline()
+    day_start = 0
+    day_location = points[0].location
+
+    def mark(start, end, status, location):
+        """Mark [start, end) minutes since origin, closing days as midnight is crossed"""
+        nonlocal day_timeline, day_start, day_location
+        while end > day_start + timeline.MINUTES_PER_DAY:
+            day_timeline.mark(start - day_start, timeline.MINUTES_PER_DAY, status)
+            close_day(location)
+            start = max(start, day_start)
+        day_timeline.mark(start - day_start, end - day_start, status)
+
+    def close_day(ending_location):
+        nonlocal day_timeline, day_start, day_location
+        day_timeline.fill(timeline.OFF_DUTY)
+        periods = day_timeline.to_periods()
+        logs.append(DailyLog(
+            log_date=first_day + datetime.timedelta(days=day_start // timeline.MINUTES_PER_DAY),
+            starting_location=day_location,
+            ending_location=ending_location,
+            timeline=day_timeline.to_bytes(),
+            **periods,
+        ))
+        day_timeline = timeline.DutyTimeline()
+        day_start += timeline.MINUTES_PER_DAY
+        day_location = ending_location
+
+    previous = None
+    for point in points:
+        arrival = minute(point.arrival_time)
+        if previous is not None:
+            mark(minute(previous.departure_time or previous.arrival_time), arrival, timeline.DRIVING, previous.location)
+        departure = minute(point.departure_time or point.arrival_time)
+        mark(arrival, departure, STATUS_AT_STOP[point.point_type], point.location)
+        previous = point
+
+    close_day(previous.location)
+    return logs
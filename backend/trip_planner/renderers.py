@@ -0,0 +1,31 @@
+"""JSON renderers for the trip API.
+
+ORJSONRenderer produces the same bytes as DRF's JSONRenderer for our
+payloads, encoding with orjson when it is installed. Dates and times are
+passed back to DRF's encoder so their format does not change. Indented
+output, as asked for by the browsable API, still goes through the
+standard library.
+
+ColumnarRenderer is selected with ``?format=columnar``. Views that offer
+it check request.accepted_renderer.format and return parallel arrays
+instead of a list of objects.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+class ColumnarRenderer(ORJSONRenderer):
+    format = 'columnar'
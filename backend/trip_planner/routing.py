@@ -0,0 +1,373 @@
+"""Shortest-path routing over a local road graph.
+
+The graph is loaded once from an extract file derived offline from
+OpenStreetMap, either JSON:
+
+    {"nodes": [[lat, lng], ...],
+     "edges": [[from, to, miles, mph, oneway], ...]}
+
+or a NumPy .npz archive with the same data as arrays (lat, lng, src,
+dst, miles, mph, oneway). Queries run on a contraction hierarchy: nodes
+are ranked by importance and shortcut edges added so that a bidirectional
+search only ever moves up the ranking, settling a few hundred nodes even
+on cross-country routes. Contracting a large graph takes minutes, so
+``manage.py prepare_road_graph`` does it offline and saves the ranks and
+shortcuts into the .npz; an extract without them is contracted at load.
+Nodes and edges are held in flat NumPy arrays, and the configured graph
+is loaded when the app starts rather than by the first request to route.
+"""
+import bisect
+import heapq
+import json
+import math
+import threading
+from dataclasses import dataclass
+import numpy as np
+from django.conf import settings
+from .planner import haversine_miles, interpolate_position
+
+DEFAULTS = {
+    'GRAPH_PATH': None,      # road graph extract; straight-line legs are used when unset
+}
+
+# Arrays saved by prepare_road_graph; an extract holding them is not contracted again
+PREPARED = ['lat', 'lng', 'src', 'dst', 'miles', 'hours', 'first', 'second', 'rank']
+WITNESS_SETTLE_LIMIT = 200   # nodes a witness search settles before giving up and adding the shortcut
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'ROUTING', {})}
+
+
+@dataclass(slots=True)
+class RoadLeg:
+    """A routed leg; positions are found by walking the polyline"""
+    start: tuple
+    end: tuple
+    miles: float
+    hours: float
+    polyline: list           # [(lat, lng), ...]
+    cumulative: list         # miles from the start of the leg to each polyline vertex
+
+    def position_at(self, miles):
+        if miles <= 0:
+            return self.polyline[0]
+        if miles >= self.cumulative[-1]:
+            return self.polyline[-1]
+        i = bisect.bisect_right(self.cumulative, miles)
+        segment = self.cumulative[i] - self.cumulative[i - 1]
+        fraction = (miles - self.cumulative[i - 1]) / segment if segment else 0.0
+        return interpolate_position(self.polyline[i - 1], self.polyline[i], fraction)
+
+
+def contract(node_count, sources, targets, hours):
+    """Order nodes and add the shortcuts a contraction hierarchy needs.
+
+    Nodes are contracted least important first, importance being twice
+    the shortcuts contracting a node would add less the edges it removes,
+    plus how many of its neighbours are already contracted and how deep in
+    the hierarchy it already sits, which spreads contraction evenly. Returns
+    (rank per node, [(from, to, hours, first edge, second edge), ...])
+    where shortcut edges are numbered after the given ones.
+    """
+    outgoing = [{} for _ in range(node_count)]      # node -> {neighbour: (hours, edge)}
+    incoming = [{} for _ in range(node_count)]
+    for edge, (source, target, cost) in enumerate(zip(sources, targets, hours)):
+        if source != target and cost < outgoing[source].get(target, (math.inf,))[0]:
+            outgoing[source][target] = incoming[target][source] = (cost, edge)
+
+    def witness_costs(source, skip, limit):
+        """Hours from source to nodes within limit, avoiding skip; may overestimate past the settle limit"""
+        best = {source: 0.0}
+        queue = [(0.0, source)]
+        settled = 0
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if cost > limit or settled == WITNESS_SETTLE_LIMIT:
+                break
+            if cost > best[node]:
+                continue
+            settled += 1
+            for neighbor, (edge_hours, _) in outgoing[node].items():
+                new_cost = cost + edge_hours
+                if neighbor != skip and new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    heapq.heappush(queue, (new_cost, neighbor))
+        return best
+
+    def shortcuts(node):
+        needed = []
+        for source, (in_hours, in_edge) in incoming[node].items():
+            ahead = [(target, out) for target, out in outgoing[node].items() if target != source]
+            if not ahead:
+                continue
+            best = witness_costs(source, node, in_hours + max(out[0] for _, out in ahead))
+            for target, (out_hours, out_edge) in ahead:
+                if best.get(target, math.inf) > in_hours + out_hours:
+                    needed.append((source, target, in_hours + out_hours, in_edge, out_edge))
+        return needed
+
+    contracted_neighbors = [0] * node_count
+    level = [0] * node_count
+
+    def priority(node, needed):
+        edge_difference = len(needed) - len(incoming[node]) - len(outgoing[node])
+        return 2 * edge_difference + contracted_neighbors[node] + level[node]
+
+    queue = [(priority(node, shortcuts(node)), node) for node in range(node_count)]
+    heapq.heapify(queue)
+    rank = [0] * node_count
+    added = []
+    next_edge = len(sources)
+    for order in range(node_count):
+        while True:
+            _, node = heapq.heappop(queue)
+            needed = shortcuts(node)
+            # Priorities go stale as neighbours are contracted; recheck before committing
+            current = priority(node, needed)
+            if not queue or current <= queue[0][0]:
+                break
+            heapq.heappush(queue, (current, node))
+        rank[node] = order
+        for source, target, cost, first, second in needed:
+            if cost < outgoing[source].get(target, (math.inf,))[0]:
+                outgoing[source][target] = incoming[target][source] = (cost, next_edge)
+            added.append((source, target, cost, first, second))
+            next_edge += 1
+        for source in incoming[node]:
+            del outgoing[source][node]
+            contracted_neighbors[source] += 1
+            level[source] = max(level[source], level[node] + 1)
+        for target in outgoing[node]:
+            del incoming[target][node]
+            contracted_neighbors[target] += 1
+            level[target] = max(level[target], level[node] + 1)
+        incoming[node] = outgoing[node] = {}
+    return rank, added
+
+
+def _upward(node_count, keep, group, heads, edges, hours):
+    """CSR arrays over the edges in keep, grouped by node: (offsets, neighbours, hours, edge ids)"""
+    chosen = np.flatnonzero(keep)
+    chosen = chosen[np.argsort(group[chosen], kind='stable')]
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group[chosen], minlength=node_count), out=offsets[1:])
+    return offsets, heads[chosen], hours[chosen], edges[chosen]
+
+
+class RoadGraph:
+    """A contracted road graph.
+
+    Edges are directed. The first road_edges of them are road segments;
+    the rest are shortcuts, each standing for the pair of edges first and
+    second. An edge is searched forwards from the lower ranked of its ends.
+    """
+
+    def __init__(self, lat, lng, src, dst, miles, hours, first, second, rank, road_edges=None):
+        self.latitudes = np.asarray(lat, dtype=np.float64)
+        self.longitudes = np.asarray(lng, dtype=np.float64)
+        self.sources = np.asarray(src, dtype=np.int32)
+        self.targets = np.asarray(dst, dtype=np.int32)
+        self.miles = np.asarray(miles, dtype=np.float64)
+        self.hours = np.asarray(hours, dtype=np.float64)
+        self.first = np.asarray(first, dtype=np.int32)
+        self.second = np.asarray(second, dtype=np.int32)
+        self.rank = np.asarray(rank, dtype=np.int32)
+        self.road_edges = int(np.count_nonzero(self.first < 0)) if road_edges is None else road_edges
+        node_count = len(self.latitudes)
+
+        lat_radians, lng_radians = np.radians(self.latitudes), np.radians(self.longitudes)
+        self.vectors = np.column_stack([
+            np.cos(lat_radians) * np.cos(lng_radians), np.cos(lat_radians) * np.sin(lng_radians), np.sin(lat_radians),
+        ])
+        edges = np.arange(len(self.sources), dtype=np.int32)
+        source_rank, target_rank = self.rank[self.sources], self.rank[self.targets]
+        self.up = _upward(node_count, source_rank < target_rank, self.sources, self.targets, edges, self.hours)
+        self.down = _upward(node_count, source_rank > target_rank, self.targets, self.sources, edges, self.hours)
+
+    @classmethod
+    def from_edges(cls, latitudes, longitudes, edges):
+        """Contract a graph given as node coordinates and (from, to, miles, mph) directed edges"""
+        edges = list(edges)
+        sources = [edge[0] for edge in edges]
+        targets = [edge[1] for edge in edges]
+        miles = [edge[2] for edge in edges]
+        hours = [edge[2] / edge[3] for edge in edges]
+        rank, shortcuts = contract(len(latitudes), sources, targets, hours)
+        first = [-1] * len(edges)
+        second = [-1] * len(edges)
+        for source, target, cost, first_edge, second_edge in shortcuts:
+            sources.append(source)
+            targets.append(target)
+            miles.append(miles[first_edge] + miles[second_edge])
+            hours.append(cost)
+            first.append(first_edge)
+            second.append(second_edge)
+        return cls(latitudes, longitudes, sources, targets, miles, hours, first, second, rank, road_edges=len(edges))
+
+    @classmethod
+    def load(cls, path):
+        path = str(path)
+        if path.endswith('.npz'):
+            data = np.load(path)
+            if all(key in data for key in PREPARED):
+                return cls(**{key: data[key] for key in PREPARED})
+            nodes = (data['lat'].tolist(), data['lng'].tolist())
+            raw_edges = zip(data['src'].tolist(), data['dst'].tolist(), data['miles'].tolist(),
+                            data['mph'].tolist(), data['oneway'].tolist())
+        else:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            nodes = ([node[0] for node in data['nodes']], [node[1] for node in data['nodes']])
+            raw_edges = ((*edge[:4], edge[4] if len(edge) > 4 else False) for edge in data['edges'])
+
+        edges = []
+        for source, target, miles, mph, oneway in raw_edges:
+            edges.append((int(source), int(target), float(miles), float(mph)))
+            if not oneway:
+                edges.append((int(target), int(source), float(miles), float(mph)))
+        return cls.from_edges(nodes[0], nodes[1], edges)
+
+    def save(self, path):
+        """Write the contracted graph as an .npz archive that load() reads without contracting"""
+        np.savez(
+            path, lat=self.latitudes, lng=self.longitudes, src=self.sources, dst=self.targets,
+            miles=self.miles, hours=self.hours, first=self.first, second=self.second, rank=self.rank,
+        )
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def coords(self, node):
+        return (float(self.latitudes[node]), float(self.longitudes[node]))
+
+    def nearest_node(self, coords):
+        lat, lng = math.radians(coords[0]), math.radians(coords[1])
+        point = np.array([math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat)])
+        # The largest dot product is the smallest great-circle distance
+        return int(np.argmax(self.vectors @ point))
+
+    def shortest_path(self, source, target):
+        """Fastest path as a list of road edge indices, or None if unreachable.
+
+        Searches upwards from source and, along reversed edges, from target,
+        until neither search can improve on the best meeting point.
+        """
+        if source == target:
+            return []
+        best = ({source: 0.0}, {target: 0.0})
+        parents = ({source: -1}, {target: -1})         # node -> edge it was reached by
+        queues = ([(0.0, source)], [(0.0, target)])
+        shortest, meeting = math.inf, None
+        while True:
+            tops = [queue[0][0] if queue and queue[0][0] < shortest else math.inf for queue in queues]
+            side = 0 if tops[0] <= tops[1] else 1
+            if tops[side] == math.inf:
+                break
+            cost, node = heapq.heappop(queues[side])
+            if cost > best[side][node]:
+                continue
+            other = best[1 - side].get(node)
+            if other is not None and cost + other < shortest:
+                shortest, meeting = cost + other, node
+            seen, parent, queue = best[side], parents[side], queues[side]
+            # Stall on demand: a node reached faster from a higher ranked one is not on a shortest up-down path
+            offsets, heads, hours, _ = self.down if side == 0 else self.up
+            start, end = offsets[node], offsets[node + 1]
+            if any(seen.get(higher, math.inf) + edge_hours < cost
+                   for higher, edge_hours in zip(heads[start:end].tolist(), hours[start:end].tolist())):
+                continue
+            offsets, heads, hours, edges = self.up if side == 0 else self.down
+            start, end = offsets[node], offsets[node + 1]
+            for neighbor, edge_hours, edge in zip(heads[start:end].tolist(), hours[start:end].tolist(),
+                                                  edges[start:end].tolist()):
+                new_cost = cost + edge_hours
+                if new_cost < seen.get(neighbor, math.inf):
+                    seen[neighbor] = new_cost
+                    parent[neighbor] = edge
+                    heapq.heappush(queue, (new_cost, neighbor))
+        if meeting is None:
+            return None
+
+        path = []
+        node = meeting
+        while parents[0][node] != -1:
+            path.append(parents[0][node])
+            node = int(self.sources[path[-1]])
+        path.reverse()
+        node = meeting
+        while parents[1][node] != -1:
+            path.append(parents[1][node])
+            node = int(self.targets[path[-1]])
+        return self._unpack(path)
+
+    def _unpack(self, path):
+        """Expand shortcuts into the road edges they stand for"""
+        road = []
+        stack = path[::-1]
+        while stack:
+            edge = stack.pop()
+            if edge < self.road_edges:
+                road.append(edge)
+            else:
+                stack.append(int(self.second[edge]))
+                stack.append(int(self.first[edge]))
+        return road
+
+    def route(self, start, end, access_mph=30):
+        """Route between two coordinates.
+
+        The start and end are joined to their nearest graph nodes by straight
+        access segments driven at access_mph. Returns a RoadLeg, or None if
+        the nodes are not connected.
+        """
+        source = self.nearest_node(start)
+        target = self.nearest_node(end)
+        path = self.shortest_path(source, target)
+        if path is None:
+            return None
+
+        polyline = [tuple(start)]
+        cumulative = [0.0]
+        miles = hours = 0.0
+
+        def extend(point, segment_miles, segment_hours):
+            nonlocal miles, hours
+            miles += segment_miles
+            hours += segment_hours
+            polyline.append(point)
+            cumulative.append(miles)
+
+        access = haversine_miles(start, self.coords(source))
+        extend(self.coords(source), access, access / access_mph)
+        for edge in path:
+            extend(self.coords(self.targets[edge]), float(self.miles[edge]), float(self.hours[edge]))
+        access = haversine_miles(self.coords(target), end)
+        extend(tuple(end), access, access / access_mph)
+        return RoadLeg(tuple(start), tuple(end), miles, hours, polyline, cumulative)
+
+
+def build_road_legs(graph, waypoints, fallback):
+    """Route each leg on the graph, using fallback(start, end) where there is no path"""
+    legs = []
+    for start, end in zip(waypoints, waypoints[1:]):
+        leg = graph.route(start, end)
+        legs.append(leg if leg is not None else fallback(start, end))
+    return legs
+
+
+_graph = None
+_graph_loaded = False
+_graph_lock = threading.Lock()
+
+
+def get_road_graph():
+    """Return the process-wide road graph, or None if ROUTING['GRAPH_PATH'] is not set"""
+    global _graph, _graph_loaded
+    if not _graph_loaded:
+        with _graph_lock:
+            if not _graph_loaded:
+                path = get_options()['GRAPH_PATH']
+                _graph = RoadGraph.load(path) if path else None
+                _graph_loaded = True
+    return _graph
@@ -0,0 +1,135 @@
+"""Stop sequencing for multi-stop trips.
+
+Orders the intermediate stops of a trip so the driver covers them in the
+least time, keeping the origin and pickup first and the dropoff last. A
+haversine distance matrix is computed once with NumPy, a nearest-neighbour
+tour is built from it and then improved with 2-opt segment reversals.
+
+Stops may carry time windows. Arriving early means waiting for the window
+to open; arriving late is penalized heavily, so a feasible order is always
+preferred. Arrival times here count driving and service time only; the HOS
+planner adds breaks and rests when the chosen order is planned.
+"""
+import numpy as np
+from .planner import DEFAULT_RULES, EARTH_RADIUS_MILES, EPSILON
+
+LATE_PENALTY = 100       # cost hours per hour of arriving after a window closes
+MAX_PASSES = 50          # 2-opt passes over the tour before giving up on further gains
+
+
+def distance_matrix(points):
+    """(n, n) array of great-circle miles between every pair of (lat, lng) points"""
+    points = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lat = points[:, 0]
+    lng = points[:, 1]
+    h = (np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+         + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin((lng[:, None] - lng[None, :]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+class _Tour:
+    """Travel times, service times and windows, in hours from the start, indexed by waypoint"""
+
+    def __init__(self, hours, service, opens, closes):
+        self.hours = hours
+        self.service = service
+        self.opens = opens
+        self.closes = closes
+        self.timed = any(value is not None for value in opens + closes)
+
+    def cost(self, order):
+        """(finish time plus lateness penalty, hours late) for visiting waypoints in order"""
+        t = 0.0
+        late = 0.0
+        for a, b in zip(order, order[1:]):
+            t += self.hours[a][b]
+            if self.opens[b] is not None and t < self.opens[b]:
+                t = self.opens[b]
+            if self.closes[b] is not None and t > self.closes[b]:
+                late += t - self.closes[b]
+            t += self.service[b]
+        return t + LATE_PENALTY * late, late
+
+
+def sequence_stops(waypoints, windows=None, start_time=None, rules=DEFAULT_RULES, fixed=2):
+    """Return the order to visit waypoints in, as a list of their indices.
+
+    The first ``fixed`` waypoints (origin and pickup) keep their places and
+    the last one (the dropoff) stays last; the ones between are reordered.
+    windows, if given, holds an (opens, closes) pair of datetimes or None
+    for each waypoint, measured against start_time.
+    """
+    count = len(waypoints)
+    if count - fixed - 1 < 2:
+        return list(range(count))
+
+    hours = (distance_matrix(waypoints) / rules.average_speed).tolist()
+    service = [0.0] + [rules.pickup_dropoff_time / 60] * (count - 1)
+    opens = [None] * count
+    closes = [None] * count
+    for index, window in enumerate(windows or []):
+        if window is None:
+            continue
+        opens[index], closes[index] = (
+            (moment - start_time).total_seconds() / 3600 if moment else None for moment in window
+        )
+    tour = _Tour(hours, service, opens, closes)
+
+    order = _nearest_neighbour(tour, list(range(fixed)), list(range(fixed, count - 1)))
+    order.append(count - 1)
+    return _two_opt(tour, order, fixed)
+
+
+def _nearest_neighbour(tour, order, remaining):
+    """Extend order by repeatedly visiting the stop that can be served soonest"""
+    t = tour.cost(order)[0]
+    remaining = list(remaining)
+    while remaining:
+        current = order[-1]
+        best = None
+        for candidate in remaining:
+            arrival = t + tour.hours[current][candidate]
+            ready = max(arrival, tour.opens[candidate] or 0.0)
+            late = max(0.0, ready - tour.closes[candidate]) if tour.closes[candidate] is not None else 0.0
+            score = ready + LATE_PENALTY * late
+            if best is None or score < best[0]:
+                best = (score, candidate, ready)
+        _, chosen, ready = best
+        order.append(chosen)
+        remaining.remove(chosen)
+        t = ready + tour.service[chosen]
+    return order
+
+
+def _two_opt(tour, order, fixed):
+    """Reverse segments of the movable part of order while that shortens the tour.
+
+    Without windows the change in travel time decides in constant time;
+    with windows a shorter candidate, or any candidate while the tour is
+    late, is re-timed in full.
+    """
+    hours = tour.hours
+    best, late = tour.cost(order)
+    last = len(order) - 1
+    for _ in range(MAX_PASSES):
+        improved = False
+        for i in range(fixed, last - 1):
+            for k in range(i + 1, last):
+                a, b, c, d = order[i - 1], order[i], order[k], order[k + 1]
+                delta = hours[a][c] + hours[b][d] - hours[a][b] - hours[c][d]
+                if not tour.timed:
+                    if delta < -EPSILON:
+                        order[i:k + 1] = order[i:k + 1][::-1]
+                        best += delta
+                        improved = True
+                    continue
+                if delta >= 0 and late <= EPSILON:
+                    continue
+                candidate = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+                cost, candidate_late = tour.cost(candidate)
+                if cost < best - EPSILON:
+                    order, best, late = candidate, cost, candidate_late
+                    improved = True
+        if not improved:
+            break
+    return order
@@ -1,24 +1,246 @@
+import datetime
+from django.db import models, transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Trip, RoutePoint, ELDLog
+from .models import Driver, Trip, TripStop
+from .ledger import cycle_hours_used
 
-class RoutePointSerializer(serializers.ModelSerializer):
+MAX_STOPS = 100
+MAX_CANDIDATES = 20
+
+def _datetime(value, tz):
+    """DateTimeField's ISO 8601 representation, without the per-field machinery"""
+    if value is None:
+        return None
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+class _RecordListSerializer(serializers.ListSerializer):
+    """Looks the current timezone up once per list rather than once per datetime"""
+    def to_representation(self, data):
+        tz = timezone.get_current_timezone()
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return [self.child.to_representation(item, tz) for item in iterable]
+
+class RoutePointSerializer(serializers.BaseSerializer):
+    """Read-only; the output of a ModelSerializer over the same fields, built directly"""
+    class Meta:
+        list_serializer_class = _RecordListSerializer
+
+    def to_representation(self, point, tz=None):
+        tz = tz or timezone.get_current_timezone()
+        return {
+            'id': point.id,
+            'point_type': point.point_type,
+            'location': point.location,
+            'latitude': point.latitude,
+            'longitude': point.longitude,
+            'arrival_time': _datetime(point.arrival_time, tz),
+            'departure_time': _datetime(point.departure_time, tz),
+            'duration': point.duration,
+        }
+
+class ELDLogSerializer(serializers.BaseSerializer):
+    """Read-only; the output of a ModelSerializer over the same fields, built directly"""
     class Meta:
-        model = RoutePoint
-        fields = ['id', 'point_type', 'location', 'latitude', 'longitude', 
-                'arrival_time', 'departure_time', 'duration']
+        list_serializer_class = _RecordListSerializer
+
+    def to_representation(self, log, tz=None):
+        return {
+            'id': log.id,
+            'log_date': log.log_date.isoformat(),
+            'off_duty_periods': log.off_duty_periods,
+            'sleeper_berth_periods': log.sleeper_berth_periods,
+            'driving_periods': log.driving_periods,
+            'on_duty_periods': log.on_duty_periods,
+            'starting_location': log.starting_location,
+            'ending_location': log.ending_location,
+        }
+
+def encode_polyline(points, precision=5):
+    """Encode (lat, lng) pairs in the Google encoded polyline format"""
+    factor = 10 ** precision
+    chunks = []
+    previous = (0, 0)
+    for lat, lng in points:
+        current = (round(lat * factor), round(lng * factor))
+        for value in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return ''.join(chunks)
 
-class ELDLogSerializer(serializers.ModelSerializer):
+def route_columns(route_points):
+    """A route as parallel arrays plus an encoded polyline, from a RoutePoint queryset"""
+    rows = list(route_points.values_list('point_type', 'location', 'latitude', 'longitude', 'arrival_time', 'duration'))
+    types, locations, lats, lngs, arrivals, durations = (list(column) for column in zip(*rows)) if rows else ([],) * 6
+    return {
+        'types': types,
+        'locations': locations,
+        'lats': lats,
+        'lngs': lngs,
+        'arrivals': [int(arrival.timestamp()) for arrival in arrivals],   # epoch seconds
+        'durations': durations,                                         # minutes
+        'polyline': encode_polyline(zip(lats, lngs)),
+    }
+
+def log_columns(eld_logs):
+    """ELD logs as parallel arrays, from an ELDLog queryset"""
+    rows = list(eld_logs.values_list(
+        'log_date', 'off_duty_periods', 'sleeper_berth_periods', 'driving_periods', 'on_duty_periods',
+        'starting_location', 'ending_location',
+    ))
+    dates, off_duty, sleeper, driving, on_duty, starts, ends = (list(column) for column in zip(*rows)) if rows else ([],) * 7
+    return {
+        'dates': [log_date.isoformat() for log_date in dates],
+        'off_duty_periods': off_duty,
+        'sleeper_berth_periods': sleeper,
+        'driving_periods': driving,
+        'on_duty_periods': on_duty,
+        'starting_locations': starts,
+        'ending_locations': ends,
+    }
+
+class TripStopSerializer(serializers.ModelSerializer):
     class Meta:
-        model = ELDLog
-        fields = ['id', 'log_date', 'off_duty_periods', 'sleeper_berth_periods',
-                'driving_periods', 'on_duty_periods', 'starting_location', 'ending_location']
+        model = TripStop
+        fields = ['sequence', 'location', 'window_start', 'window_end']
+        read_only_fields = ['sequence']
+
+    def validate(self, data):
+        if data.get('window_start') and data.get('window_end') and data['window_end'] < data['window_start']:
+            raise serializers.ValidationError("window_end must not be before window_start.")
+        return data
 
 class TripSerializer(serializers.ModelSerializer):
+    stops = TripStopSerializer(many=True, required=False, max_length=MAX_STOPS)
     route_points = RoutePointSerializer(many=True, read_only=True)
     eld_logs = ELDLogSerializer(many=True, read_only=True)
     
     class Meta:
         model = Trip
-        fields = ['id', 'current_location', 'pickup_location', 'dropoff_location', 
-                'current_cycle_hours', 'created_at', 'route_points', 'eld_logs']
-        read_only_fields = ['id', 'created_at', 'route_points', 'eld_logs']
\ No newline at end of file
+        fields = ['id', 'driver', 'current_location', 'pickup_location', 'dropoff_location', 
+                'current_cycle_hours', 'stops', 'optimize_stops', 'created_at', 'status', 'error',
+                'route_points', 'eld_logs']
+        read_only_fields = ['id', 'created_at', 'status', 'error', 'route_points', 'eld_logs']
+        extra_kwargs = {'current_cycle_hours': {'required': False}}
+
+    def validate(self, data):
+        # Stops are planned when the trip is created; changing them would leave the route stale
+        if self.instance is not None and 'stops' in data:
+            raise serializers.ValidationError({'stops': ["Stops cannot be changed once a trip is created."]})
+        # A driver's cycle comes from their duty ledger; without one it must be given
+        if data.get('driver'):
+            data['current_cycle_hours'] = round(cycle_hours_used(data['driver'].pk, timezone.now().date()), 2)
+        elif data.get('current_cycle_hours') is None and not self.partial:
+            raise serializers.ValidationError({'current_cycle_hours': ["This field is required without a driver."]})
+        return data
+
+    def create(self, validated_data):
+        stops = validated_data.pop('stops', [])
+        with transaction.atomic():
+            trip = Trip.objects.create(**validated_data)
+            TripStop.objects.bulk_create([
+                TripStop(trip=trip, sequence=sequence, **stop) for sequence, stop in enumerate(stops)
+            ])
+        return trip
+
+class CandidatesSerializer(serializers.Serializer):
+    candidates = TripSerializer(many=True, min_length=1, max_length=MAX_CANDIDATES)
+
+class TripPreviewSerializer(serializers.BaseSerializer):
+    """Read-only; a TripPreview shaped like TripSerializer's output, plus a summary for comparing candidates"""
+    def to_representation(self, preview):
+        trip = preview.trip
+        points = preview.route_points
+        tz = timezone.get_current_timezone()
+        finish = (points[-1].departure_time or points[-1].arrival_time) if points else None
+        dropoff = next((point for point in reversed(points) if point.point_type == 'DROPOFF'), None)
+        return {
+            'driver': trip.driver_id,
+            'current_location': trip.current_location,
+            'pickup_location': trip.pickup_location,
+            'dropoff_location': trip.dropoff_location,
+            'current_cycle_hours': trip.current_cycle_hours,
+            'stops': TripStopSerializer(preview.stops, many=True).data,
+            'optimize_stops': trip.optimize_stops,
+            'summary': {
+                'dropoff_arrival': _datetime(dropoff.arrival_time, tz) if dropoff else None,
+                'finish_time': _datetime(finish, tz),
+                'total_hours': round((finish - points[0].arrival_time).total_seconds() / 3600, 2) if points else 0.0,
+                'rest_stops': sum(point.point_type == 'REST' for point in points),
+                'fuel_stops': sum(point.point_type == 'FUEL' for point in points),
+                'days': len(preview.eld_logs),
+            },
+            'route_points': RoutePointSerializer(points, many=True).data,
+            'eld_logs': ELDLogSerializer(preview.eld_logs, many=True).data,
+        }
+
+class DriverSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Driver
+        fields = ['id', 'name', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+class TripSummarySerializer(serializers.ModelSerializer):
+    """Trip fields without the nested route and logs, for list views"""
+    class Meta:
+        model = Trip
+        fields = ['id', 'driver', 'current_location', 'pickup_location', 'dropoff_location',
+                'current_cycle_hours', 'created_at', 'status']
+        read_only_fields = fields
+
+class TripStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Trip
+        fields = ['id', 'status', 'error', 'created_at']
+
+class ReplanSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    timestamp = serializers.DateTimeField(required=False)
+    current_cycle_hours = serializers.FloatField(min_value=0, max_value=70)
+
+class FleetHoursSerializer(serializers.Serializer):
+    GROUPS = ['date', 'driver', 'trip']
+    MAX_DAYS = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.CharField(required=False, allow_blank=True, default='date')
+    driver = serializers.UUIDField(required=False)
+
+    def validate_group_by(self, value):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.GROUPS]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown group {', '.join(unknown)}; choose from {', '.join(self.GROUPS)}.")
+        return list(dict.fromkeys(names))
+
+    def validate(self, data):
+        # A 30 day window ending today by default
+        data['end'] = data.get('end') or timezone.now().date()
+        data['start'] = data.get('start') or data['end'] - datetime.timedelta(days=29)
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        if (data['end'] - data['start']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"The range can cover at most {self.MAX_DAYS} days.")
+        return data
+
+class CycleQuerySerializer(serializers.Serializer):
+    date = serializers.DateField(required=False)
+
+class ExportSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=['logs', 'points'], default='logs')
+    start = serializers.DateField()
+    end = serializers.DateField()
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    cursor = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
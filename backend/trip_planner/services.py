@@ -1,236 +1,281 @@
-import requests
-import datetime
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
+import asyncio
+from dataclasses import dataclass
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from .models import Trip, RoutePoint, ELDLog
+from .models import Trip, TripStop, RoutePoint, ELDLog, PlanStatus
+from .geocoding import get_geocode_cache
+from .geoclient import get_geocoding_client
+from .gazetteer import get_gazetteer, remote_fallback_enabled
+from .planner import (
+    DEFAULT_RULES, PICKUP, STOP, DROPOFF, plan_trip, build_legs, build_daily_logs, geodesic_miles, driver_state_at,
+)
+from .routing import get_road_graph, build_road_legs, get_options as get_routing_options
+from .facilities import get_facility_index, get_options as get_facility_options
+from .plancache import get_plan_cache, plan_cache_enabled, plan_key
+from .caching import invalidate_trip
+from .metrics import phase
+from .sequencing import sequence_stops
+from .ledger import duty_history, update_days
+from .steps import run, arun
+
+
+@dataclass
+class PlanRequest:
+    """Inputs for planning one trip, gathered before geocoding"""
+    start_time: object
+    locations: list
+    windows: list
+    optimize: bool
+    timed: bool
+    history: list
+    key: str
+    cached: list                       # labelled stops from the plan cache, or None
+
 
 class RouteCalculator:
-    def __init__(self, trip):
+    def __init__(self, trip, rules=None, stops=None, dry_run=False):
         self.trip = trip
-        self.geolocator = Nominatim(user_agent="eld_trip_planner")
-        self.average_speed = 55  # mph, average truck speed
-        self.driving_limit = 11  # hours
-        self.duty_limit = 14     # hours
-        self.break_after = 8     # hours, need 30 min break after
-        self.rest_period = 10    # hours, minimum off-duty time between shifts
-        self.fuel_distance = 800  # miles, refuel every this many miles
-        self.pickup_dropoff_time = 60  # minutes, for pickup and dropoff
+        self.stops = stops
+        self.dry_run = dry_run              # keep geocoding results out of the database cache
+        self.geocoder = get_geocoding_client()
+        self.geocode_cache = get_geocode_cache()
+        self.gazetteer = get_gazetteer()
+        self.rules = rules or DEFAULT_RULES
+        self.plan_cache = get_plan_cache()
+        self.facilities = get_facility_index()
         
-    def geocode(self, location):
-        """Convert address string to lat/lng coordinates"""
+    def geocode_many(self, locations):
+        """Geocode several addresses to (lat, lng), fetching all cache misses concurrently"""
+        with phase('geocode'):
+            return run(self._geocode(locations), {
+                'lookup': lambda misses: self.geocode_cache.forward_many(
+                    misses, self.geocoder.forward_many, persist=not self.dry_run,
+                ),
+            })
+
+    async def ageocode_many(self, locations):
+        with phase('geocode'):
+            return await arun(self._geocode(locations), {
+                'lookup': lambda misses: self.geocode_cache.aforward_many(
+                    misses, self.geocoder.aforward_many, persist=not self.dry_run,
+                ),
+            })
+
+    def _geocode(self, locations):
+        """Steps of geocode_many and ageocode_many (see steps.py); failed lookups become (0, 0)"""
         try:
-            loc = self.geolocator.geocode(location)
-            return (loc.latitude, loc.longitude) if loc else (0, 0)
+            results = yield 'lookup', locations
         except Exception as e:
             print(f"Geocoding error: {e}")
-            return (0, 0)
+            results = [None] * len(locations)
+        return [coords if coords else (0, 0) for coords in results]
+
+    def trip_stops(self):
+        """The trip's intermediate stops in visiting order; saved ones are loaded on first use"""
+        if self.stops is None:
+            adding = self.trip is None or self.trip._state.adding
+            self.stops = [] if adding else list(self.trip.stops.all())
+        return self.stops
+
+    def waypoint_names(self):
+        """Location names of the trip's waypoints: start, pickup, stops in order and dropoff"""
+        return [
+            self.trip.current_location, self.trip.pickup_location,
+            *[stop.location for stop in self.trip_stops()], self.trip.dropoff_location,
+        ]
     
-    def calculate_route(self):
-        """Calculate the complete route with stops"""
-        # Get coordinates for locations
-        start_coords = self.geocode(self.trip.current_location)
-        pickup_coords = self.geocode(self.trip.pickup_location)
-        dropoff_coords = self.geocode(self.trip.dropoff_location)
-        
-        # Calculate distances
-        distance_to_pickup = geodesic(start_coords, pickup_coords).miles
-        distance_pickup_to_dropoff = geodesic(pickup_coords, dropoff_coords).miles
-        total_distance = distance_to_pickup + distance_pickup_to_dropoff
-        
-        # Calculate basic driving time (without breaks)
-        time_to_pickup = distance_to_pickup / self.average_speed
-        time_pickup_to_dropoff = distance_pickup_to_dropoff / self.average_speed
-        
-        # Starting time and current cycle hours
-        # Use timezone-aware datetime
-        now = timezone.now()
-        remaining_drive_time = self.driving_limit - self.trip.current_cycle_hours
-        
-        # Create route points
-        route_points = []
-        
-        # Starting point
-        route_points.append({
-            'point_type': 'START',
-            'location': self.trip.current_location,
-            'latitude': start_coords[0],
-            'longitude': start_coords[1],
-            'arrival_time': now,
-            'departure_time': now,
-            'duration': 0
-        })
-        
-        # Current position in time and space
-        current_time = now
-        current_position = start_coords
-        distance_covered = 0
-        last_break_time = 0  # Time since last 30-min break
-        
-        # First leg: to pickup
-        while distance_covered < distance_to_pickup:
-            # Calculate how far we can go before next required stop
-            remaining_distance = distance_to_pickup - distance_covered
-            time_needed = remaining_distance / self.average_speed
-            
-            # Check if we need a break before pickup
-            if last_break_time + time_needed > self.break_after and remaining_distance > 50:
-                # Calculate where to take break
-                break_distance = (self.break_after - last_break_time) * self.average_speed
-                break_position = self.interpolate_position(current_position, pickup_coords, break_distance / remaining_distance)
-                
-                # Add break stop
-                current_time += datetime.timedelta(hours=self.break_after - last_break_time)
-                distance_covered += break_distance
-                current_position = break_position
-                
-                route_points.append({
-                    'point_type': 'REST',
-                    'location': f"Rest stop near {self.trip.current_location}",
-                    'latitude': break_position[0],
-                    'longitude': break_position[1],
-                    'arrival_time': current_time,
-                    'departure_time': current_time + datetime.timedelta(minutes=30),
-                    'duration': 30
-                })
-                
-                current_time += datetime.timedelta(minutes=30)
-                last_break_time = 0
-            else:
-                # We can make it to pickup
-                current_time += datetime.timedelta(hours=time_needed)
-                distance_covered = distance_to_pickup
-                current_position = pickup_coords
-                last_break_time += time_needed
-        
-        # Pickup stop
-        route_points.append({
-            'point_type': 'PICKUP',
-            'location': self.trip.pickup_location,
-            'latitude': pickup_coords[0],
-            'longitude': pickup_coords[1],
-            'arrival_time': current_time,
-            'departure_time': current_time + datetime.timedelta(minutes=self.pickup_dropoff_time),
-            'duration': self.pickup_dropoff_time
-        })
-        
-        current_time += datetime.timedelta(minutes=self.pickup_dropoff_time)
-        
-        # Second leg: pickup to dropoff with potential breaks and fuel stops
-        distance_covered = 0
-        
-        while distance_covered < distance_pickup_to_dropoff:
-            # Calculate how far until next required stop (break, fuel, or end)
-            remaining_distance = distance_pickup_to_dropoff - distance_covered
-            time_needed = remaining_distance / self.average_speed
-            
-            # Check if we need a break
-            need_break = last_break_time + time_needed > self.break_after and remaining_distance > 50
-            
-            # Check if we need fuel
-            distance_since_fuel = distance_covered if len(route_points) <= 2 else distance_covered + distance_to_pickup
-            need_fuel = distance_since_fuel > self.fuel_distance and remaining_distance > 50
-            
-            if need_break or need_fuel:
-                # Calculate distance to next stop
-                stop_distance = min(
-                    (self.break_after - last_break_time) * self.average_speed if need_break else float('inf'),
-                    (self.fuel_distance - distance_since_fuel) + 50 if need_fuel else float('inf')
-                )
-                
-                stop_position = self.interpolate_position(
-                    current_position, 
-                    dropoff_coords, 
-                    stop_distance / remaining_distance
-                )
-                
-                # Drive to the stop
-                drive_time = stop_distance / self.average_speed
-                current_time += datetime.timedelta(hours=drive_time)
-                distance_covered += stop_distance
-                current_position = stop_position
-                
-                # Add the stop
-                if need_fuel:
-                    route_points.append({
-                        'point_type': 'FUEL',
-                        'location': f"Fuel stop near {self.get_nearest_city(stop_position)}",
-                        'latitude': stop_position[0],
-                        'longitude': stop_position[1],
-                        'arrival_time': current_time,
-                        'departure_time': current_time + datetime.timedelta(minutes=45),
-                        'duration': 45
-                    })
-                    current_time += datetime.timedelta(minutes=45)
-                    
-                if need_break:
-                    route_points.append({
-                        'point_type': 'REST',
-                        'location': f"Rest stop near {self.get_nearest_city(stop_position)}",
-                        'latitude': stop_position[0],
-                        'longitude': stop_position[1],
-                        'arrival_time': current_time,
-                        'departure_time': current_time + datetime.timedelta(minutes=30),
-                        'duration': 30
-                    })
-                    current_time += datetime.timedelta(minutes=30)
-                    last_break_time = 0
-                else:
-                    last_break_time += drive_time
-            else:
-                # We can make it to dropoff
-                current_time += datetime.timedelta(hours=time_needed)
-                distance_covered = distance_pickup_to_dropoff
-                current_position = dropoff_coords
-                last_break_time += time_needed
-        
-        # Dropoff point
-        route_points.append({
-            'point_type': 'DROPOFF',
-            'location': self.trip.dropoff_location,
-            'latitude': dropoff_coords[0],
-            'longitude': dropoff_coords[1],
-            'arrival_time': current_time,
-            'departure_time': current_time + datetime.timedelta(minutes=self.pickup_dropoff_time),
-            'duration': self.pickup_dropoff_time
-        })
-        
-        # Save route points to the database
-        saved_points = []
-        for point in route_points:
-            route_point = RoutePoint.objects.create(
-                trip=self.trip,
-                point_type=point['point_type'],
-                location=point['location'],
-                latitude=point['latitude'],
-                longitude=point['longitude'],
-                arrival_time=point['arrival_time'],
-                departure_time=point['departure_time'],
-                duration=point['duration']
+    def plan_route(self, start_time=None):
+        """Calculate the complete route with stops as unsaved RoutePoint instances"""
+        return [self.to_route_point(stop) for stop in self.plan_stops(start_time)]
+
+    def plan_stops(self, start_time=None):
+        """Plan the trip and return its labelled PlannedStops.
+
+        An identical earlier plan is reused from the plan cache, shifted to
+        start_time. Trips with optimize_stops set have their intermediate
+        stops reordered first, and the stops' sequence numbers updated.
+        For a trip with a driver the cycle comes from the driver's duty
+        ledger, and current_cycle_hours is set to the hours it shows used.
+        """
+        request = self.prepare_plan(start_time)
+        if request.cached is not None:
+            return request.cached
+        waypoints = self.geocode_many(request.locations)
+        stops = self.run_plan(request, waypoints)
+        self.label_stops(stops)
+        return self.store_plan(request, waypoints, stops)
+
+    async def aplan_stops(self, start_time=None):
+        """plan_stops for async views: lookups are awaited and database reads run in a thread"""
+        request = await sync_to_async(self.prepare_plan)(start_time)
+        if request.cached is not None:
+            return request.cached
+        waypoints = await self.ageocode_many(request.locations)
+        stops = self.run_plan(request, waypoints)
+        await self.alabel_stops(stops)
+        return self.store_plan(request, waypoints, stops)
+
+    def prepare_plan(self, start_time=None):
+        """Gather the plan's inputs and look it up in the plan cache"""
+        start_time = start_time or timezone.now()
+        locations = self.waypoint_names()
+        stops = self.trip_stops()
+        windows = [None, None] + [(stop.window_start, stop.window_end) for stop in stops] + [None]
+        optimize = self.trip.optimize_stops and len(stops) > 1
+        history = None
+        if self.trip.driver_id:
+            history = duty_history(self.trip.driver_id, start_time.date(), self.rules)
+            self.trip.current_cycle_hours = round(sum(history), 2)
+        # Time windows and a rolling cycle tie a plan to its start time, and a new order has to be recomputed
+        timed = any(window and any(window) for window in windows)
+        key = None if timed or optimize or history is not None else self.plan_key(locations)
+        cached = self.plan_cache.get(key, start_time) if key else None
+        if cached is not None:
+            self.name_waypoints(cached)
+        return PlanRequest(start_time, locations, windows, optimize, timed, history, key, cached)
+
+    def run_plan(self, request, waypoints):
+        """Sequence the stops if asked, then build legs and run the HOS planner; returns unlabelled stops"""
+        windows = request.windows
+        if request.optimize:
+            with phase('sequence'):
+                order = sequence_stops(waypoints, windows, request.start_time, self.rules)
+            waypoints = [waypoints[i] for i in order]
+            windows = [windows[i] for i in order]
+            self.stops = [self.stops[i - 2] for i in order[2:-1]]
+            for sequence, stop in enumerate(self.stops):
+                stop.sequence = sequence
+        with phase('legs'):
+            legs = self.build_legs(waypoints)
+        with phase('hos'):
+            plan = plan_trip(
+                waypoints,
+                request.start_time,
+                cycle_hours=self.trip.current_cycle_hours,
+                rules=self.rules,
+                legs=legs,
+                stop_types=[PICKUP] + [STOP] * len(self.stops) + [DROPOFF],
+                windows=windows[1:] if request.timed else None,
+                history=request.history,
+                facilities=self.facilities,
             )
-            saved_points.append(route_point)
-        
-        return saved_points
-    
-    def interpolate_position(self, start, end, fraction):
-        """Calculate a position along a straight line between start and end"""
-        return (
-            start[0] + (end[0] - start[0]) * fraction,
-            start[1] + (end[1] - start[1]) * fraction
+        return plan.stops
+
+    def store_plan(self, request, waypoints, stops):
+        if request.key and (0, 0) not in waypoints:
+            self.plan_cache.set(request.key, stops, request.start_time)
+        return stops
+
+    def plan_remaining(self, waypoints, start_time, cycle_hours, state=None, stop_types=None, names=None,
+                       windows=None):
+        """Plan from a position mid-trip through the waypoints still ahead.
+
+        stop_types, names and windows give the type, location name and
+        (opens, closes) window or None of each waypoint after the position.
+        Returns unsaved RoutePoints for the stops after the position; the
+        position itself is not a stop.
+        """
+        with phase('legs'):
+            legs = self.build_legs(waypoints)
+        with phase('hos'):
+            plan = plan_trip(
+                waypoints, start_time, cycle_hours=cycle_hours, rules=self.rules, legs=legs, state=state,
+                stop_types=stop_types, windows=windows, facilities=self.facilities,
+            )
+        stops = plan.stops[1:]
+        self.label_stops(stops, [''] + names if names else None)
+        return [self.to_route_point(stop) for stop in stops]
+
+    def plan_key(self, locations):
+        """Plan cache key for this trip's inputs, or None when the plan cache is disabled"""
+        if not plan_cache_enabled():
+            return None
+        graph_path = get_routing_options()['GRAPH_PATH']
+        facilities_path = get_facility_options()['PATH'] if self.facilities is not None else None
+        return plan_key(
+            locations, self.trip.current_cycle_hours, self.rules,
+            str(graph_path) if graph_path else None, str(facilities_path) if facilities_path else None,
+        )
+
+    def build_legs(self, waypoints):
+        """Road legs from the local road graph if one is configured, else straight lines"""
+        straight = lambda start, end: build_legs([start, end], self.rules, geodesic_miles)[0]
+        graph = get_road_graph()
+        if graph is None:
+            return [straight(start, end) for start, end in zip(waypoints, waypoints[1:])]
+        return build_road_legs(graph, waypoints, straight)
+
+    def label_stops(self, stops, names=None):
+        """Fill in location names for planned stops; ones placed at a facility already have its name"""
+        run(self._label(stops, names), {'nearest_cities': self.nearest_cities})
+
+    async def alabel_stops(self, stops, names=None):
+        await arun(self._label(stops, names), {'nearest_cities': self.anearest_cities})
+
+    def _label(self, stops, names=None):
+        """Steps of label_stops and alabel_stops (see steps.py)"""
+        en_route = [stop for stop in stops if stop.point_type in ('FUEL', 'REST') and not stop.location]
+        cities = yield 'nearest_cities', [(stop.latitude, stop.longitude) for stop in en_route]
+        for stop, city in zip(en_route, cities):
+            kind = 'Fuel' if stop.point_type == 'FUEL' else 'Rest'
+            stop.location = f"{kind} stop near {city}"
+        self.name_waypoints(stops, names)
+
+    def name_waypoints(self, stops, names=None):
+        """Label waypoint stops with their location names, by default the trip's own.
+
+        The stop ending leg i is waypoint i + 1 in names.
+        """
+        names = names or self.waypoint_names()
+        for stop in stops:
+            if stop.point_type == 'START':
+                stop.location = names[0]
+            elif stop.point_type in ('PICKUP', 'STOP', 'DROPOFF'):
+                stop.location = names[stop.leg + 1]
+
+    def to_route_point(self, stop):
+        return RoutePoint(
+            trip=self.trip,
+            point_type=stop.point_type,
+            location=stop.location,
+            latitude=stop.latitude,
+            longitude=stop.longitude,
+            arrival_time=stop.arrival_time,
+            departure_time=stop.departure_time,
+            duration=stop.duration,
         )
     
-    def get_nearest_city(self, coords):
-        try:
-            location = self.geolocator.reverse(f"{coords[0]}, {coords[1]}")
-            if location is None:
-                return "Unknown location"
-            address = location.raw.get('address', {})
-            city = address.get('city') or address.get('town') or address.get('village') or "Unknown location"
-            state = address.get('state') or ""
-            return f"{city}, {state}" if state else city
-        except Exception as e:
-            print(f"Reverse geocoding error: {e}")
-            return "Unknown location"
+    def nearest_cities(self, coords_list):
+        """Name the closest known place to each point, using the local gazetteer before the remote geocoder"""
+        with phase('reverse_geocode'):
+            return run(self._nearest_cities(coords_list), {
+                'lookup': lambda misses: self.geocode_cache.reverse_many(
+                    misses, self.geocoder.reverse_many, persist=not self.dry_run,
+                ),
+            })
+
+    async def anearest_cities(self, coords_list):
+        with phase('reverse_geocode'):
+            return await arun(self._nearest_cities(coords_list), {
+                'lookup': lambda misses: self.geocode_cache.areverse_many(
+                    misses, self.geocoder.areverse_many, persist=not self.dry_run,
+                ),
+            })
+
+    def _nearest_cities(self, coords_list):
+        """Steps of nearest_cities and anearest_cities (see steps.py); remote lookups are made together"""
+        cities = [self.gazetteer.nearest_city(coords) for coords in coords_list]
+        unknown = [i for i, city in enumerate(cities) if not city]
+        if unknown and remote_fallback_enabled():
+            try:
+                labels = yield 'lookup', [coords_list[i] for i in unknown]
+                for i, label in zip(unknown, labels):
+                    cities[i] = label
+            except Exception as e:
+                print(f"Reverse geocoding error: {e}")
+        return [city or "Unknown location" for city in cities]
 
 
 
@@ -238,122 +283,250 @@ class ELDGenerator:
     def __init__(self, trip):
         self.trip = trip
         
-    def generate_logs(self):
-        """Generate ELD logs for the entire trip"""
-        route_points = RoutePoint.objects.filter(trip=self.trip).order_by('arrival_time')
-        
-        if not route_points:
-            return []
-        
-        # Group route points by day
-        days = {}
-        
-        for point in route_points:
-            # Ensure datetime objects are timezone-aware
-            if point.arrival_time and timezone.is_naive(point.arrival_time):
-                point.arrival_time = timezone.make_aware(point.arrival_time)
-            
-            if point.departure_time and timezone.is_naive(point.departure_time):
-                point.departure_time = timezone.make_aware(point.departure_time)
-            
-            day = point.arrival_time.date()
-            if day not in days:
-                days[day] = []
-            days[day].append(point)
-            
-            # If departure is on a different day, add to that day too
-            if point.departure_time and point.departure_time.date() != day:
-                departure_day = point.departure_time.date()
-                if departure_day not in days:
-                    days[departure_day] = []
-                days[departure_day].append(point)
-        
-        # Generate logs for each day
-        logs = []
-        
-        for day, points in sorted(days.items()):
-            # Create log for this day
-            log = ELDLog.objects.create(
-                trip=self.trip,
-                log_date=day,
-                starting_location=points[0].location,
-                ending_location=points[-1].location,
-                off_duty_periods=[],
-                sleeper_berth_periods=[],
-                driving_periods=[],
-                on_duty_periods=[]
-            )
-            
-            # Fill in activity periods
-            current_time = timezone.make_aware(
-                datetime.datetime.combine(day, datetime.time.min)
-            )
-            end_time = timezone.make_aware(
-                datetime.datetime.combine(day, datetime.time.max)
-            )
-            
-            for i, point in enumerate(points):
-                # Skip if arrival is on a different day
-                if point.arrival_time.date() != day:
-                    continue
-                
-                # Driving time to this point (if not first point of trip)
-                if i > 0 and points[i-1].departure_time:
-                    prev_departure = max(points[i-1].departure_time, current_time)
-                    drive_start = prev_departure.strftime("%H:%M")
-                    drive_end = point.arrival_time.strftime("%H:%M")
-                    
-                    if drive_start != drive_end:
-                        log.driving_periods.append([drive_start, drive_end])
-                
-                # Activity at this point
-                if point.point_type in ['PICKUP', 'DROPOFF']:
-                    # On duty for pickup/dropoff
-                    duty_start = point.arrival_time.strftime("%H:%M")
-                    duty_end = (point.departure_time or point.arrival_time).strftime("%H:%M")
-                    if duty_start != duty_end:
-                        log.on_duty_periods.append([duty_start, duty_end])
-                
-                elif point.point_type == 'FUEL':
-                    # On duty for fueling
-                    duty_start = point.arrival_time.strftime("%H:%M")
-                    duty_end = (point.departure_time or point.arrival_time).strftime("%H:%M")
-                    if duty_start != duty_end:
-                        log.on_duty_periods.append([duty_start, duty_end])
-                
-                elif point.point_type == 'REST':
-                    # Off duty for breaks
-                    rest_start = point.arrival_time.strftime("%H:%M")
-                    rest_end = (point.departure_time or point.arrival_time).strftime("%H:%M")
-                    if rest_start != rest_end:
-                        log.off_duty_periods.append([rest_start, rest_end])
-                
-                # Fix the comparison of datetimes here
-                if point.departure_time:
-                    current_time = max(current_time, point.departure_time)
-                else:
-                    current_time = max(current_time, point.arrival_time)
-            
-            # Fill in off-duty time at beginning and end of day if needed
-            start_of_day = datetime.time.min.strftime("%H:%M")
-            first_activity_start = log.driving_periods[0][0] if log.driving_periods else (
-                log.on_duty_periods[0][0] if log.on_duty_periods else None
-            )
-            
-            if first_activity_start and first_activity_start != start_of_day:
-                log.off_duty_periods.append([start_of_day, first_activity_start])
-            
-            end_of_day = datetime.time.max.strftime("%H:%M")
-            last_activity_end = log.driving_periods[-1][1] if log.driving_periods else (
-                log.on_duty_periods[-1][1] if log.on_duty_periods else (
-                    log.off_duty_periods[-1][1] if log.off_duty_periods else None
-                )
-            )
-            
-            if last_activity_end and last_activity_end != end_of_day:
-                log.off_duty_periods.append([last_activity_end, end_of_day])
-            
-            log.save()
-            logs.append(log)
+    def build_logs(self, route_points=None):
+        """Build unsaved ELDLog instances for the entire trip.
+
+        Uses the given in-memory route points, or loads the trip's saved ones.
+        """
+        if route_points is None:
+            route_points = list(RoutePoint.objects.filter(trip=self.trip).order_by('arrival_time'))
+            for point in route_points:
+                # Ensure datetime objects are timezone-aware
+                if point.arrival_time and timezone.is_naive(point.arrival_time):
+                    point.arrival_time = timezone.make_aware(point.arrival_time)
+                if point.departure_time and timezone.is_naive(point.departure_time):
+                    point.departure_time = timezone.make_aware(point.departure_time)
         
-        return logs
\ No newline at end of file
+        with phase('eld'):
+            return [self.to_eld_log(log) for log in build_daily_logs(route_points)]
+
+    def to_eld_log(self, log):
+        return ELDLog(
+            trip=self.trip,
+            log_date=log.log_date,
+            starting_location=log.starting_location,
+            ending_location=log.ending_location,
+            off_duty_periods=log.off_duty_periods,
+            sleeper_berth_periods=log.sleeper_berth_periods,
+            driving_periods=log.driving_periods,
+            on_duty_periods=log.on_duty_periods,
+            duty_timeline=log.timeline,
+        ).fill_totals()
+
+
+def save_plan(trip, route_points, stops=None, **fields):
+    """Write route points and ELD logs for a trip in one transaction.
+
+    ELD logs are built from the in-memory points before the transaction
+    opens. New intermediate stops are inserted and saved ones get their
+    sequence updated. Extra keyword arguments are saved on the trip in the
+    same transaction.
+    """
+    for name, value in fields.items():
+        setattr(trip, name, value)
+    eld_logs = ELDGenerator(trip).build_logs(route_points)
+    adding = trip._state.adding
+    with phase('db_write'), transaction.atomic():
+        if adding:
+            trip.save(force_insert=True)
+        elif fields:
+            trip.save(update_fields=list(fields))
+        if stops:
+            saved = [stop for stop in stops if not stop._state.adding]
+            TripStop.objects.bulk_create([stop for stop in stops if stop._state.adding])
+            TripStop.objects.bulk_update(saved, ['sequence'])
+        RoutePoint.objects.bulk_create(route_points)
+        ELDLog.objects.bulk_create(eld_logs)
+        update_days(trip.driver_id, [log.log_date for log in eld_logs])
+        if not adding and not fields:
+            invalidate_trip(trip.pk)       # saving the trip's fields has already bumped its revision
+    return trip
+
+
+def new_trip(data):
+    """An unsaved trip and its unsaved stops from validated TripSerializer data"""
+    data = dict(data)
+    stop_data = data.pop('stops', None) or []
+    trip = Trip(**data)
+    return trip, [TripStop(trip=trip, sequence=sequence, **stop) for sequence, stop in enumerate(stop_data)]
+
+
+def create_trip(data):
+    """Plan a trip, then write it with its route points and ELD logs in one transaction.
+
+    Geocoding and route calculation run before the transaction is opened so
+    the database is only locked for the inserts.
+    """
+    trip, stops = new_trip(data)
+    calculator = RouteCalculator(trip, stops=stops)
+    route_points = calculator.plan_route()
+    return save_plan(trip, route_points, stops=calculator.trip_stops())
+
+
+async def acreate_trip(data):
+    """create_trip for async views.
+
+    Geocoding waits on the event loop rather than a thread. The write still
+    runs in a thread, since Django's ORM has no async transactions.
+    """
+    trip, stops = new_trip(data)
+    calculator = RouteCalculator(trip, stops=stops)
+    route_points = [calculator.to_route_point(stop) for stop in await calculator.aplan_stops()]
+    return await sync_to_async(save_plan)(trip, route_points, stops=calculator.trip_stops())
+
+
+@dataclass
+class TripPreview:
+    """A trip planned in memory: the unsaved trip, its stops in visiting order, route points and ELD logs"""
+    trip: object
+    stops: list
+    route_points: list
+    eld_logs: list
+
+
+def preview_trip(data, start_time=None):
+    """Plan a trip from validated TripSerializer data without writing to the database.
+
+    Geocoding results are kept in the in-process cache only.
+    """
+    trip, stops = new_trip(data)
+    calculator = RouteCalculator(trip, stops=stops, dry_run=True)
+    route_points = calculator.plan_route(start_time)
+    return TripPreview(trip, calculator.trip_stops(), route_points, ELDGenerator(trip).build_logs(route_points))
+
+
+async def apreview_trip(data, start_time=None):
+    trip, stops = new_trip(data)
+    calculator = RouteCalculator(trip, stops=stops, dry_run=True)
+    route_points = [calculator.to_route_point(stop) for stop in await calculator.aplan_stops(start_time)]
+    return TripPreview(trip, calculator.trip_stops(), route_points, ELDGenerator(trip).build_logs(route_points))
+
+
+def preview_trips(candidates, start_time=None):
+    """preview_trip for several candidates starting at the same time.
+
+    The candidates are planned as tasks on one event loop, so their
+    geocoding lookups overlap.
+    """
+    start_time = start_time or timezone.now()
+
+    async def preview_all():
+        return await asyncio.gather(*(apreview_trip(data, start_time) for data in candidates))
+    return async_to_sync(preview_all)()
+
+
+class ReplanError(ValueError):
+    pass
+
+
+def replan_trip(trip, position, moment, cycle_hours):
+    """Replan the rest of a trip from a reported position.
+
+    Route points the driver has already left are kept and the HOS clock is
+    replayed from them; stops not yet completed are replaced by a new plan
+    from position at moment through the pickup and dropoff still ahead.
+    Only the replaced route points and the log days from the last
+    completed stop onwards are rewritten.
+    """
+    points = list(RoutePoint.objects.filter(trip=trip).order_by('arrival_time'))
+    if not points:
+        raise ReplanError("The trip has no route to replan.")
+    if moment < points[0].arrival_time:
+        raise ReplanError("The position is earlier than the start of the trip.")
+
+    completed = []
+    for point in points:
+        if (point.departure_time or point.arrival_time) > moment:
+            break
+        completed.append(point)
+    removed = points[len(completed):]
+    ahead = [point for point in removed if point.point_type in ('PICKUP', 'STOP', 'DROPOFF')]
+    if not ahead:
+        raise ReplanError("The trip is already complete.")
+
+    # Stops are visited in sequence, so the ones ahead follow those already reached
+    reached = sum(point.point_type == 'STOP' for point in completed)
+    upcoming = iter(list(trip.stops.all())[reached:])
+    windows = []
+    for point in ahead:
+        stop = next(upcoming, None) if point.point_type == 'STOP' else None
+        windows.append((stop.window_start, stop.window_end) if stop else None)
+
+    calculator = RouteCalculator(trip)
+    waypoints = [tuple(position)] + [(point.latitude, point.longitude) for point in ahead]
+    state = driver_state_at(completed, moment, calculator.rules)
+    new_points = calculator.plan_remaining(
+        waypoints, moment, cycle_hours, state,
+        stop_types=[point.point_type for point in ahead], names=[point.location for point in ahead],
+        windows=windows if any(windows) else None,
+    )
+
+    # Log days before the last completed stop are final
+    changed_from = (completed[-1].departure_time or completed[-1].arrival_time).date()
+    eld_logs = [
+        log for log in ELDGenerator(trip).build_logs(completed + new_points)
+        if log.log_date >= changed_from
+    ]
+    with phase('db_write'), transaction.atomic():
+        RoutePoint.objects.filter(pk__in=[point.pk for point in removed]).delete()
+        stale_logs = ELDLog.objects.filter(trip=trip, log_date__gte=changed_from)
+        dates = set(stale_logs.values_list('log_date', flat=True)) if trip.driver_id else set()
+        stale_logs.delete()
+        RoutePoint.objects.bulk_create(new_points)
+        ELDLog.objects.bulk_create(eld_logs)
+        update_days(trip.driver_id, dates | {log.log_date for log in eld_logs})
+        invalidate_trip(trip.pk)
+    return completed + new_points
+
+
+def stale_trips(stale_before):
+    """Trips whose planning run is presumed lost: PENDING since before stale_before, or RUNNING since then"""
+    return Trip.objects.filter(
+        Q(status=PlanStatus.PENDING, created_at__lt=stale_before)
+        | Q(status=PlanStatus.RUNNING, started_at__lt=stale_before)
+    )
+
+
+def claim_trip(trip_id, stale_before=None):
+    """Mark a trip RUNNING for this run and return the claim's start time, or None if another run has it.
+
+    PENDING trips can always be claimed; with stale_before, so can RUNNING
+    ones whose run started before then. The claim is one conditional
+    UPDATE, so of two runs racing for a trip only one gets it.
+    """
+    claimable = Q(status=PlanStatus.PENDING)
+    if stale_before is not None:
+        claimable |= Q(status=PlanStatus.RUNNING, started_at__lt=stale_before)
+    started_at = timezone.now()
+    claimed = Trip.objects.filter(claimable, pk=trip_id).update(
+        status=PlanStatus.RUNNING, started_at=started_at, revision=F('revision') + 1,
+    )
+    return started_at if claimed else None
+
+
+def plan_pending_trip(trip_id, stale_before=None):
+    """Claim a PENDING trip, plan it and mark it DONE or FAILED.
+
+    Returns None without planning if another run holds the trip (see
+    claim_trip), and drops the plan if a recovery run took the trip over
+    while this one was planning.
+    """
+    started_at = claim_trip(trip_id, stale_before)
+    if started_at is None:
+        return None
+    claim = Trip.objects.filter(pk=trip_id, status=PlanStatus.RUNNING, started_at=started_at)
+    trip = Trip.objects.get(pk=trip_id)
+    try:
+        calculator = RouteCalculator(trip)
+        route_points = calculator.plan_route()
+        stops = calculator.trip_stops() if trip.optimize_stops else None
+        with transaction.atomic():
+            # Writing to the claimed row first holds it until the plan is saved
+            if not claim.update(revision=F('revision') + 1):
+                return None
+            save_plan(trip, route_points, stops=stops, status=PlanStatus.DONE,
+                      current_cycle_hours=trip.current_cycle_hours)
+    except Exception as e:
+        claim.update(status=PlanStatus.FAILED, error=str(e)[:1000], revision=F('revision') + 1)
+        raise
+    return trip
@@ -0,0 +1,40 @@
+"""Run one body of logic from both a sync method and its async twin.
+
+The shared body is a generator that yields (name, *args) for each
+database or network call it needs and is sent the call's result, or has
+its exception thrown in. Its return value is the method's result. run()
+makes the calls with plain functions, arun() awaits coroutine functions,
+so the two versions differ only in the calls table they pass.
+"""
+
+
+def run(steps, calls):
+    """Drive steps to completion, calling calls[name](*args) for each yielded step"""
+    try:
+        step = next(steps)
+        while True:
+            name, *args = step
+            try:
+                result = calls[name](*args)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def arun(steps, calls):
+    """run() for async callers, awaiting calls[name](*args) for each yielded step"""
+    try:
+        step = next(steps)
+        while True:
+            name, *args = step
+            try:
+                result = await calls[name](*args)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
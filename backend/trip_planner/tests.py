@@ -1,8 +1,56 @@
-from django.test import TestCase
+import base64
+import contextlib
+import heapq
+import io
+import os
+import json
+import tempfile
+import threading
+import time
+import uuid
+from django.apps import apps as django_apps
+from django.test import AsyncClient, TestCase, SimpleTestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
+from rest_framework import serializers as drf_serializers
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from .models import Trip, RoutePoint, ELDLog
+import datetime
+import math
+import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .models import Driver, DriverDay, Trip, TripStop, RoutePoint, ELDLog, GeocodeCacheEntry
+from .geocoding import GeocodeCache
+from .geoclient import GeocodingClient, NominatimProvider, TokenBucket, get_options as geoclient_options
+from .plancache import PlanCache, get_plan_cache, plan_key
+from .services import RouteCalculator, ELDGenerator, create_trip, save_plan, new_trip, replan_trip, plan_pending_trip
+from .serializers import RoutePointSerializer, ELDLogSerializer, encode_polyline
+from .renderers import ORJSONRenderer
+from . import jobs
+from .planner import (
+    Leg, PlannedStop, RuleSet, plan_trip, build_legs, build_daily_logs, haversine_miles, driver_state_at,
+)
+from .batch import plan_lanes
+from .bulk import plan_rows
+from .routing import RoadGraph
+from .sequencing import sequence_stops, distance_matrix
+from .ledger import duty_history
+from .timeline import DutyTimeline, OverlapError, OFF_DUTY, SLEEPER_BERTH, DRIVING, ON_DUTY, UNKNOWN
+from .gazetteer import Gazetteer, Place, get_gazetteer
+from .facilities import Facility, FacilityIndex, TRUCK_STOP, REST_AREA
+from . import facilities as facilities_module
+from . import benchmarks, bulk, caching, metrics
+
+def local_geocode_many(locations):
+    return [TripPersistenceTestCase.COORDS.get(location) for location in locations]
+
 
 class TripAPITestCase(TestCase):
     def setUp(self):
@@ -16,7 +64,8 @@ class TripAPITestCase(TestCase):
             'dropoff_location': 'Dallas, TX',
             'current_cycle_hours': 2.5
         }
-        response = self.client.post(url, data, format='json')
+        with benchmarks.local_geocoding():
+            response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         
         # Verify trip was created
@@ -29,4 +78,1564 @@ class TripAPITestCase(TestCase):
         
         # Verify ELD logs were created
         eld_logs = ELDLog.objects.filter(trip=trip)
-        self.assertTrue(eld_logs.exists())
\ No newline at end of file
+        self.assertTrue(eld_logs.exists())
+
+
+class GeocodeCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = GeocodeCache(max_entries=2, forward_ttl=3600, reverse_ttl=3600, reverse_precision=2)
+        self.calls = []
+
+    def fetch(self, values):
+        self.calls.extend(values)
+        return [(32.7767, -96.797)] * len(values)
+
+    def forward(self, address, fetch=None):
+        return self.cache.forward_many([address], fetch or self.fetch)[0]
+
+    def test_forward_memory_then_db(self):
+        self.assertEqual(self.forward('Dallas, TX'), (32.7767, -96.797))
+        self.assertEqual(self.forward('  dallas,TX '), (32.7767, -96.797))
+        self.assertEqual(len(self.calls), 1)
+
+        # A fresh process only has the database tier
+        self.cache.clear()
+        self.assertEqual(self.forward('Dallas, TX'), (32.7767, -96.797))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+        self.assertEqual(self.cache.stats()['db_hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_batches_fetch_each_miss_once(self):
+        self.forward('Dallas, TX')
+        self.cache.clear()
+        results = self.cache.forward_many(['Austin, TX', 'Dallas, TX', 'austin,  tx'], self.fetch)
+        self.assertEqual(results, [(32.7767, -96.797)] * 3)
+        self.assertEqual(self.calls, ['Dallas, TX', 'Austin, TX'])
+
+    def test_reverse_rounds_coordinates(self):
+        fetch = lambda coords_list: self.calls.extend(coords_list) or ['Dallas, Texas'] * len(coords_list)
+        self.assertEqual(self.cache.reverse_many([(32.7767, -96.797)], fetch), ['Dallas, Texas'])
+        self.assertEqual(self.cache.reverse_many([(32.7801, -96.7951)], fetch), ['Dallas, Texas'])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_expired_entries_are_refetched(self):
+        self.forward('Dallas, TX')
+        GeocodeCacheEntry.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.cache.clear()
+        self.forward('Dallas, TX')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_not_found_is_not_cached(self):
+        self.assertIsNone(self.forward('Nowhere', lambda addresses: [None] * len(addresses)))
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+    def test_lru_evicts_oldest(self):
+        for address in ['A', 'B', 'C']:
+            self.forward(address)
+        self.assertEqual(self.cache.stats()['memory_entries'], 2)
+
+
+class GazetteerTestCase(TestCase):
+    def test_nearest_matches_brute_force(self):
+        gazetteer = get_gazetteer()
+        rng = random.Random(7)
+        for _ in range(200):
+            coords = (rng.uniform(25, 49), rng.uniform(-124, -67))
+            place, miles = gazetteer.nearest(coords)
+            if place is None:
+                continue
+            def distance(p):
+                lat1, lng1, lat2, lng2 = map(math.radians, (coords[0], coords[1], p.latitude, p.longitude))
+                a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+                return 2 * 3958.8 * math.asin(math.sqrt(a))
+            expected = min(gazetteer.places, key=distance)
+            self.assertEqual(place, expected)
+            self.assertAlmostEqual(miles, distance(expected), places=3)
+
+    def test_nearest_city_label(self):
+        self.assertEqual(get_gazetteer().nearest_city((32.78, -96.80)), 'Dallas, TX')
+
+    def test_out_of_range_returns_none(self):
+        gazetteer = Gazetteer([Place('Dallas', 'TX', 32.7767, -96.797, 1343573)], max_distance_miles=50)
+        self.assertIsNone(gazetteer.nearest_city((29.76, -95.37)))
+        self.assertIsNone(Gazetteer([]).nearest_city((29.76, -95.37)))
+
+
+class TripPersistenceTestCase(TestCase):
+    COORDS = {
+        'Dallas, TX': (32.7767, -96.797),
+        'Fort Worth, TX': (32.7555, -97.3308),
+        'Austin, TX': (30.2672, -97.7431),
+        'Amarillo, TX': (35.222, -101.8313),
+        'Houston, TX': (29.7604, -95.3698),
+    }
+
+    def plan(self, current, pickup, dropoff):
+        data = {
+            'current_location': current,
+            'pickup_location': pickup,
+            'dropoff_location': dropoff,
+            'current_cycle_hours': 0,
+        }
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            with CaptureQueriesContext(connection) as queries:
+                trip = create_trip(data)
+        return trip, len(queries)
+
+    def test_logs_are_built_from_in_memory_points(self):
+        trip, _ = self.plan('Dallas, TX', 'Fort Worth, TX', 'Austin, TX')
+        points = list(trip.route_points.order_by('arrival_time'))
+        with CaptureQueriesContext(connection) as queries:
+            logs = ELDGenerator(trip).build_logs(points)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([log.driving_periods for log in logs], [log.driving_periods for log in trip.eld_logs.all()])
+
+    def test_writes_do_not_grow_with_stops(self):
+        short_trip, short_queries = self.plan('Dallas, TX', 'Fort Worth, TX', 'Austin, TX')
+        long_trip, long_queries = self.plan('Houston, TX', 'Dallas, TX', 'Amarillo, TX')
+        self.assertGreater(long_trip.route_points.count(), short_trip.route_points.count())
+        self.assertEqual(short_queries, long_queries)
+
+    def test_logs_are_saved_with_periods(self):
+        trip, _ = self.plan('Dallas, TX', 'Fort Worth, TX', 'Austin, TX')
+        log = trip.eld_logs.get()
+        self.assertTrue(log.driving_periods)
+        self.assertTrue(log.on_duty_periods)
+        self.assertEqual(len(log.duty_timeline), 1440)
+        self.assertEqual(log.timeline.to_periods()['driving_periods'], log.driving_periods)
+
+    def test_failed_persistence_rolls_back(self):
+        with mock.patch.object(ELDLog.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.plan('Dallas, TX', 'Fort Worth, TX', 'Austin, TX')
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(RoutePoint.objects.exists())
+
+
+class PlannerTestCase(SimpleTestCase):
+    START = datetime.datetime(2025, 3, 17, 6, 0, tzinfo=datetime.timezone.utc)
+    LOS_ANGELES = (34.0522, -118.2437)
+    PHOENIX = (33.4484, -112.074)
+    NEW_YORK = (40.7128, -74.006)
+
+    def test_short_trip_has_no_intermediate_stops(self):
+        plan = plan_trip([self.LOS_ANGELES, (34.1083, -117.2898), self.PHOENIX], self.START)
+        self.assertEqual([s.point_type for s in plan.stops], ['START', 'PICKUP', 'DROPOFF'])
+        self.assertEqual(plan.stops[1].departure_time - plan.stops[1].arrival_time, datetime.timedelta(hours=1))
+
+    def test_long_trip_respects_limits(self):
+        rules = RuleSet()
+        plan = plan_trip([self.LOS_ANGELES, self.PHOENIX, self.NEW_YORK], self.START, cycle_hours=40)
+        self.assertAlmostEqual(plan.total_miles, plan.stops[-1].miles)
+
+        since_break = shift_drive = since_fuel = 0.0
+        for previous, stop in zip(plan.stops, plan.stops[1:]):
+            hours = (stop.arrival_time - previous.departure_time).total_seconds() / 3600
+            since_break += hours
+            shift_drive += hours
+            since_fuel += stop.miles - previous.miles
+            self.assertLessEqual(since_break, rules.break_after + 1e-6)
+            self.assertLessEqual(shift_drive, rules.driving_limit + 1e-6)
+            self.assertLessEqual(since_fuel, rules.fuel_distance + rules.fuel_tolerance)
+            if stop.duration >= rules.break_duration:
+                since_break = 0.0
+            if stop.point_type == 'REST' and stop.duration >= rules.rest_period * 60:
+                shift_drive = 0.0
+            if stop.point_type == 'FUEL':
+                since_fuel = 0.0
+
+        types = [s.point_type for s in plan.stops]
+        self.assertIn('FUEL', types)
+        self.assertIn(int(rules.rest_period * 60), [s.duration for s in plan.stops])
+        # 40 + ~50 hours of driving and duty crosses the 70 hour cycle
+        self.assertIn(int(rules.restart_period * 60), [s.duration for s in plan.stops])
+
+    def test_daily_logs_cover_each_day(self):
+        plan = plan_trip([self.LOS_ANGELES, self.PHOENIX, self.NEW_YORK], self.START, cycle_hours=40)
+        for stop in plan.stops:
+            stop.location = stop.point_type
+        logs = build_daily_logs(plan.stops)
+        self.assertEqual(logs[0].log_date, self.START.date())
+        self.assertEqual(logs[-1].log_date, plan.end_time.date())
+        self.assertEqual([log.log_date for log in logs],
+                         [self.START.date() + datetime.timedelta(days=i) for i in range(len(logs))])
+        self.assertEqual(logs[0].starting_location, 'START')
+        self.assertEqual(logs[-1].ending_location, 'DROPOFF')
+
+        # Every minute is accounted for exactly once, and driving adds up across midnight splits
+        timelines = [DutyTimeline(log.timeline) for log in logs]
+        self.assertTrue(all(t.totals()[UNKNOWN] == 0 for t in timelines))
+        driving = sum(t.totals()[DRIVING] for t in timelines)
+        self.assertLessEqual(abs(driving - plan.driving_hours * 60), len(plan.stops))
+        self.assertEqual(logs[1].off_duty_periods[0][0], '00:00')
+        self.assertEqual([log.driving_periods for log in logs], [t.to_periods()['driving_periods'] for t in timelines])
+
+    def test_daily_logs_split_rest_at_midnight(self):
+        start = datetime.datetime(2025, 3, 17, 20, 0, tzinfo=datetime.timezone.utc)
+        stops = [
+            PlannedStop('START', 0, 0, start, start, 0, location='A'),
+            PlannedStop('REST', 0, 0, start + datetime.timedelta(hours=2),
+                        start + datetime.timedelta(hours=36), 2040, location='B'),
+            PlannedStop('DROPOFF', 0, 0, start + datetime.timedelta(hours=37),
+                        start + datetime.timedelta(hours=38), 60, location='C'),
+        ]
+        logs = build_daily_logs(stops)
+        self.assertEqual([log.log_date.day for log in logs], [17, 18, 19])
+        self.assertEqual(logs[0].driving_periods, [['20:00', '22:00']])
+        self.assertEqual(logs[1].off_duty_periods, [['00:00', '23:59']])
+        self.assertEqual(logs[1].starting_location, 'B')
+        self.assertEqual(logs[2].driving_periods, [['08:00', '09:00']])
+        self.assertEqual(logs[2].on_duty_periods, [['09:00', '10:00']])
+        self.assertEqual(logs[2].ending_location, 'C')
+
+
+class BatchPlannerTestCase(SimpleTestCase):
+    def test_matches_scalar_planner(self):
+        rng = np.random.default_rng(42)
+        n = 60
+        points = np.column_stack([rng.uniform(26, 48, 3 * n), rng.uniform(-122, -70, 3 * n)]).reshape(3, n, 2)
+        cycle_hours = rng.uniform(0, 70, n)
+        # Include a lane that starts at the pickup
+        points[1, 0] = points[0, 0]
+        start = datetime.datetime(2025, 3, 17, 6, 0, tzinfo=datetime.timezone.utc)
+        starts = np.full(n, np.datetime64('2025-03-17T06:00:00'))
+
+        result = plan_lanes(points[0], points[1], points[2], cycle_hours, start_times=starts)
+
+        for i in range(n):
+            plan = plan_trip([tuple(points[0, i]), tuple(points[1, i]), tuple(points[2, i])], start, cycle_hours[i])
+            rests = [s.duration for s in plan.stops if s.point_type == 'REST']
+            self.assertAlmostEqual(result.total_miles[i], plan.total_miles, places=6)
+            self.assertAlmostEqual(result.driving_hours[i], plan.driving_hours, places=6)
+            self.assertAlmostEqual(result.transit_hours[i], plan.total_hours, places=4)
+            self.assertEqual(result.fuel_stops[i], sum(s.point_type == 'FUEL' for s in plan.stops))
+            self.assertEqual(result.breaks[i], rests.count(30))
+            self.assertEqual(result.rests[i], rests.count(600))
+            self.assertEqual(result.restarts[i], rests.count(2040))
+            eta = np.datetime64(plan.end_time.replace(tzinfo=None), 'ms')
+            self.assertLessEqual(abs(result.eta[i] - eta), np.timedelta64(1, 's'))
+
+
+class AsyncTripPlanningTestCase(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        get_plan_cache().clear()
+        patcher = mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.futures = []
+        submit = mock.patch('trip_planner.views.submit_trip', side_effect=lambda trip_id: self.futures.append(jobs.submit_trip(trip_id)))
+        submit.start()
+        self.addCleanup(submit.stop)
+
+    def wait_for(self, trip_id):
+        # Wait on the worker before polling; SQLite's shared test database can't serve both at once
+        for future in self.futures:
+            future.result(timeout=10)
+        return self.client.get(reverse('trip-plan-status', kwargs={'pk': trip_id}))
+
+    def test_async_create_returns_job(self):
+        data = {
+            'current_location': 'Dallas, TX',
+            'pickup_location': 'Fort Worth, TX',
+            'dropoff_location': 'Austin, TX',
+            'current_cycle_hours': 0,
+        }
+        response = self.client.post(reverse('trip-list') + '?async=true', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertTrue(response['Location'].endswith(f"/trips/{response.data['id']}/status/"))
+
+        self.assertEqual(self.wait_for(response.data['id']).data['status'], 'DONE')
+        trip = Trip.objects.get(pk=response.data['id'])
+        self.assertEqual(trip.route_points.count(), 3)
+        self.assertTrue(trip.eld_logs.exists())
+
+    def test_failed_planning_is_reported(self):
+        data = {
+            'current_location': 'Dallas, TX',
+            'pickup_location': 'Fort Worth, TX',
+            'dropoff_location': 'Austin, TX',
+            'current_cycle_hours': 0,
+        }
+        with mock.patch('trip_planner.services.plan_trip', side_effect=ValueError('no route')):
+            response = self.client.post(reverse('trip-list') + '?async=true', data, format='json')
+            result = self.wait_for(response.data['id'])
+        self.assertEqual(result.data['status'], 'FAILED')
+        self.assertEqual(result.data['error'], 'no route')
+
+
+class RecoverTripsTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lost, self.running = [
+            Trip.objects.create(current_location='Dallas, TX', pickup_location='Fort Worth, TX',
+                                dropoff_location='Austin, TX', current_cycle_hours=0, status='PENDING')
+            for _ in range(2)
+        ]
+        Trip.objects.filter(pk=self.lost.pk).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+
+    def test_lost_jobs_are_planned_again(self):
+        call_command('recover_trips', stderr=io.StringIO())
+        self.assertEqual(Trip.objects.get(pk=self.lost.pk).status, 'DONE')
+        self.assertTrue(self.lost.eld_logs.exists())
+        self.assertEqual(Trip.objects.get(pk=self.running.pk).status, 'PENDING')
+
+    def test_lost_jobs_can_be_failed(self):
+        err = io.StringIO()
+        call_command('recover_trips', '--fail', stderr=err)
+        lost = Trip.objects.get(pk=self.lost.pk)
+        self.assertEqual(lost.status, 'FAILED')
+        self.assertIn('submit the trip again', lost.error)
+        self.assertEqual(Trip.objects.get(pk=self.running.pk).status, 'PENDING')
+        self.assertIn('Marked 1 of 1', err.getvalue())
+
+    def test_job_and_recovery_plan_a_trip_once(self):
+        reference = Trip.objects.create(current_location='Dallas, TX', pickup_location='Fort Worth, TX',
+                                        dropoff_location='Austin, TX', current_cycle_hours=0, status='PENDING')
+        plan_pending_trip(reference.pk)
+        expected = (reference.route_points.count(), reference.eld_logs.count())
+
+        # Recovery takes over a trip whose job is still planning; the job then drops its plan
+        plan_route = RouteCalculator.plan_route
+        def recover_midway(calculator, *args, **kwargs):
+            if calculator.trip.pk == self.running.pk and not recovered:
+                recovered.append(io.StringIO())
+                call_command('recover_trips', '--older-than', '0', stderr=recovered[0])
+            return plan_route(calculator, *args, **kwargs)
+        recovered = []
+        with mock.patch.object(RouteCalculator, 'plan_route', autospec=True, side_effect=recover_midway):
+            self.assertIsNone(plan_pending_trip(self.running.pk))
+        self.assertIn('Planned 2 of 2', recovered[0].getvalue())
+
+        # A queued job that runs after recovery planned its trip does nothing
+        call_command('recover_trips', stderr=io.StringIO())
+        self.assertIsNone(plan_pending_trip(self.lost.pk))
+
+        for trip in [self.running, self.lost]:
+            self.assertEqual(Trip.objects.get(pk=trip.pk).status, 'DONE')
+            self.assertEqual((trip.route_points.count(), trip.eld_logs.count()), expected)
+
+
+class BulkPlanningTestCase(TestCase):
+    ROWS = [
+        {'current_location': 'Dallas, TX', 'pickup_location': 'Fort Worth, TX',
+         'dropoff_location': 'Austin, TX', 'current_cycle_hours': 0},
+        {'current_location': 'Houston, TX', 'pickup_location': 'Dallas, TX',
+         'dropoff_location': 'Amarillo, TX', 'current_cycle_hours': 12},
+        {'current_location': 'Dallas, TX', 'pickup_location': 'Fort Worth, TX'},
+        {'current_location': 'Dallas, TX', 'pickup_location': 'Houston, TX',
+         'dropoff_location': 'Austin, TX', 'current_cycle_hours': 3},
+    ]
+
+    def setUp(self):
+        get_plan_cache().clear()
+        patcher = mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many)
+        self.geocode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bulk_endpoint_streams_results(self):
+        body = '\n'.join(json.dumps(row) for row in self.ROWS) + '\nnot json\n'
+        response = APIClient().post(reverse('trip-bulk'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual([r['row'] for r in results], [1, 2, 3, 4, 5])
+        self.assertEqual([r.get('status') for r in results], ['DONE', 'DONE', None, 'DONE', None])
+        self.assertIn('dropoff_location', results[2]['errors'])
+        self.assertEqual(Trip.objects.count(), 3)
+        self.assertTrue(all(trip.eld_logs.exists() for trip in Trip.objects.all()))
+        # Five distinct addresses across three valid rows, geocoded in one batch
+        self.assertEqual(self.geocode.call_count, 1)
+        self.assertEqual(len(self.geocode.call_args.args[0]), 5)
+
+    def test_rows_that_fail_to_plan_or_save_do_not_stop_the_stream(self):
+        amarillo = TripPersistenceTestCase.COORDS['Amarillo, TX']
+        real_plan, real_create = plan_trip, Trip.objects.bulk_create
+
+        def plan(waypoints, *args, **kwargs):
+            if amarillo in waypoints:
+                raise ValueError('no route')
+            return real_plan(waypoints, *args, **kwargs)
+
+        def create(trips, *args, **kwargs):
+            if any(trip.dropoff_location == 'Fort Worth, TX' for trip in trips):
+                raise IntegrityError('constraint failed')
+            return real_create(trips, *args, **kwargs)
+
+        rows = [
+            self.ROWS[1],
+            {**self.ROWS[0], 'stops': [{'location': 'Houston, TX'}], 'current_cycle_hours': 1},
+            {**self.ROWS[3], 'dropoff_location': 'Fort Worth, TX'},
+            self.ROWS[3],
+        ]
+        with mock.patch('trip_planner.bulk.plan_trip', side_effect=plan), \
+                mock.patch.object(RouteCalculator, 'plan_stops', side_effect=RuntimeError('stops failed')), \
+                mock.patch.object(Trip.objects, 'bulk_create', side_effect=create):
+            results = list(plan_rows(rows))
+        self.assertEqual([r['row'] for r in results], [1, 2, 3, 4])
+        self.assertEqual([r.get('status') for r in results], [None, None, None, 'DONE'])
+        self.assertEqual([r['errors']['non_field_errors'] for r in results[:3]],
+                         [['no route'], ['stops failed'], ['constraint failed']])
+        self.assertEqual(list(Trip.objects.values_list('pk', flat=True)), [uuid.UUID(results[3]['id'])])
+
+    def test_worker_processes_load_facilities_themselves(self):
+        calls = []
+
+        class Executor(ProcessPoolExecutor):
+            def map(self, fn, *iterables, **kwargs):
+                iterables = [list(items) for items in iterables]
+                calls.append((fn, iterables))
+                return super().map(fn, *iterables, **kwargs)
+
+        index = FacilityIndex([Facility('Stop', TRUCK_STOP, 'TX', 31.5, -97.1)])
+        with mock.patch('trip_planner.bulk.ProcessPoolExecutor', Executor), \
+                mock.patch('trip_planner.services.get_facility_index', return_value=index):
+            results = list(plan_rows([self.ROWS[0], self.ROWS[3]], workers=2))
+        self.assertEqual([r['status'] for r in results], ['DONE', 'DONE'])
+        fn, iterables = calls[0]
+        self.assertIs(fn, bulk._plan_lane)
+        self.assertFalse(any(isinstance(arg, FacilityIndex) for items in iterables for arg in items))
+
+    def test_plan_trips_command_reads_csv_in_chunks(self):
+        fields = ['current_location', 'pickup_location', 'dropoff_location', 'current_cycle_hours']
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(','.join(fields) + '\n')
+            for row in [self.ROWS[0], self.ROWS[1], self.ROWS[3]]:
+                f.write(','.join(f'"{row[field]}"' for field in fields) + '\n')
+        self.addCleanup(os.remove, f.name)
+
+        out = io.StringIO()
+        call_command('plan_trips', f.name, '--chunk-size', '2', stdout=out, stderr=io.StringIO())
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['status'] for r in results], ['DONE'] * 3)
+        self.assertEqual(Trip.objects.count(), 3)
+        self.assertEqual(RoutePoint.objects.filter(trip_id=results[1]['id'], point_type='PICKUP').count(), 1)
+
+
+class RoadRoutingTestCase(SimpleTestCase):
+    def setUp(self):
+        # 12 x 12 grid, 0.1 degree spacing, with a fast east-west highway along row 6
+        rng = random.Random(3)
+        size = 12
+        nodes = [[32 + 0.1 * row, -97 + 0.1 * col] for row in range(size) for col in range(size)]
+        edges = []
+        for row in range(size):
+            for col in range(size):
+                node = row * size + col
+                if col + 1 < size:
+                    edges.append([node, node + 1, rng.uniform(6, 9), 65 if row == 6 else 35])
+                if row + 1 < size:
+                    edges.append([node, node + size, rng.uniform(7, 10), 35])
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'nodes': nodes, 'edges': edges}, f)
+        self.addCleanup(os.remove, f.name)
+        self.path = f.name
+        self.graph = RoadGraph.load(f.name)
+
+    def test_app_startup_leaves_the_graph_unloaded(self):
+        # Management commands such as migrate must not pay for loading or contracting the graph
+        with mock.patch('trip_planner.routing.get_road_graph') as get_road_graph:
+            django_apps.get_app_config('trip_planner').ready()
+        get_road_graph.assert_not_called()
+
+    def dijkstra(self, source, target):
+        graph = self.graph
+        adjacency = {}
+        for edge in range(graph.road_edges):
+            adjacency.setdefault(int(graph.sources[edge]), []).append((int(graph.targets[edge]), graph.hours[edge]))
+        best = {source: 0.0}
+        queue = [(0.0, source)]
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if node == target:
+                return cost
+            for neighbor, hours in adjacency.get(node, []):
+                if cost + hours < best.get(neighbor, math.inf):
+                    best[neighbor] = cost + hours
+                    heapq.heappush(queue, (cost + hours, neighbor))
+
+    def test_hierarchy_finds_fastest_road_path(self):
+        rng = random.Random(5)
+        for _ in range(30):
+            source, target = rng.randrange(len(self.graph)), rng.randrange(len(self.graph))
+            path = self.graph.shortest_path(source, target)
+            self.assertTrue(all(edge < self.graph.road_edges for edge in path))
+            self.assertEqual([self.graph.sources[edge] for edge in path[1:]],
+                             [self.graph.targets[edge] for edge in path[:-1]])
+            self.assertAlmostEqual(sum(self.graph.hours[i] for i in path), self.dijkstra(source, target))
+
+    def test_prepared_graph_loads_without_contracting(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'graph.npz')
+            call_command('prepare_road_graph', self.path, output, stderr=io.StringIO())
+            with mock.patch('trip_planner.routing.contract') as contract:
+                prepared = RoadGraph.load(output)
+            contract.assert_not_called()
+        self.assertEqual(prepared.shortest_path(5, 130), self.graph.shortest_path(5, 130))
+
+    def test_route_polyline_and_positions(self):
+        leg = self.graph.route((32.001, -96.999), (33.1, -95.9))
+        self.assertEqual(leg.polyline[0], (32.001, -96.999))
+        self.assertEqual(leg.polyline[-1], (33.1, -95.9))
+        self.assertAlmostEqual(leg.cumulative[-1], leg.miles)
+        self.assertEqual(leg.position_at(leg.cumulative[3]), leg.polyline[3])
+
+        # Stops land on the polyline rather than the straight line
+        rules = RuleSet(break_after=1)
+        plan = plan_trip([leg.start, leg.start, leg.end], datetime.datetime(2025, 3, 17, tzinfo=datetime.timezone.utc),
+                         rules=rules, legs=[Leg(leg.start, leg.start, 0.0, 0.0), leg])
+        rest = next(stop for stop in plan.stops if stop.point_type == 'REST')
+        self.assertAlmostEqual(plan.total_miles, leg.miles)
+        self.assertTrue(any(
+            min(a[0], b[0]) - 1e-9 <= rest.latitude <= max(a[0], b[0]) + 1e-9
+            and min(a[1], b[1]) - 1e-9 <= rest.longitude <= max(a[1], b[1]) + 1e-9
+            for a, b in zip(leg.polyline, leg.polyline[1:])
+        ))
+
+
+class DutyTimelineTestCase(SimpleTestCase):
+    PERIODS = {
+        'off_duty_periods': [['00:00', '06:00'], ['14:30', '15:00'], ['18:00', '23:59']],
+        'sleeper_berth_periods': [],
+        'driving_periods': [['06:00', '14:30'], ['15:00', '17:00']],
+        'on_duty_periods': [['17:00', '18:00']],
+    }
+
+    def test_round_trips_json_periods(self):
+        timeline = DutyTimeline.from_periods(**self.PERIODS)
+        self.assertEqual(len(timeline.to_bytes()), 1440)
+        self.assertEqual(timeline.to_periods(), self.PERIODS)
+        self.assertEqual(DutyTimeline(timeline.to_bytes()).to_periods(), self.PERIODS)
+
+    def test_totals_and_grid(self):
+        timeline = DutyTimeline.from_periods(**self.PERIODS)
+        totals = timeline.totals()
+        self.assertEqual(totals[DRIVING], 10.5 * 60)
+        self.assertEqual(totals[ON_DUTY], 60)
+        self.assertEqual(totals[UNKNOWN], 0)
+        self.assertEqual(sum(totals.values()), 1440)
+        grid = timeline.to_grid()
+        self.assertEqual(len(grid), 96)
+        self.assertEqual(grid[24], DRIVING)
+        self.assertEqual(grid[0], OFF_DUTY)
+
+    def test_overlaps_are_caught(self):
+        timeline = DutyTimeline()
+        timeline.mark(60, 120, DRIVING)
+        timeline.mark(90, 100, DRIVING)
+        with self.assertRaises(OverlapError):
+            timeline.mark(110, 130, ON_DUTY)
+        self.assertEqual(timeline.fill().totals()[OFF_DUTY], 1440 - 60)
+
+    def test_violations(self):
+        timeline = DutyTimeline.from_periods(**self.PERIODS)
+        self.assertEqual(timeline.violations(), ['Driving for more than 8 hours without a break at 14:30'])
+        timeline.mark(17 * 60, 18 * 60, DRIVING, overwrite=True)
+        self.assertIn('More than 11 hours of driving in a shift at 18:00', timeline.violations())
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.trip = create_trip({
+                    'current_location': 'Dallas, TX',
+                    'pickup_location': 'Fort Worth, TX',
+                    'dropoff_location': 'Austin, TX',
+                    'current_cycle_hours': 0,
+                })
+
+    def test_repeat_polls_skip_the_orm(self):
+        for name in ['trip-detail', 'trip-route', 'trip-logs']:
+            url = reverse(name, kwargs={'pk': self.trip.pk})
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            etag = first['ETag']
+
+            with self.assertNumQueries(2):  # one revision lookup per request
+                second = self.client.get(url)
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second['ETag'], etag)
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(not_modified['ETag'], etag)
+
+    def test_first_request_honors_if_none_match(self):
+        url = reverse('trip-route', kwargs={'pk': self.trip.pk})
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_replan_and_delete_invalidate(self):
+        url = reverse('trip-logs', kwargs={'pk': self.trip.pk})
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.eld_logs.update(starting_location='Elsewhere')
+            save_plan(self.trip, [])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('trip-detail', kwargs={'pk': self.trip.pk}))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pending_trips_are_not_cached(self):
+        Trip.objects.filter(pk=self.trip.pk).update(status='PENDING')
+        url = reverse('trip-detail', kwargs={'pk': self.trip.pk})
+        self.client.get(url)
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_invalidation_reaches_other_processes(self):
+        # Another worker only shares the database, so its replan must not depend on this process's cache
+        url = reverse('trip-logs', kwargs={'pk': self.trip.pk})
+        etag = self.client.get(url)['ETag']
+        with mock.patch.object(caching, 'get_response_cache', side_effect=AssertionError):
+            self.trip.eld_logs.update(starting_location='Elsewhere')
+            save_plan(Trip.objects.get(pk=self.trip.pk), [])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_stale_instances_cannot_rewind_the_revision(self):
+        url = reverse('trip-detail', kwargs={'pk': self.trip.pk})
+        stale = Trip.objects.get(pk=self.trip.pk)
+        self.trip.save()
+        etag = self.client.get(url)['ETag']
+        stale.error = 'changed'
+        stale.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TripListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        base = timezone.now()
+        trips = Trip.objects.bulk_create([
+            Trip(current_location='A', pickup_location='B', dropoff_location='C', current_cycle_hours=i)
+            for i in range(7)
+        ])
+        for i, trip in enumerate(trips):
+            Trip.objects.filter(pk=trip.pk).update(created_at=base + datetime.timedelta(minutes=i))
+            RoutePoint.objects.create(trip=trip, point_type='START', location='A', latitude=0, longitude=0,
+                                      arrival_time=base)
+        self.expected = [str(trip.id) for trip in reversed(trips)]
+
+    def test_list_is_a_single_query_per_page(self):
+        url = reverse('trip-list') + '?page_size=3'
+        seen = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(trip['id'] for trip in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_list_uses_the_summary_representation(self):
+        trip = self.client.get(reverse('trip-list')).data['results'][0]
+        self.assertNotIn('route_points', trip)
+        self.assertNotIn('eld_logs', trip)
+        self.assertEqual(trip['status'], 'DONE')
+
+    def test_retrieve_prefetches_nested_objects(self):
+        with self.assertNumQueries(5):  # the revision lookup, then the trip and its nested objects
+            response = self.client.get(reverse('trip-detail', kwargs={'pk': self.expected[0]}))
+        self.assertEqual(len(response.data['route_points']), 1)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            self.trips = [
+                create_trip({'current_location': current, 'pickup_location': pickup,
+                             'dropoff_location': dropoff, 'current_cycle_hours': 0})
+                for current, pickup, dropoff in [
+                    ('Houston, TX', 'Dallas, TX', 'Amarillo, TX'),
+                    ('Dallas, TX', 'Fort Worth, TX', 'Austin, TX'),
+                ]
+            ]
+        self.today = timezone.now().date()
+        self.range = {'start': self.today.isoformat(), 'end': (self.today + datetime.timedelta(days=5)).isoformat()}
+
+    def export(self, **params):
+        response = self.client.get(reverse('trip-export'), {**self.range, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_exports_every_log_in_order(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        expected = ELDLog.objects.order_by('trip_id', 'log_date', 'id')
+        self.assertEqual([(row['trip_id'], row['log_date']) for row in rows],
+                         [(str(log.trip_id), log.log_date.isoformat()) for log in expected])
+
+    def test_resumes_from_any_cursor(self):
+        rows = [json.loads(line) for line in self.export(kind='points').splitlines()]
+        self.assertEqual(len(rows), RoutePoint.objects.count())
+        for i, row in enumerate(rows):
+            rest = [json.loads(line) for line in self.export(kind='points', cursor=row['cursor']).splitlines()]
+            self.assertEqual(rest, rows[i + 1:])
+
+    def test_csv_and_command(self):
+        lines = self.export(output='csv').splitlines()
+        self.assertTrue(lines[0].startswith('trip_id,log_date,'))
+        self.assertEqual(len(lines) - 1, ELDLog.objects.count())
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('export_logs', self.range['start'], self.range['end'], '--format', 'csv',
+                     '--chunk-size', '1', stdout=out, stderr=err)
+        self.assertEqual(out.getvalue().splitlines(), lines)
+        self.assertIn(f"Exported {len(lines) - 1} rows", err.getvalue())
+
+    def test_rejects_bad_parameters(self):
+        url = reverse('trip-export')
+        self.assertEqual(self.client.get(url, {**self.range, 'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': self.range['end'], 'end': self.range['start']}).status_code, 400)
+        for position in (['x', 'y', 1], [str(self.trips[0].pk), 'y', 1], [str(self.trips[0].pk), self.range['start'], 'z']):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            self.assertEqual(self.client.get(url, {**self.range, 'cursor': cursor}).status_code, 400)
+            with self.assertRaises(CommandError):
+                call_command('export_logs', self.range['start'], self.range['end'], '--cursor', cursor)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_corpora_are_deterministic_and_in_bounds(self):
+        geocoder = benchmarks.LocalGeocoder()
+        for name, (_, (total_min, total_max)) in benchmarks.CORPORA.items():
+            trips = benchmarks.make_corpus(name, 5)
+            self.assertEqual(trips, benchmarks.make_corpus(name, 5))
+            for trip in trips:
+                current, pickup, dropoff = (geocoder(trip[field]) for field in
+                                            ('current_location', 'pickup_location', 'dropoff_location'))
+                total = haversine_miles(current, pickup) + haversine_miles(pickup, dropoff)
+                self.assertTrue(total_min <= total <= total_max)
+        self.assertEqual(geocoder('Nowhere at all'), geocoder('Nowhere at all'))
+
+    def test_runs_every_benchmark(self):
+        results = benchmarks.run_benchmarks(corpora=['local'], size=2, rounds=1)
+        self.assertEqual(set(results), {f"{name}/local" for name in benchmarks.BENCHMARKS})
+        self.assertTrue(all(result['ops_per_sec'] > 0 for result in results.values()))
+        self.assertFalse(Trip.objects.exists())
+
+    def test_measures_sequencing(self):
+        out = io.StringIO()
+        call_command('benchmark', '--sequencing', '8', stdout=out)
+        self.assertIn('8 stops:', out.getvalue())
+        self.assertGreater(benchmarks.measure_sequencing(stops=8, trips=1)['ms_per_plan'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'plan/local': {'ops_per_sec': 100, 'peak_kib': 10}, 'eld/local': {'ops_per_sec': 100, 'peak_kib': 10}}
+        results = {'plan/local': {'ops_per_sec': 70, 'peak_kib': 10}, 'eld/local': {'ops_per_sec': 90, 'peak_kib': 14},
+                   'api/local': {'ops_per_sec': 1, 'peak_kib': 1}}
+        self.assertEqual(list(benchmarks.compare(results, baseline, tolerance=0.25)), ['plan/local', 'eld/local'])
+
+
+class MetricsTestCase(TestCase):
+    data = {
+        'current_location': 'Dallas, TX',
+        'pickup_location': 'Fort Worth, TX',
+        'dropoff_location': 'Austin, TX',
+        'current_cycle_hours': 0,
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+        metrics.registry.reset()
+        get_plan_cache().clear()
+
+    def test_server_timing_header_lists_phases(self):
+        with mock.patch.object(GeocodingClient, 'forward_many', side_effect=benchmarks.LocalGeocoder().many):
+            response = self.client.post(reverse('trip-list'), self.data, format='json')
+        phases = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ['geocode', 'legs', 'hos', 'eld', 'db_write', 'serialize', 'render', 'total']:
+            self.assertIn(name, phases)
+
+    def test_metrics_endpoint_serves_histograms_and_call_counts(self):
+        with mock.patch('geopy.geocoders.Nominatim.geocode', return_value=None):
+            RouteCalculator(None).geocode_many(['Nowhere, ZZ'])
+        with benchmarks.local_geocoding():
+            self.client.post(reverse('trip-list'), self.data, format='json')
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE trip_planner_phase_seconds histogram', body)
+        self.assertIn('trip_planner_phase_seconds_count{phase="hos"} 1', body)
+        self.assertIn('trip_planner_phase_seconds_bucket{phase="request.create",le="+Inf"} 1', body)
+        self.assertIn('trip_planner_external_calls_total{call="nominatim_forward"} 1', body)
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_disabled_metrics_record_nothing(self):
+        self.assertIs(metrics.phase('hos'), metrics.phase('eld'))
+        with benchmarks.local_geocoding():
+            response = self.client.post(reverse('trip-list'), self.data, format='json')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.phases, {})
+
+
+class FakeProvider:
+    name = 'fake'
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lookups = []
+        self.active = self.peak = 0         # lookups in flight now, and at most
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+
+    def forward(self, address):
+        self.wait()
+        self.lookups.append(address)
+        if address == 'broken':
+            raise RuntimeError('provider down')
+        return TripPersistenceTestCase.COORDS.get(address)
+
+    def reverse(self, coords):
+        self.wait()
+        return 'Somewhere, TX'
+
+
+class GeocodingClientTestCase(TestCase):
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        started = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_lookups_run_concurrently_in_order(self):
+        provider = FakeProvider(delay=0.1)
+        client = GeocodingClient(provider, rate=None, workers=3)
+        results = client.forward_many(['Dallas, TX', 'broken', 'Austin, TX'])
+        self.assertEqual(provider.peak, 3)
+        self.assertEqual(results, [TripPersistenceTestCase.COORDS['Dallas, TX'], None,
+                                   TripPersistenceTestCase.COORDS['Austin, TX']])
+
+    def test_trip_geocodes_in_one_batch_through_the_cache(self):
+        provider = FakeProvider()
+        client = GeocodingClient(provider, rate=None, workers=3)
+        cache = GeocodeCache(max_entries=100, forward_ttl=3600, reverse_ttl=3600, reverse_precision=2)
+        trip = Trip(current_location='Dallas, TX', pickup_location='Fort Worth, TX',
+                    dropoff_location='Dallas, TX', current_cycle_hours=0)
+        with mock.patch('trip_planner.services.get_geocoding_client', return_value=client), \
+                mock.patch('trip_planner.services.get_geocode_cache', return_value=cache):
+            with self.assertNumQueries(2):       # one cache read and one upsert for both new addresses
+                points = RouteCalculator(trip).plan_route()
+            self.assertEqual(sorted(provider.lookups), ['Dallas, TX', 'Fort Worth, TX'])
+            with self.assertNumQueries(0):
+                RouteCalculator(trip).plan_route()
+        self.assertEqual(len(provider.lookups), 2)
+        self.assertEqual((points[0].latitude, points[0].longitude), TripPersistenceTestCase.COORDS['Dallas, TX'])
+
+    def test_nominatim_async_lookups_use_aiohttp(self):
+        class Response:
+            status = 200
+
+            def __init__(self, url):
+                self.url = url
+
+            async def json(self):
+                if '/reverse' in self.url:
+                    return {'lat': '35.2', 'lon': '-101.8', 'display_name': 'Amarillo',
+                            'address': {'city': 'Amarillo', 'state': 'Texas'}}
+                return [{'lat': '32.7767', 'lon': '-96.797', 'display_name': 'Dallas'}]
+
+        requested = []
+
+        @contextlib.asynccontextmanager
+        async def get(session, url, **kwargs):
+            requested.append(str(url))
+            yield Response(str(url))
+
+        provider = NominatimProvider(geoclient_options())
+        client = GeocodingClient(provider, rate=None, workers=2)
+        with mock.patch('aiohttp.ClientSession.get', get), \
+                mock.patch.object(provider, 'forward') as forward, mock.patch.object(provider, 'reverse') as reverse:
+            coords = async_to_sync(client.aforward_many)(['Dallas, TX', 'Dallas, Texas'])
+            labels = async_to_sync(client.areverse_many)([(35.2, -101.8)])
+        forward.assert_not_called()
+        reverse.assert_not_called()
+        self.assertEqual(coords, [(32.7767, -96.797)] * 2)
+        self.assertEqual(labels, ['Amarillo, Texas'])
+        self.assertEqual(len(requested), 3)
+
+
+class PlanCacheTestCase(TestCase):
+    data = {
+        'current_location': 'Dallas, TX',
+        'pickup_location': 'Fort Worth, TX',
+        'dropoff_location': 'Austin, TX',
+        'current_cycle_hours': 20,
+    }
+
+    def setUp(self):
+        get_plan_cache().clear()
+        get_plan_cache().reset_stats()
+        patcher = mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many)
+        self.geocode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_key_covers_every_planning_input(self):
+        locations = ['Dallas, TX', 'Fort Worth, TX', 'Austin, TX']
+        key = plan_key(locations, 20, RuleSet())
+        self.assertEqual(key, plan_key(['dallas,  tx', 'FORT WORTH, TX', 'Austin,TX'], 20.0, RuleSet()))
+        self.assertNotEqual(key, plan_key(locations, 21, RuleSet()))
+        self.assertNotEqual(key, plan_key(locations, 20, RuleSet(fuel_distance=700)))
+        self.assertNotEqual(key, plan_key(locations, 20, RuleSet(), routing='graph.npz'))
+        with mock.patch('trip_planner.plancache.ENGINE_VERSION', 2):
+            self.assertNotEqual(key, plan_key(locations, 20, RuleSet()))
+
+    def test_hit_rebases_the_cached_timeline(self):
+        first_start = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        second_start = first_start + datetime.timedelta(days=3, hours=5)
+        first = RouteCalculator(Trip(**self.data)).plan_route(first_start)
+        renamed = {**self.data, 'current_location': 'dallas, tx'}
+        second = RouteCalculator(Trip(**renamed)).plan_route(second_start)
+
+        self.assertEqual(self.geocode.call_count, 1)
+        self.assertEqual(get_plan_cache().stats()['hits'], 1)
+        self.assertEqual([p.location for p in second[1:]], [p.location for p in first[1:]])
+        self.assertEqual(second[0].location, 'dallas, tx')
+        for a, b in zip(first, second):
+            self.assertEqual(b.arrival_time - a.arrival_time, second_start - first_start)
+            self.assertEqual(b.departure_time - b.arrival_time, a.departure_time - a.arrival_time)
+
+    def test_eviction_is_bounded_and_reported(self):
+        cache = PlanCache(max_entries=2)
+        start = timezone.now()
+        stops = plan_trip([(32.7767, -96.797), (32.7555, -97.3308)], start).stops
+        for key in 'abc':
+            cache.set(key, stops, start)
+        self.assertIsNone(cache.get('a', start))
+        self.assertEqual(len(cache.get('c', start)), len(stops))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 2, 'hit_rate': 0.5})
+
+        RouteCalculator(Trip(**self.data)).plan_route()
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('trip_planner_plan_cache_lookups_total{result="miss"} 1', body)
+
+
+class ReplanTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        get_plan_cache().clear()
+        self.start = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        self.trip = Trip(current_location='Houston, TX', pickup_location='Amarillo, TX',
+                         dropoff_location='Dallas, TX', current_cycle_hours=10)
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            save_plan(self.trip, RouteCalculator(self.trip).plan_route(self.start))
+        self.url = reverse('trip-replan', kwargs={'pk': self.trip.pk})
+
+    def replan(self, hours, position, cycle_hours=15):
+        moment = self.start + datetime.timedelta(hours=hours)
+        return self.client.post(self.url, {
+            'latitude': position[0], 'longitude': position[1],
+            'timestamp': moment.isoformat(), 'current_cycle_hours': cycle_hours,
+        }, format='json')
+
+    def test_keeps_completed_stops_and_final_log_days(self):
+        points = list(self.trip.route_points.order_by('arrival_time'))
+        first_day_log = self.trip.eld_logs.order_by('log_date').first()
+
+        # After the overnight rest past Amarillo, reported behind schedule on the second morning
+        hours = 26
+        moment = self.start + datetime.timedelta(hours=hours)
+        response = self.replan(hours, (35.0, -101.4))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        kept = [p for p in points if p.departure_time <= moment]
+        self.assertEqual([p.point_type for p in kept], ['START', 'REST', 'PICKUP', 'REST'])
+        new_points = list(self.trip.route_points.order_by('arrival_time'))
+        self.assertEqual([p.pk for p in new_points[:len(kept)]], [p.pk for p in kept])
+        self.assertEqual(new_points[-1].point_type, 'DROPOFF')
+        self.assertEqual([p.point_type for p in new_points].count('PICKUP'), 1)
+        self.assertGreater(new_points[len(kept)].arrival_time, moment)
+        self.assertGreater(new_points[-1].arrival_time, points[-1].arrival_time)
+        self.assertEqual(self.trip.eld_logs.order_by('log_date').first().pk, first_day_log.pk)
+        self.assertEqual([d['log_date'] for d in response.data['eld_logs']],
+                         sorted(d['log_date'] for d in response.data['eld_logs']))
+
+    def test_replayed_clock_forces_rest(self):
+        # Eleven hours of driving since the start leave no driving time in the shift
+        state = driver_state_at(
+            [PlannedStop('START', 0, 0, self.start, self.start, 0)], self.start + datetime.timedelta(hours=11)
+        )
+        self.assertAlmostEqual(state.shift_drive, 11)
+        plan = plan_trip([(32.7767, -96.797), (35.222, -101.8313)], self.start, cycle_hours=21, state=state)
+        self.assertEqual((plan.stops[1].point_type, plan.stops[1].duration), ('REST', 600))
+
+    def test_rejects_positions_before_start_or_after_dropoff(self):
+        self.assertEqual(self.replan(-1, (29.7, -95.3)).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.replan(24 * 30, (35.2, -101.8)).status_code, status.HTTP_400_BAD_REQUEST)
+        Trip.objects.filter(pk=self.trip.pk).update(status='PENDING')
+        self.assertEqual(self.replan(1, (29.9, -95.5)).status_code, status.HTTP_409_CONFLICT)
+
+
+class MultiStopTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        get_plan_cache().clear()
+
+    def post(self, stops, optimize=False):
+        data = {
+            'current_location': 'Houston, TX',
+            'pickup_location': 'Dallas, TX',
+            'dropoff_location': 'Austin, TX',
+            'current_cycle_hours': 0,
+            'stops': [{'location': location} for location in stops],
+            'optimize_stops': optimize,
+        }
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            return self.client.post(reverse('trip-list'), data, format='json')
+
+    def waypoints(self, response):
+        return [(p['point_type'], p['location']) for p in response.data['route_points']
+                if p['point_type'] not in ('REST', 'FUEL')]
+
+    def test_stops_are_visited_in_the_given_order(self):
+        response = self.post(['Amarillo, TX', 'Fort Worth, TX'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.waypoints(response), [
+            ('START', 'Houston, TX'), ('PICKUP', 'Dallas, TX'), ('STOP', 'Amarillo, TX'),
+            ('STOP', 'Fort Worth, TX'), ('DROPOFF', 'Austin, TX'),
+        ])
+        self.assertEqual([(s['sequence'], s['location']) for s in response.data['stops']],
+                         [(0, 'Amarillo, TX'), (1, 'Fort Worth, TX')])
+
+    def test_optimized_order_is_saved(self):
+        response = self.post(['Amarillo, TX', 'Fort Worth, TX'], optimize=True)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([name for kind, name in self.waypoints(response) if kind == 'STOP'],
+                         ['Fort Worth, TX', 'Amarillo, TX'])
+        trip = Trip.objects.get(pk=response.data['id'])
+        self.assertEqual(list(TripStop.objects.filter(trip=trip).values_list('location', flat=True)),
+                         ['Fort Worth, TX', 'Amarillo, TX'])
+
+    def test_early_arrival_waits_for_the_window(self):
+        start = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        opens = start + datetime.timedelta(hours=6)
+        plan = plan_trip([(32.7767, -96.797), (32.7555, -97.3308), (30.2672, -97.7431)], start,
+                         stop_types=['STOP', 'DROPOFF'], windows=[(opens, None), None])
+        self.assertEqual([stop.point_type for stop in plan.stops], ['START', 'REST', 'STOP', 'DROPOFF'])
+        self.assertTrue(opens <= plan.stops[2].arrival_time < opens + datetime.timedelta(minutes=1))
+
+    def test_stops_cannot_be_changed_by_update(self):
+        response = self.post(['Fort Worth, TX'])
+        url = reverse('trip-detail', kwargs={'pk': response.data['id']})
+        response = self.client.patch(url, {'stops': [{'location': 'Amarillo, TX'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('stops', response.data)
+
+    def test_replan_keeps_stop_windows(self):
+        start = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        opens = start + datetime.timedelta(hours=12)
+        trip, stops = new_trip({
+            'current_location': 'Houston, TX', 'pickup_location': 'Dallas, TX', 'dropoff_location': 'Austin, TX',
+            'current_cycle_hours': 0, 'stops': [{'location': 'Fort Worth, TX', 'window_start': opens}],
+        })
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            calculator = RouteCalculator(trip, stops=stops)
+            save_plan(trip, calculator.plan_route(start), stops=calculator.trip_stops())
+        points = replan_trip(trip, (32.77, -97.1), start + datetime.timedelta(hours=6), 5)
+        stop, = [point for point in points if point.point_type == 'STOP']
+        self.assertGreaterEqual(stop.arrival_time, opens - datetime.timedelta(minutes=1))
+
+    def test_forty_stops_sequence_and_plan(self):
+        # Timing lives in `manage.py benchmark --sequencing`
+        rng = random.Random(19)
+        start = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        waypoints = [(rng.uniform(30, 36), rng.uniform(-103, -95)) for _ in range(43)]
+        windows = [None] * 43
+        windows[20] = (None, start + datetime.timedelta(hours=8))   # must come early
+
+        order = sequence_stops(waypoints, windows, start)
+        plan_trip([waypoints[i] for i in order], start)
+
+        self.assertEqual(order[:2], [0, 1])
+        self.assertEqual(order[-1], 42)
+        self.assertEqual(sorted(order), list(range(43)))
+        self.assertLess(order.index(20), 10)
+        miles = distance_matrix(waypoints)
+        length = lambda o: sum(miles[a][b] for a, b in zip(o, o[1:]))
+        self.assertLess(length(sequence_stops(waypoints)), length(list(range(43))))
+
+
+class DriverLedgerTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.driver = Driver.objects.create(name='Sam Rivera')
+        self.today = timezone.now().date()
+
+    def post_trip(self):
+        data = {
+            'driver': str(self.driver.pk),
+            'current_location': 'Houston, TX',
+            'pickup_location': 'Dallas, TX',
+            'dropoff_location': 'Amarillo, TX',
+        }
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            return self.client.post(reverse('trip-list'), data, format='json')
+
+    def day(self, offset, minutes, first=0, last=None):
+        return DriverDay.objects.create(
+            driver=self.driver, log_date=self.today + datetime.timedelta(days=offset),
+            on_duty_minutes=minutes, first_duty_minute=first, last_duty_minute=last or first + minutes,
+        )
+
+    def test_trip_logs_update_the_ledger(self):
+        first = self.post_trip()
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(first.data['current_cycle_hours'], 0)
+        days = DriverDay.objects.filter(driver=self.driver)
+        logged = sum(log.timeline.totals()[DRIVING] + log.timeline.totals()[ON_DUTY] for log in ELDLog.objects.all())
+        self.assertEqual(sum(day.on_duty_minutes for day in days), logged)
+
+        second = self.post_trip()
+        self.assertGreater(second.data['current_cycle_hours'], 0)
+        Trip.objects.filter(pk=second.data['id']).delete()
+        Trip.objects.filter(pk=first.data['id']).delete()
+        self.assertFalse(DriverDay.objects.filter(driver=self.driver).exists())
+
+    def test_bulk_rows_for_a_driver_see_earlier_rows(self):
+        row = {'driver': str(self.driver.pk), 'current_location': 'Houston, TX',
+               'pickup_location': 'Dallas, TX', 'dropoff_location': 'Amarillo, TX'}
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            results = list(plan_rows([row, row]))
+        first, second = (Trip.objects.get(pk=result['id']) for result in results)
+        self.assertEqual(first.current_cycle_hours, 0)
+        self.assertGreater(second.current_cycle_hours, 0)
+
+    def test_changing_driver_moves_ledger_days(self):
+        response = self.post_trip()
+        minutes = sum(DriverDay.objects.filter(driver=self.driver).values_list('on_duty_minutes', flat=True))
+        other = Driver.objects.create(name='Alex Kim')
+        url = reverse('trip-detail', kwargs={'pk': response.data['id']})
+        self.assertEqual(self.client.patch(url, {'driver': str(other.pk)}, format='json').status_code, 200)
+        self.assertFalse(DriverDay.objects.filter(driver=self.driver).exists())
+        self.assertEqual(sum(DriverDay.objects.filter(driver=other).values_list('on_duty_minutes', flat=True)), minutes)
+
+    def test_history_starts_after_a_restart(self):
+        self.day(-6, 600, first=360)
+        self.day(-5, 600, first=360)                  # duty ends at 16:00
+        self.day(-3, 300, first=600)                  # 42 hours off before 10:00
+        self.day(-2, 600, first=360)
+        self.day(-1, 600, first=360)
+        self.day(0, 120, first=480)
+        self.assertEqual(duty_history(self.driver.pk, self.today), [0, 0, 0, 0, 5, 10, 10, 2])
+
+        response = self.client.get(reverse('driver-cycle', kwargs={'pk': self.driver.pk}))
+        self.assertEqual((response.data['used_hours'], response.data['available_hours']), (27, 43))
+
+    def test_rolling_cycle_recovers_before_a_restart(self):
+        start = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        route = [(32.7767, -96.797), (35.222, -101.8313)]
+        history = [12, 10, 10, 10, 10, 10, 8, 0]      # 70 hours, 12 of them leaving the window at midnight
+        rolling = plan_trip(route, start, history=history)
+        self.assertEqual((rolling.stops[1].point_type, rolling.stops[1].duration), ('REST', 16 * 60))
+        fixed = plan_trip(route, start, cycle_hours=70)
+        self.assertEqual((fixed.stops[1].point_type, fixed.stops[1].duration), ('REST', 34 * 60))
+
+
+class AsyncEndpointsTestCase(TestCase):
+    DATA = {
+        'current_location': 'Dallas, TX',
+        'pickup_location': 'Fort Worth, TX',
+        'dropoff_location': 'Austin, TX',
+        'current_cycle_hours': 5,
+    }
+
+    def setUp(self):
+        get_plan_cache().clear()
+
+    async def test_create_matches_the_sync_endpoint(self):
+        client = AsyncClient()
+        with mock.patch.object(RouteCalculator, 'ageocode_many', side_effect=local_geocode_many):
+            response = await client.post(reverse('async-trip-list'), self.DATA, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = response.json()
+        self.assertEqual(created['status'], 'DONE')
+        self.assertTrue(created['route_points'])
+        self.assertTrue(created['eld_logs'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        invalid = await client.post(reverse('async-trip-list'), {'current_location': 'Dallas, TX'},
+                                    content_type='application/json')
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pickup_location', invalid.json())
+
+        for name in ['trip-detail', 'trip-route', 'trip-logs']:
+            sync = await client.get(reverse(name, kwargs={'pk': created['id']}))
+            response = await client.get(reverse(f'async-{name}', kwargs={'pk': created['id']}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), sync.json())
+            # Both paths share the response cache and its ETags
+            self.assertEqual(response['ETag'], sync['ETag'])
+            not_modified = await client.get(reverse(f'async-{name}', kwargs={'pk': created['id']}),
+                                            headers={'If-None-Match': sync['ETag']})
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        missing = await client.get(reverse('async-trip-detail', kwargs={'pk': '00000000-0000-0000-0000-000000000000'}))
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_response_cache_is_awaited(self):
+        client = AsyncClient()
+        with mock.patch.object(RouteCalculator, 'ageocode_many', side_effect=local_geocode_many):
+            created = (await client.post(reverse('async-trip-list'), self.DATA, content_type='application/json')).json()
+        url = reverse('async-trip-logs', kwargs={'pk': created['id']})
+        cache = caching.get_response_cache()
+        # A network cache backend must not be called from the event loop
+        with mock.patch.object(caching, 'get_cached_response', side_effect=AssertionError), \
+                mock.patch.object(caching, 'store_response', side_effect=AssertionError), \
+                mock.patch.object(cache, 'aget', wraps=cache.aget) as aget, \
+                mock.patch.object(cache, 'aset', wraps=cache.aset) as aset:
+            first = await client.get(url)
+            second = await client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(aget.await_count, 2)
+        self.assertEqual(aset.await_count, 1)
+
+    async def test_async_geocoding_shares_the_cache(self):
+        provider = FakeProvider(delay=0.1)
+        client = GeocodingClient(provider, rate=None, workers=3)
+        cache = GeocodeCache(max_entries=100, forward_ttl=3600, reverse_ttl=3600, reverse_precision=2)
+        addresses = ['Dallas, TX', 'broken', 'Austin, TX']
+
+        results = await cache.aforward_many(addresses, client.aforward_many)
+        self.assertEqual(provider.peak, 3)
+        self.assertEqual(results, [TripPersistenceTestCase.COORDS['Dallas, TX'], None,
+                                   TripPersistenceTestCase.COORDS['Austin, TX']])
+        self.assertEqual(await cache.aforward_many(addresses, client.aforward_many), results)
+        # Hits come from memory; only the failed lookup is retried
+        self.assertEqual(sorted(provider.lookups), ['Austin, TX', 'Dallas, TX', 'broken', 'broken'])
+
+    async def test_failed_lookups_fall_back_alike(self):
+        calculator = RouteCalculator(None)
+        with mock.patch.object(GeocodeCache, 'forward_many', side_effect=RuntimeError('down')), \
+                mock.patch.object(GeocodeCache, 'aforward_many', side_effect=RuntimeError('down')):
+            self.assertEqual(await sync_to_async(calculator.geocode_many)(['Nowhere, ZZ']), [(0, 0)])
+            self.assertEqual(await calculator.ageocode_many(['Nowhere, ZZ']), [(0, 0)])
+
+    def test_async_planning_overlaps_geocoding(self):
+        results = benchmarks.measure_concurrency(benchmarks.make_corpus('regional', 12), latency=0.05, threads=2)
+        self.assertGreater(results['async'], results['threads'] * 2)
+
+
+class ResponseFormatTestCase(TestCase):
+    def setUp(self):
+        get_plan_cache().clear()
+        self.client = APIClient()
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            self.trip = create_trip({
+                'current_location': 'Amarillo, TX',
+                'pickup_location': 'Dallas, TX',
+                'dropoff_location': 'Houston, TX',
+                'current_cycle_hours': 50,
+            })
+
+    def test_fast_serializers_render_like_model_serializers(self):
+        class PointModelSerializer(drf_serializers.ModelSerializer):
+            class Meta:
+                model = RoutePoint
+                fields = ['id', 'point_type', 'location', 'latitude', 'longitude',
+                          'arrival_time', 'departure_time', 'duration']
+
+        class LogModelSerializer(drf_serializers.ModelSerializer):
+            class Meta:
+                model = ELDLog
+                fields = ['id', 'log_date', 'off_duty_periods', 'sleeper_berth_periods',
+                          'driving_periods', 'on_duty_periods', 'starting_location', 'ending_location']
+
+        points = self.trip.route_points.order_by('arrival_time')
+        logs = self.trip.eld_logs.order_by('log_date')
+        self.assertEqual(ORJSONRenderer().render(RoutePointSerializer(points, many=True).data),
+                         JSONRenderer().render(PointModelSerializer(points, many=True).data))
+        self.assertEqual(ORJSONRenderer().render(ELDLogSerializer(logs, many=True).data),
+                         JSONRenderer().render(LogModelSerializer(logs, many=True).data))
+        extras = {'when': timezone.now(), 'day': datetime.date(2026, 1, 5), 'id': self.trip.pk, 1: 2.5}
+        self.assertEqual(ORJSONRenderer().render(extras), JSONRenderer().render(extras))
+
+    def test_encode_polyline(self):
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(encode_polyline([]), '')
+
+    def test_columnar_route_and_logs(self):
+        route_url = reverse('trip-route', kwargs={'pk': self.trip.pk})
+        points = self.client.get(route_url).json()
+        response = self.client.get(route_url, {'format': 'columnar'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        columns = response.json()
+        self.assertEqual(columns['types'], [point['point_type'] for point in points])
+        self.assertEqual(columns['lats'], [point['latitude'] for point in points])
+        self.assertEqual(columns['durations'], [point['duration'] for point in points])
+        self.assertEqual(columns['arrivals'][0], int(self.trip.route_points.order_by('arrival_time')[0]
+                                                     .arrival_time.timestamp()))
+        self.assertEqual(columns['polyline'], encode_polyline(zip(columns['lats'], columns['lngs'])))
+        self.assertNotEqual(response['ETag'], self.client.get(route_url)['ETag'])
+
+        logs_url = reverse('trip-logs', kwargs={'pk': self.trip.pk})
+        logs = self.client.get(logs_url).json()
+        columns = self.client.get(logs_url, {'format': 'columnar'}).json()
+        self.assertEqual(columns['dates'], [log['log_date'] for log in logs])
+        self.assertEqual(columns['driving_periods'], [log['driving_periods'] for log in logs])
+
+        # Only the route and logs actions offer the format
+        detail = self.client.get(reverse('trip-detail', kwargs={'pk': self.trip.pk}), {'format': 'columnar'})
+        self.assertEqual(detail.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_columnar_route(self):
+        client = AsyncClient()
+        kwargs = {'pk': self.trip.pk}
+        sync = await client.get(reverse('trip-route', kwargs=kwargs), {'format': 'columnar'})
+        response = await client.get(reverse('async-trip-route', kwargs=kwargs), {'format': 'columnar'})
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response['ETag'], sync['ETag'])
+
+
+class PreviewTestCase(TestCase):
+    def setUp(self):
+        get_plan_cache().clear()
+        self.client = APIClient()
+        self.provider = FakeProvider(delay=0.1)
+        cache = GeocodeCache(max_entries=100, forward_ttl=3600, reverse_ttl=3600, reverse_precision=2)
+        patches = [
+            mock.patch('trip_planner.services.get_geocoding_client',
+                       return_value=GeocodingClient(self.provider, rate=None, workers=12)),
+            mock.patch('trip_planner.services.get_geocode_cache', return_value=cache),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def assertNoWrites(self, queries):
+        writes = [query['sql'] for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+    def test_preview_writes_nothing(self):
+        data = {
+            'current_location': 'Dallas, TX',
+            'pickup_location': 'Fort Worth, TX',
+            'dropoff_location': 'Houston, TX',
+            'current_cycle_hours': 10,
+            'stops': [{'location': 'Austin, TX'}],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('trip-preview'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNoWrites(queries.captured_queries)
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+        preview = response.json()
+        self.assertEqual([point['point_type'] for point in preview['route_points']][:2], ['START', 'PICKUP'])
+        self.assertIn('STOP', [point['point_type'] for point in preview['route_points']])
+        self.assertEqual(preview['stops'][0]['location'], 'Austin, TX')
+        self.assertEqual(preview['summary']['days'], len(preview['eld_logs']))
+        self.assertGreater(preview['summary']['total_hours'], 0)
+
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            created = self.client.post(reverse('trip-list'), data, format='json').json()
+        self.assertEqual([point['location'] for point in preview['route_points']],
+                         [point['location'] for point in created['route_points']])
+
+    def test_candidates_are_planned_concurrently(self):
+        candidates = [
+            {'current_location': 'Dallas, TX', 'pickup_location': pickup, 'dropoff_location': dropoff,
+             'current_cycle_hours': 0}
+            for pickup, dropoff in [('Fort Worth, TX', 'Austin, TX'), ('Austin, TX', 'Houston, TX'),
+                                    ('Houston, TX', 'Amarillo, TX'), ('Amarillo, TX', 'Fort Worth, TX')]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('trip-preview'), {'candidates': candidates}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The candidates' geocoding lookups are in flight together, not one after another
+        self.assertGreater(self.provider.peak, 1)
+        self.assertNoWrites(queries.captured_queries)
+        self.assertEqual([preview['dropoff_location'] for preview in response.json()['candidates']],
+                         [candidate['dropoff_location'] for candidate in candidates])
+
+        invalid = self.client.post(reverse('trip-preview'), {'candidates': [{'current_location': 'Dallas, TX'}]},
+                                   format='json')
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        too_many = self.client.post(reverse('trip-preview'), {'candidates': candidates * 6}, format='json')
+        self.assertEqual(too_many.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FacilityIndexTestCase(SimpleTestCase):
+    START = datetime.datetime(2026, 1, 5, 6, 0, tzinfo=datetime.timezone.utc)
+    WAYPOINTS = [PlannerTestCase.LOS_ANGELES, PlannerTestCase.PHOENIX, PlannerTestCase.NEW_YORK]
+
+    def facility(self, name, kind, leg, miles, offset=0.01):
+        lat, lng = leg.position_at(miles)
+        return Facility(name, kind, 'XX', lat + offset, lng)
+
+    def along_route(self, every=23):
+        """Facilities just off every leg of WAYPOINTS, alternating truck stops and rest areas"""
+        facilities = []
+        for leg in build_legs(self.WAYPOINTS):
+            for i, miles in enumerate(range(every, int(leg.miles), every)):
+                kind = TRUCK_STOP if i % 2 else REST_AREA
+                facilities.append(self.facility(f'Stop {len(facilities)}', kind, leg, miles))
+        return facilities
+
+    def test_best_before_prefers_the_latest_suitable_facility(self):
+        leg = build_legs([PlannerTestCase.PHOENIX, PlannerTestCase.NEW_YORK])[0]
+        index = FacilityIndex([
+            self.facility('Truck stop', TRUCK_STOP, leg, 100),
+            self.facility('Rest area', REST_AREA, leg, 110),
+            self.facility('Off route', TRUCK_STOP, leg, 115, offset=0.2),
+            self.facility('Too early', TRUCK_STOP, leg, 30),
+        ], max_detour_miles=3, search_miles=60)
+
+        facility, miles = index.best_before(leg, 120)
+        self.assertEqual(facility.name, 'Rest area')
+        self.assertAlmostEqual(miles, 110, delta=0.5)
+        facility, miles = index.best_before(leg, 120, fuel=True)
+        self.assertEqual(facility.name, 'Truck stop')
+        self.assertAlmostEqual(miles, 100, delta=0.5)
+        self.assertEqual(index.best_before(leg, 120, earliest_miles=105, fuel=True), (None, None))
+        self.assertEqual(index.best_before(leg, 95, fuel=True), (None, None))      # 30 is over 60 miles back
+
+    def test_stops_snap_to_facilities_within_limits(self):
+        rules = RuleSet()
+        facilities = self.along_route()
+        index = FacilityIndex(facilities)
+        plain = plan_trip(self.WAYPOINTS, self.START, cycle_hours=40)
+        plan = plan_trip(self.WAYPOINTS, self.START, cycle_hours=40, facilities=index)
+
+        labels = {facility.label: facility for facility in facilities}
+        en_route = [stop for stop in plan.stops if stop.point_type in ('FUEL', 'REST')]
+        self.assertTrue(en_route)
+        for stop in en_route:
+            # A fuel stop stays where it falls due when no truck stop lies in the window before it
+            if stop.point_type == 'FUEL' and not stop.location:
+                continue
+            facility = labels[stop.location]
+            self.assertEqual((stop.latitude, stop.longitude), (facility.latitude, facility.longitude))
+            if stop.point_type == 'FUEL':
+                self.assertTrue(facility.fuel)
+        first_rest = lambda p: next(stop for stop in p.stops if stop.point_type == 'REST')
+        self.assertLess(first_rest(plan).miles, first_rest(plain).miles)
+        self.assertAlmostEqual(plan.total_miles, plain.total_miles)
+
+        since_break = shift_drive = since_fuel = 0.0
+        for previous, stop in zip(plan.stops, plan.stops[1:]):
+            hours = (stop.arrival_time - previous.departure_time).total_seconds() / 3600
+            since_break += hours
+            shift_drive += hours
+            since_fuel += stop.miles - previous.miles
+            self.assertLessEqual(since_break, rules.break_after + 1e-6)
+            self.assertLessEqual(shift_drive, rules.driving_limit + 1e-6)
+            self.assertLessEqual(since_fuel, rules.fuel_distance + rules.fuel_tolerance)
+            if stop.duration >= rules.break_duration:
+                since_break = 0.0
+            if stop.point_type == 'REST' and stop.duration >= rules.rest_period * 60:
+                shift_drive = 0.0
+            if stop.point_type == 'FUEL':
+                since_fuel = 0.0
+
+        # Names from the planner survive labelling; the rest are named after the nearest city
+        names = [stop.location for stop in en_route]
+        RouteCalculator(None).label_stops(plan.stops, ['Los Angeles, CA', 'Phoenix, AZ', 'New York, NY'])
+        for stop, name in zip(en_route, names):
+            self.assertEqual(stop.location, name or stop.location)
+            self.assertTrue(name or stop.location.startswith('Fuel stop near'))
+
+    def test_snapping_examines_only_nearby_facilities(self):
+        rng = random.Random(3)
+        facilities = [
+            Facility(f'Stop {i}', rng.choice([TRUCK_STOP, REST_AREA]), '', rng.uniform(25, 49), rng.uniform(-124, -67))
+            for i in range(20000)
+        ] + self.along_route()
+        index = FacilityIndex(facilities)
+        with mock.patch('trip_planner.facilities._project', wraps=facilities_module._project) as project:
+            plan = plan_trip(self.WAYPOINTS, self.START, cycle_hours=40, facilities=index)
+        self.assertTrue(any(stop.location for stop in plan.stops if stop.point_type == 'REST'))
+        # Every lookup of a cross-country plan together examines under 1% of the index, thanks to the grid
+        self.assertGreater(sum(stop.point_type in ('FUEL', 'REST') for stop in plan.stops), 5)
+        self.assertLess(project.call_count, len(facilities) // 100)
+
+    def test_loads_from_settings(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('name,kind,state,latitude,longitude\n'
+                    'Big Rig Plaza,truck_stop,TX,32.7,-97.3\n'
+                    'Scenic View,rest_area,TX,32.8,-97.4\n'
+                    'Burger Place,restaurant,TX,32.9,-97.5\n')
+        self.addCleanup(os.remove, f.name)
+        with override_settings(FACILITIES={'PATH': f.name, 'SEARCH_MILES': 40}):
+            index = FacilityIndex.from_settings()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search_miles, 40)
+        with override_settings(FACILITIES={'PATH': None}):
+            self.assertIsNone(FacilityIndex.from_settings())
+
+
+class FleetHoursTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.driver = Driver.objects.create(name='Sam Rivera')
+        self.url = reverse('trip-hours')
+        with mock.patch.object(RouteCalculator, 'geocode_many', side_effect=local_geocode_many):
+            for extra in [{'driver': str(self.driver.pk)}, {'current_cycle_hours': 20}]:
+                response = self.client.post(reverse('trip-list'), {
+                    **extra,
+                    'current_location': 'Houston, TX',
+                    'pickup_location': 'Dallas, TX',
+                    'dropoff_location': 'Amarillo, TX',
+                }, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.logs = list(ELDLog.objects.order_by('log_date'))
+
+    def test_totals_are_stored_with_each_log(self):
+        for log in self.logs:
+            totals = log.timeline.totals()
+            self.assertEqual(
+                (log.off_duty_minutes, log.sleeper_berth_minutes, log.driving_minutes, log.on_duty_minutes),
+                (totals[OFF_DUTY], totals[SLEEPER_BERTH], totals[DRIVING], totals[ON_DUTY]),
+            )
+
+    def test_hours_are_summed_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'group_by': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        fleet, = response.data['results']
+        self.assertEqual((fleet['logs'], fleet['trips']), (len(self.logs), 2))
+        driving = sum(log.driving_minutes for log in self.logs)
+        self.assertEqual(fleet['driving_hours'], round(driving / 60, 2))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'group_by': 'date,driver'})
+        rows = response.data['results']
+        self.assertEqual({row['driver'] for row in rows}, {self.driver.pk, None})
+        self.assertEqual(sum(row['logs'] for row in rows), len(self.logs))
+
+        response = self.client.get(self.url, {'group_by': 'trip', 'driver': str(self.driver.pk)})
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_date_range(self):
+        first = self.logs[0].log_date
+        response = self.client.get(self.url, {'start': first, 'end': first})
+        self.assertEqual([row['date'] for row in response.data['results']], [first])
+        self.assertEqual(response.data['results'][0]['logs'], 2)
+
+        response = self.client.get(self.url, {'start': first, 'end': first - datetime.timedelta(days=1)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'group_by': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
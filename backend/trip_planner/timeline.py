@@ -0,0 +1,143 @@
+"""Per-day duty-status timelines stored as one status byte per minute.
+
+A day is 1440 bytes, one per minute, each holding a duty-status code.
+Totals are byte counts and periods are run boundaries found with NumPy,
+so none of it needs "HH:MM" string parsing. Conversions to and from the
+four period lists used by ELDLog's JSON fields are provided.
+"""
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+
+UNKNOWN = 0
+OFF_DUTY = 1
+SLEEPER_BERTH = 2
+DRIVING = 3
+ON_DUTY = 4
+
+# ELDLog JSON field for each status, in the order legacy periods are applied
+PERIOD_FIELDS = {
+    OFF_DUTY: 'off_duty_periods',
+    SLEEPER_BERTH: 'sleeper_berth_periods',
+    ON_DUTY: 'on_duty_periods',
+    DRIVING: 'driving_periods',
+}
+END_OF_DAY = '23:59'
+
+
+class OverlapError(ValueError):
+    pass
+
+
+def parse_minute(value, end=False):
+    """'HH:MM' -> minute of day; '23:59' as an end means midnight"""
+    if end and value == END_OF_DAY:
+        return MINUTES_PER_DAY
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minute(minute):
+    if minute >= MINUTES_PER_DAY:
+        return END_OF_DAY
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class DutyTimeline:
+    __slots__ = ('minutes',)
+
+    def __init__(self, data=None):
+        self.minutes = bytearray(data) if data else bytearray(MINUTES_PER_DAY)
+        if len(self.minutes) != MINUTES_PER_DAY:
+            raise ValueError(f"A duty timeline has {MINUTES_PER_DAY} minutes, got {len(self.minutes)}")
+
+    @classmethod
+    def from_periods(cls, off_duty_periods=(), sleeper_berth_periods=(), driving_periods=(), on_duty_periods=()):
+        """Build from the legacy JSON period lists.
+
+        Legacy logs can contain overlapping periods; duty statuses are applied
+        after off-duty ones so driving and on-duty time win where they overlap.
+        """
+        timeline = cls()
+        periods = {
+            'off_duty_periods': off_duty_periods,
+            'sleeper_berth_periods': sleeper_berth_periods,
+            'on_duty_periods': on_duty_periods,
+            'driving_periods': driving_periods,
+        }
+        for status, name in PERIOD_FIELDS.items():
+            for start, end in periods[name] or ():
+                timeline.mark(parse_minute(start), parse_minute(end, end=True), status, overwrite=True)
+        return timeline
+
+    def mark(self, start, end, status, overwrite=False):
+        """Set minutes [start, end) to status, raising OverlapError if any already hold another status"""
+        start = max(0, start)
+        end = min(MINUTES_PER_DAY, end)
+        if end <= start:
+            return
+        if not overwrite:
+            current = self.minutes[start:end]
+            if current.count(UNKNOWN) + current.count(status) != end - start:
+                raise OverlapError(f"{format_minute(start)}-{format_minute(end)} overlaps another duty status")
+        self.minutes[start:end] = bytes((status,)) * (end - start)
+
+    def fill(self, status=OFF_DUTY):
+        """Set every unknown minute to status"""
+        self.minutes = self.minutes.replace(bytes((UNKNOWN,)), bytes((status,)))
+        return self
+
+    def to_bytes(self):
+        return bytes(self.minutes)
+
+    def runs(self):
+        """Return [(status, start_minute, end_minute), ...] for each run of equal statuses"""
+        array = np.frombuffer(self.minutes, dtype=np.uint8)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(array)) + 1))
+        ends = np.append(starts[1:], MINUTES_PER_DAY)
+        return list(zip(array[starts].tolist(), starts.tolist(), ends.tolist()))
+
+    def to_periods(self):
+        """Return the four ELDLog period lists of ["HH:MM", "HH:MM"] pairs"""
+        periods = {name: [] for name in PERIOD_FIELDS.values()}
+        for status, start, end in self.runs():
+            if status in PERIOD_FIELDS:
+                periods[PERIOD_FIELDS[status]].append([format_minute(start), format_minute(end)])
+        return periods
+
+    def totals(self):
+        """Minutes in each duty status"""
+        return {status: self.minutes.count(status) for status in (UNKNOWN, *PERIOD_FIELDS)}
+
+    def to_grid(self, slot_minutes=15):
+        """Dominant status per slot, e.g. the 96 quarter-hours of a paper log sheet"""
+        array = np.frombuffer(self.minutes, dtype=np.uint8).reshape(-1, slot_minutes)
+        counts = np.stack([(array == status).sum(axis=1) for status in range(ON_DUTY + 1)], axis=1)
+        return counts.argmax(axis=1).tolist()
+
+    def violations(self, driving_limit=11, break_after=8, rest_period=10, break_minutes=30):
+        """Return messages for HOS limits broken within this day.
+
+        Driving is counted between off-duty/sleeper runs of at least
+        rest_period hours, and continuously between non-driving runs of at
+        least break_minutes.
+        """
+        messages = []
+        shift_driving = since_break = 0
+        for status, start, end in self.runs():
+            length = end - start
+            if status == DRIVING:
+                shift_driving += length
+                since_break += length
+                if since_break > break_after * 60:
+                    messages.append(f"Driving for more than {break_after} hours without a break at {format_minute(end)}")
+                    since_break = 0
+                if shift_driving > driving_limit * 60:
+                    messages.append(f"More than {driving_limit} hours of driving in a shift at {format_minute(end)}")
+                    shift_driving = 0
+                continue
+            if length >= break_minutes:
+                since_break = 0
+            if status in (OFF_DUTY, SLEEPER_BERTH) and length >= rest_period * 60:
+                shift_driving = 0
+        return messages
@@ -1,40 +1,283 @@
+import json
+import time
+import uuid
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Trip, RoutePoint, ELDLog
-from .serializers import TripSerializer, RoutePointSerializer, ELDLogSerializer
-from .services import RouteCalculator, ELDGenerator
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from .models import Driver, Trip, RoutePoint, ELDLog, PlanStatus
+from .serializers import (
+    TripSerializer, TripSummarySerializer, TripStatusSerializer, RoutePointSerializer, ELDLogSerializer,
+    ExportSerializer, ReplanSerializer, DriverSerializer, CycleQuerySerializer, route_columns, log_columns,
+    CandidatesSerializer, TripPreviewSerializer, FleetHoursSerializer,
+)
+from .services import create_trip, replan_trip, preview_trip, preview_trips, ReplanError
+from .jobs import get_options, submit_trip
+from .bulk import read_rows, detect_format, plan_rows
+from .caching import trip_revision, response_key, get_cached_response, store_response
+from .pagination import TripCursorPagination
+from . import metrics
+from .export import InvalidCursor, decode_cursor, export_rows, render_export
+from .ledger import duty_history
+from .fleet import fleet_hours
+from .planner import DEFAULT_RULES
+from .renderers import ColumnarRenderer
+
+def with_details(queryset):
+    # Load the nested stops, route and logs in three queries instead of one per relation
+    return queryset.prefetch_related(
+        'stops',
+        Prefetch('route_points', queryset=RoutePoint.objects.order_by('arrival_time')),
+        Prefetch('eld_logs', queryset=ELDLog.objects.defer('duty_timeline').order_by('log_date')),
+    )
+
+# ?format=columnar on the route and logs actions returns parallel arrays
+COLUMNAR_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarRenderer]
+
 
 class TripViewSet(viewsets.ModelViewSet):
     queryset = Trip.objects.all()
     serializer_class = TripSerializer
+    pagination_class = TripCursorPagination
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return queryset.only(*TripSummarySerializer.Meta.fields)
+        if self.action == 'retrieve':
+            return with_details(queryset)
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TripSummarySerializer
+        return super().get_serializer_class()
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        trip = serializer.save()
         
-        # Calculate route
-        route_calculator = RouteCalculator(trip)
-        route_points = route_calculator.calculate_route()
+        if self.wants_async(request):
+            # Save the trip now and plan it on the worker pool
+            trip = serializer.save(status=PlanStatus.PENDING)
+            transaction.on_commit(lambda: submit_trip(trip.id))
+            headers = {'Location': reverse('trip-plan-status', kwargs={'pk': trip.pk}, request=request)}
+            return Response(TripStatusSerializer(trip).data, status=status.HTTP_202_ACCEPTED, headers=headers)
         
-        # Generate ELD logs
-        eld_generator = ELDGenerator(trip)
-        eld_logs = eld_generator.generate_logs()
+        # Calculate route, generate ELD logs and save everything in one transaction
+        trip = create_trip(serializer.validated_data)
         
         # Return complete trip data
-        return Response(self.get_serializer(trip).data, status=status.HTTP_201_CREATED)
+        with metrics.phase('serialize'):
+            data = self.get_serializer(trip).data
+        return Response(data, status=status.HTTP_201_CREATED)
     
-    @action(detail=True, methods=['get'])
+    def retrieve(self, request, *args, **kwargs):
+        cached = self.cached_response(request, kwargs['pk'])
+        if cached:
+            return cached
+        trip = self.get_object()
+        self.cache_if_planned(trip)
+        with metrics.phase('serialize'):
+            data = self.get_serializer(trip).data
+        return Response(data)
+    
+    def cached_response(self, request, pk):
+        """Serve this action from the per-trip response cache with one lookup of the trip's revision, if possible"""
+        self.response_cache_key = None
+        try:
+            trip_id = uuid.UUID(str(pk))
+        except ValueError:
+            return None
+        revision = trip_revision(trip_id)
+        if revision is None:
+            return None
+        self.response_cache_key = response_key(trip_id, revision, self.action, request)
+        return get_cached_response(request, self.response_cache_key)
+    
+    def cache_if_planned(self, trip):
+        # Planned trips only change by replanning, editing or deleting, which moves them to a new revision
+        self.response_cacheable = trip.status == PlanStatus.DONE and self.response_cache_key is not None
+    
+    def initial(self, request, *args, **kwargs):
+        self.started = time.perf_counter()
+        self.timings_token = metrics.start_request()
+        super().initial(request, *args, **kwargs)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        token = getattr(self, 'timings_token', None)
+        if token is None:
+            return self.cache_response(request, response)
+        
+        # Render here so JSON encoding is part of the measured time
+        if isinstance(response, Response):
+            with metrics.phase('render'):
+                response.render()
+        timings = metrics.finish_request(token)
+        response = self.cache_response(request, response)
+        total = time.perf_counter() - self.started
+        metrics.registry.observe(f'request.{self.action}', total)
+        if metrics.get_options()['SERVER_TIMING']:
+            response['Server-Timing'] = ', '.join(filter(None, [
+                timings.server_timing(), f'total;dur={total * 1000:.1f}'
+            ]))
+        return response
+    
+    def cache_response(self, request, response):
+        if (getattr(self, 'response_cacheable', False) and response.status_code == status.HTTP_200_OK
+                and isinstance(response, Response)):
+            return store_response(request, self.response_cache_key, response)
+        return response
+    
+    def wants_async(self, request):
+        value = request.query_params.get('async')
+        if value is None:
+            return get_options()['ASYNC']
+        return value.lower() in ('1', 'true', 'yes')
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Plan trips from a CSV or JSON-lines request body, streaming one NDJSON result per row"""
+        lines = (line.decode('utf-8') for line in request._request)
+        rows = read_rows(lines, detect_format(request.content_type))
+        results = plan_rows(rows, workers=get_options()['BULK_WORKERS'])
+        return StreamingHttpResponse(
+            (json.dumps(result) + '\n' for result in results),
+            content_type='application/x-ndjson',
+        )
+    
+    @action(detail=False, methods=['post'])
+    def preview(self, request):
+        """Plan a trip, or each trip in {"candidates": [...]}, and return the plans without saving anything"""
+        if 'candidates' in request.data:
+            serializer = CandidatesSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            previews = preview_trips(serializer.validated_data['candidates'])
+            with metrics.phase('serialize'):
+                data = {'candidates': TripPreviewSerializer(previews, many=True).data}
+            return Response(data)
+        
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        preview = preview_trip(serializer.validated_data)
+        with metrics.phase('serialize'):
+            data = TripPreviewSerializer(preview).data
+        return Response(data)
+    
+    @action(detail=True, methods=['post'])
+    def replan(self, request, pk=None):
+        """Replan the rest of the trip from the driver's reported position, time and cycle hours"""
+        trip = self.get_object()
+        if trip.status != PlanStatus.DONE:
+            return Response({'detail': "Only planned trips can be replanned."}, status=status.HTTP_409_CONFLICT)
+        serializer = ReplanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        try:
+            replan_trip(
+                trip,
+                (params['latitude'], params['longitude']),
+                params.get('timestamp') or timezone.now(),
+                params['current_cycle_hours'],
+            )
+        except ReplanError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        trip = with_details(Trip.objects.filter(pk=trip.pk)).get()
+        with metrics.phase('serialize'):
+            data = TripSerializer(trip).data
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every ELD log (or route point, with kind=points) in a date range as NDJSON or CSV"""
+        serializer = ExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        cursor = params.get('cursor')
+        if cursor:
+            try:
+                decode_cursor(cursor, params['kind'])
+            except InvalidCursor as e:
+                return Response({'cursor': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rows = export_rows(params['kind'], params['start'], params['end'], cursor)
+        content_type = 'text/csv' if params['output'] == 'csv' else 'application/x-ndjson'
+        return StreamingHttpResponse(render_export(rows, params['kind'], params['output']), content_type=content_type)
+    
+    @action(detail=False, methods=['get'])
+    def hours(self, request):
+        """Fleet duty hours from ?start= to ?end=, grouped by ?group_by= date, driver and/or trip"""
+        serializer = FleetHoursSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        results = fleet_hours(params['start'], params['end'], params['group_by'], params.get('driver'))
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'group_by': params['group_by'],
+            'results': results,
+        })
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def plan_status(self, request, pk=None):
+        trip = self.get_object()
+        return Response(TripStatusSerializer(trip).data)
+    
+    @action(detail=True, methods=['get'], renderer_classes=COLUMNAR_RENDERERS)
     def route(self, request, pk=None):
+        cached = self.cached_response(request, pk)
+        if cached:
+            return cached
         trip = self.get_object()
+        self.cache_if_planned(trip)
         route_points = RoutePoint.objects.filter(trip=trip).order_by('arrival_time')
-        serializer = RoutePointSerializer(route_points, many=True)
-        return Response(serializer.data)
+        with metrics.phase('serialize'):
+            if request.accepted_renderer.format == ColumnarRenderer.format:
+                data = route_columns(route_points)
+            else:
+                data = RoutePointSerializer(route_points, many=True).data
+        return Response(data)
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], renderer_classes=COLUMNAR_RENDERERS)
     def logs(self, request, pk=None):
+        cached = self.cached_response(request, pk)
+        if cached:
+            return cached
         trip = self.get_object()
-        eld_logs = ELDLog.objects.filter(trip=trip).order_by('log_date')
-        serializer = ELDLogSerializer(eld_logs, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        self.cache_if_planned(trip)
+        eld_logs = ELDLog.objects.filter(trip=trip).defer('duty_timeline').order_by('log_date')
+        with metrics.phase('serialize'):
+            if request.accepted_renderer.format == ColumnarRenderer.format:
+                data = log_columns(eld_logs)
+            else:
+                data = ELDLogSerializer(eld_logs, many=True).data
+        return Response(data)
+
+
+class DriverViewSet(viewsets.ModelViewSet):
+    queryset = Driver.objects.order_by('name')
+    serializer_class = DriverSerializer
+    
+    @action(detail=True, methods=['get'])
+    def cycle(self, request, pk=None):
+        """On-duty hours per day in the cycle window ending on ?date= (default today), and the hours left"""
+        driver = self.get_object()
+        serializer = CycleQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        day = serializer.validated_data.get('date') or timezone.now().date()
+        history = duty_history(driver.pk, day, DEFAULT_RULES)
+        used = sum(history)
+        return Response({
+            'date': day,
+            'days': [round(hours, 2) for hours in history],
+            'used_hours': round(used, 2),
+            'available_hours': round(max(0.0, DEFAULT_RULES.cycle_limit - used), 2),
+        })
@@ -32,6 +32,7 @@ const createCustomIcon = (color) => new L.Icon({
 const icons = {
   START: createCustomIcon('green'),
   PICKUP: createCustomIcon('blue'),
+  STOP: createCustomIcon('violet'),
   REST: createCustomIcon('orange'),
   FUEL: createCustomIcon('yellow'),
   DROPOFF: createCustomIcon('red')
@@ -57,6 +58,7 @@ const RouteMap = ({ route }) => {
     switch (type) {
       case 'START': return <LocationOnIcon color="success" />;
       case 'PICKUP': return <LocalShippingIcon color="primary" />;
+      case 'STOP': return <LocalShippingIcon color="secondary" />;
       case 'REST': return <HotelIcon color="warning" />;
       case 'FUEL': return <LocalGasStationIcon color="error" />;
       case 'DROPOFF': return <FlagIcon color="error" />;
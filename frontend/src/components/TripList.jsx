@@ -20,14 +20,17 @@ import { format } from 'date-fns';
 
 const TripList = () => {
   const [trips, setTrips] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
 
   useEffect(() => {
     const fetchTrips = async () => {
       try {
         const data = await tripService.getTrips();
-        setTrips(data);
+        setTrips(data.results);
+        setNextPage(data.next);
         setLoading(false);
       } catch (err) {
         setError('Error loading trips');
@@ -39,6 +42,19 @@ const TripList = () => {
     fetchTrips();
   }, []);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await tripService.getTrips(nextPage);
+      setTrips((current) => [...current, ...data.results]);
+      setNextPage(data.next);
+    } catch (err) {
+      setError('Error loading trips');
+      console.error('Error fetching trips:', err);
+    }
+    setLoadingMore(false);
+  };
+
   if (loading) {
     return (
       <Container maxWidth="md" sx={{ mt: 4, textAlign: 'center' }}>
@@ -105,6 +121,13 @@ const TripList = () => {
                 ))}
               </TableBody>
             </Table>
+            {nextPage && (
+              <Box sx={{ mt: 2, textAlign: 'center' }}>
+                <Button variant="outlined" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </Button>
+              </Box>
+            )}
           </TableContainer>
         )}
       </Paper>
@@ -185,6 +185,7 @@ const TripSummary = ({ trip, route, logs }) => {
                     <Typography variant="subtitle1" gutterBottom>
                       {point.point_type === 'START' && 'Starting Point'}
                       {point.point_type === 'PICKUP' && 'Pickup Location'}
+                      {point.point_type === 'STOP' && 'Intermediate Stop'}
                       {point.point_type === 'DROPOFF' && 'Dropoff Location'}
                       {point.point_type === 'REST' && 'Rest Stop'}
                       {point.point_type === 'FUEL' && 'Fuel Stop'}
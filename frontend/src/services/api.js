@@ -24,10 +24,10 @@ export const tripService = {
     }
   },
 
-  // Get all trips
-  getTrips: async () => {
+  // Get a page of trips ({ results, next, previous }); pass the previous page's `next` URL to continue
+  getTrips: async (pageUrl = '/trips/') => {
     try {
-      const response = await api.get('/trips/');
+      const response = await api.get(pageUrl);
       return response.data;
     } catch (error) {
       console.error('Error fetching trips:', error);